@@ -1,29 +1,184 @@
+import asyncio
+import inspect
 import os
-from openai import OpenAI
+import time
+from instrumentation import metrics
+from response_cache import cache_key
+from rate_limiter import (
+    AdaptiveConcurrency, RateLimiter, RetryPolicy,
+    estimate_prompt_tokens, is_rate_limited, is_retryable, retry_after_seconds,
+)
 
-class LLMClient: 
-    def __init__(self, model: str = "gpt-4o"):
-        """
-        initialises the LLM client using openai API.
-        Please set "OPENAI_API_KEY" in your env variable, DO NOT insert it here.
-        """
+# parameters sent with every chat completion; also part of the response cache key
+REQUEST_PARAMS = {"temperature": 0, "response_format": {"type": "json_object"}}
+
+class _ClientBase:
+    def __init__(self, model, cache, rate_limiter, retry_policy):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable not set properly")
-        
-        self.client = OpenAI(api_key=api_key)
+
+        self.api_key = api_key
         self.model = model
+        self.cache = cache
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    def _cache_lookup(self, prompt):
+        if self.cache is None:
+            return None, None
+        key = cache_key(self.model, prompt, **REQUEST_PARAMS)
+        cached = self.cache.get(key)
+        metrics.inc("cache_hits_total" if cached is not None else "cache_misses_total")
+        return key, cached
+
+    def _on_error(self, error, attempt) -> float:
+        """
+        Returns how long to back off before retrying `error`. A 429 also pauses the shared
+        rate limiter, so other in-flight callers slow down too.
+        """
+        retry_after = retry_after_seconds(error)
+        delay = self.retry_policy.delay(attempt, retry_after)
+        metrics.inc("llm_retries_total")
+        metrics.inc("retry_backoff_seconds", delay)
+        if is_rate_limited(error):
+            metrics.inc("rate_limited_total")
+            self.rate_limiter.pause(delay)
+        return delay
+
+    def _on_response(self, headers, response, estimated_tokens, latency, usage_out=None):
+        self.rate_limiter.update_from_headers(headers)
+        usage = getattr(response, "usage", None)
+        self.rate_limiter.record_usage(estimated_tokens, getattr(usage, "total_tokens", None))
+        metrics.inc("llm_calls_total")
+        metrics.observe("llm_latency_seconds", latency)
+        metrics.inc("prompt_tokens_total", getattr(usage, "prompt_tokens", None) or 0)
+        metrics.inc("completion_tokens_total", getattr(usage, "completion_tokens", None) or 0)
+        if usage_out is not None:
+            usage_out["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+            usage_out["completion_tokens"] = getattr(usage, "completion_tokens", None)
+
+class LLMClient(_ClientBase):
+    def __init__(self, model: str = "gpt-4o", base_url: str = None, timeout: float = None, cache=None,
+                 rate_limiter: RateLimiter = None, retry_policy: RetryPolicy = None):
+        """
+        initialises the LLM client using openai API.
+        Please set "OPENAI_API_KEY" in your env variable, DO NOT insert it here.
+        `base_url` can point the client at any OpenAI-compatible server (e.g. fake_openai_server.py).
+        `cache` is an optional response_cache.ResponseCache; identical prompts are then answered from disk.
+        `rate_limiter`/`retry_policy` (see rate_limiter.py) pace calls and retry transient failures;
+        rate limits are also learnt from the response headers.
+        """
+        super().__init__(model, cache, rate_limiter, retry_policy)
+        from openai import OpenAI  # deferred so importing this module stays cheap
+        # retries are handled here (with Retry-After and shared pacing), not inside the SDK
+        self.client = OpenAI(api_key=self.api_key, base_url=base_url, timeout=timeout, max_retries=0)
+
+    def call_LLM(self, prompt, usage: dict = None) -> dict:
+        """
+        `usage`, if given, is filled with the call's prompt/completion token counts, the number
+        of attempts and whether the answer came from the cache.
+        """
+        key, cached = self._cache_lookup(prompt)
+        if usage is not None:
+            usage.update(cached=cached is not None, attempts=0)
+        if cached is not None:
+            return cached
+
+        estimated = estimate_prompt_tokens(prompt)
+        for attempt in range(self.retry_policy.max_retries + 1):
+            self.rate_limiter.acquire(estimated)
+            if usage is not None:
+                usage["attempts"] = attempt + 1
+            start = time.perf_counter()
+            try:
+                raw = self.client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=prompt,
+                    **REQUEST_PARAMS
+                )
+                response = raw.parse()
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.retry_policy.max_retries:
+                    metrics.inc("llm_failures_total")
+                    print(f"LLM call failed: {e}")
+                    return None
+                delay = self._on_error(e, attempt)
+                print(f"LLM call failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self._on_response(raw.headers, response, estimated, time.perf_counter() - start, usage)
+            content = response.choices[0].message.content
+            if key is not None:
+                self.cache.set(key, content)
+            return content
+
+
+class AsyncLLMClient(_ClientBase):
+    def __init__(self, model: str = "gpt-4o", base_url: str = None, timeout: float = None, cache=None,
+                 rate_limiter: RateLimiter = None, retry_policy: RetryPolicy = None, max_concurrency: int = None):
+        """
+        asyncio variant of LLMClient, used by moderation_engine to keep many requests in flight.
+        Same env variable, cache, pacing and return contract as LLMClient.call_LLM.
+        `max_concurrency` enables an adaptive in-flight limit that backs off on 429s and follows
+        x-ratelimit-remaining-requests.
+        """
+        super().__init__(model, cache, rate_limiter, retry_policy)
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(api_key=self.api_key, base_url=base_url, timeout=timeout, max_retries=0)
+        self.concurrency = AdaptiveConcurrency(max_concurrency) if max_concurrency else None
+
+    async def _create(self, prompt):
+        raw = await self.client.chat.completions.with_raw_response.create(
+            model=self.model,
+            messages=prompt,
+            **REQUEST_PARAMS
+        )
+        response = raw.parse()
+        if inspect.isawaitable(response):  # async parse in newer SDKs
+            response = await response
+        return raw.headers, response
+
+    async def call_LLM(self, prompt, usage: dict = None) -> str:
+        key, cached = self._cache_lookup(prompt)
+        if usage is not None:
+            usage.update(cached=cached is not None, attempts=0)
+        if cached is not None:
+            return cached
+
+        estimated = estimate_prompt_tokens(prompt)
+        for attempt in range(self.retry_policy.max_retries + 1):
+            await self.rate_limiter.acquire_async(estimated)
+            if usage is not None:
+                usage["attempts"] = attempt + 1
+            try:
+                if self.concurrency is not None:
+                    async with self.concurrency:
+                        start = time.perf_counter()
+                        headers, response = await self._create(prompt)
+                else:
+                    start = time.perf_counter()
+                    headers, response = await self._create(prompt)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.retry_policy.max_retries:
+                    metrics.inc("llm_failures_total")
+                    print(f"LLM call failed: {e}")
+                    return None
+                if self.concurrency is not None and is_rate_limited(e):
+                    self.concurrency.on_rate_limited()
+                delay = self._on_error(e, attempt)
+                await asyncio.sleep(delay)
+                continue
+
+            self._on_response(headers, response, estimated, time.perf_counter() - start, usage)
+            if self.concurrency is not None:
+                self.concurrency.on_success()
+                self.concurrency.observe_headers(headers)
+            content = response.choices[0].message.content
+            if key is not None:
+                self.cache.set(key, content)
+            return content
 
-    def call_LLM(self, prompt) -> dict:
-        try:
-            print("Calling LLM...") 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                temperature=0,
-                response_format={"type": "json_object"},
-                messages=prompt
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"LLM call failed: {e}")
-            return None
\ No newline at end of file
+    async def close(self):
+        await self.client.close()
@@ -1,8 +1,24 @@
-from LLMClient import LLMClient
+from LLMClient import LLMClient, AsyncLLMClient
+import moderation_engine
+import storage
+import helper
+from response_cache import ResponseCache, DEFAULT_CACHE_PATH
+from prefilter import Prefilter
+from journal import RowJournal, row_key
+from result_writer import ResultWriter
+from manifest import ReviewManifest
+from near_duplicates import NearDuplicateIndex, member_result
+from local_classifier import LocalClassifier
+from rate_limiter import RateLimiter
+from instrumentation import metrics
+from prompt_budget import PromptBuilder
+import result_schema
+from result_schema import ModerationResult
+import os
+import argparse
 import pandas as pd
 from textwrap import dedent
-import json
-from copy import deepcopy
+from functools import lru_cache
 
 #load dataset
 def pick_training_rows(df: pd.DataFrame, start_index: int, n: int) -> pd.DataFrame:
@@ -10,8 +26,6 @@ def pick_training_rows(df: pd.DataFrame, start_index: int, n: int) -> pd.DataFra
         raise ValueError(f"Data has only {len(df)} rows; cannot start at {start_index}.")
     return df.iloc[start_index:start_index + n]
 
-results = []
-
 prompt = [
     {
         "role": "system",
@@ -95,9 +109,9 @@ prompt = [
 
             Location: -
             Name: "Plumbing Bros"
-            Category: [Plumbing Services, Home Services, Plumbing Products]
+            Category: Plumbing Services, Home Services, Plumbing Products
             Address: 123 Main St, Springfield, USA
-            Opening Hours: [['Thursday', '8AM-5PM'], ['Friday', '8AM-5PM'], ['Saturday', 'Closed'], ['Sunday', 'Closed'], ['Monday', '8AM-5PM'], ['Tuesday', '8AM-5PM'], ['Wednesday', '8AM-5PM']]
+            Opening Hours: Mon-Fri 8AM-5PM; Sat-Sun Closed
             Timestamp: 2021-06-10 09:50:58 EDT
 
             Please return the moderation result in the specified JSON format. Below is an example of the expected output:
@@ -117,24 +131,62 @@ prompt = [
     {"role": "assistant", "content": "Thank you for the example. I am ready to perform review evaluation. Please provide the reviews now."},
 ]
 
-def generate_review_prompt(review_text: str, location: dict) -> list[dict]:
-    prompt_copy = deepcopy(prompt)
+REVIEW_INSTRUCTIONS = dedent("""
+    Output the result in strict JSON format with the following keys:
+    {
+      "Advertisement": "Yes" | "No",
+      "Irrelevant Review": "Yes" | "No",
+      "False Review": "Yes" | "No",
+      "Vulgar Language": "Yes" | "No",
+      "Relevance Score": "High" | "Average" | "Low" | "-",
+      "Quality Score": "High" | "Average" | "Low" | "-",
+      "Extraction Justification": "<short explanation describing why the decisions above were made>"
+    }
+    Output only valid JSON. Do not explain anything.
+""").strip()
+
+def make_prompt_builder(max_tokens: int = None, model: str = "gpt-4o") -> PromptBuilder:
+    """
+    Builds prompts from the shared static prefix (`prompt`) with compact metadata; reviews are
+    truncated to fit `max_tokens` per request. Its `report` holds the run's token savings.
+    """
+    return PromptBuilder(prompt, REVIEW_INSTRUCTIONS, max_tokens=max_tokens, model=model)
 
-    # Add new user input for this review
-    prompt_copy.append({
-        "role": "user",
-        "content": dedent(f"""
-            Review:
-            "{review_text}"
-            Metadata:
-            Name: {location.get('name')}
-            Category: {location.get('category')}
-            Address: {location.get('address')}
-            Opening Hours: {location.get('open_hours')}
-            Timestamp: {location.get('time')}
-
-            Output the result in strict JSON format with the following keys:
+@lru_cache(maxsize=None)
+def _default_builder() -> PromptBuilder:
+    return make_prompt_builder()
+
+def generate_review_prompt(review_text: str, location: dict, builder: PromptBuilder = None) -> list[dict]:
+    """
+    Static prefix + one user message with the review and its metadata. The prefix messages
+    are shared between prompts and must not be modified.
+    """
+    return (builder or _default_builder()).build(review_text, location)
+
+RESULT_KEYS = result_schema.FIELDS
+
+def generate_batch_prompt(reviews: list, builder: PromptBuilder = None) -> list[dict]:
+    """
+    Packs several reviews into one request so the system prompt and one-shot example
+    are sent once per batch instead of once per review.
+
+    Args:
+        reviews (list): (review_id, review_text, location) tuples; ids must be unique strings.
+    """
+    builder = builder or _default_builder()
+    blocks = [
+        f"\n### Review ID: {review_id}\n" + builder.review_block(review_text, location, len(reviews)) + "\n"
+        for review_id, review_text, location in reviews
+    ]
+
+    return builder.wrap(
+        "Evaluate each of the following reviews independently.\n"
+        + "".join(blocks)
+        + dedent(f"""
+            Output the result in strict JSON format: an object with a single key "results" holding
+            one entry per review ID above ({len(reviews)} entries), each with the following keys:
             {{
+              "id": "<Review ID>",
               "Advertisement": "Yes" | "No",
               "Irrelevant Review": "Yes" | "No",
               "False Review": "Yes" | "No",
@@ -145,79 +197,366 @@ def generate_review_prompt(review_text: str, location: dict) -> list[dict]:
             }}
             Output only valid JSON. Do not explain anything.
         """)
-    })
+    )
+
+def parse_batch_response(response, review_ids: list) -> tuple:
+    """
+    Splits a batched response back into per-review results.
+
+    Returns:
+        tuple: ({review_id: parsed result} for every well-formed entry,
+                list of review ids that are missing or malformed and need resubmitting)
+    """
+    try:
+        payload = result_schema.loads_lenient(response) if response else {}
+    except ValueError:
+        payload = {}
+
+    entries = payload.get("results", []) if isinstance(payload, dict) else payload
+    if isinstance(entries, dict):  # {"<id>": {...}, ...} is accepted too
+        entries = [{"id": k, **v} for k, v in entries.items() if isinstance(v, dict)]
+
+    wanted = set(review_ids)
+    parsed = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        review_id = str(entry.get("id"))
+        if review_id not in wanted:
+            continue
+        # entries still invalid after local repair are re-submitted on their own
+        values, invalid, _ = result_schema.validate({k: v for k, v in entry.items() if k != "id"})
+        if not invalid:
+            parsed[review_id] = {**values, "Extraction Justification": values["Extraction Justification"] or ""}
 
-    return prompt_copy
+    missing = [r for r in review_ids if r not in parsed]
+    if response:
+        metrics.inc("parse_failures_total", len(missing))
+    return parsed, missing
+
+def parse_response(response) -> dict:
+    """
+    Result dict with every label checked against the schema (see result_schema.parse_result);
+    labels that could not be repaired are listed under "invalid_fields".
+    """
+    return result_schema.parse_result(response)
+
+async def reask_invalid(df: pd.DataFrame, invalid: dict, client, builder: PromptBuilder = None,
+                        concurrency: int = 32, on_result=None, progress: bool = True) -> dict:
+    """
+    Asks once more, for each row of `invalid` (index -> parse_response result), only for the
+    fields that were missing or invalid, and merges the answer into the result.
+
+    Returns:
+        dict: index -> merged result (still carrying "error" if the fields stayed invalid)
+    """
+    indices = sorted(invalid)
+    prompts = [
+        result_schema.reask_prompt(generate_review_prompt(df.at[i, "text"], row_to_location(df.loc[i]), builder),
+                                   invalid[i])
+        for i in indices
+    ]
+    metrics.inc("reask_total", len(prompts))
+    merged = {}
+
+    def collect(j, response):
+        merged[indices[j]] = result_schema.merge_reask(invalid[indices[j]], response)
+        if on_result is not None:
+            on_result(indices[j], merged[indices[j]])
+
+    await moderation_engine.moderate_prompts(prompts, client, concurrency=concurrency, timeout=None,
+                                             on_result=collect, progress=progress)
+    return merged
+
+def extract(raw_review: str, location: dict, client=None, prefilter=None) -> dict:
+    if prefilter is not None:
+        verdict = prefilter.classify(raw_review, location.get("name"))
+        if verdict is not None:
+            return verdict
 
-def extract(raw_review: str, location: dict, client=None) -> dict:
     if client is None:
-        client = LLMClient()
+        client = get_client()
 
     full_prompt = generate_review_prompt(raw_review, location)
-    response = client.call_LLM(full_prompt)
+    parsed = parse_response(client.call_LLM(full_prompt))
+    if "invalid_fields" in parsed:
+        # one targeted follow-up for the labels that could not be repaired locally
+        metrics.inc("reask_total")
+        parsed = result_schema.merge_reask(parsed, client.call_LLM(result_schema.reask_prompt(full_prompt, parsed)))
+    return parsed
 
-    if not response:
-        return {"error": "No response", "raw_response": None}
-    
-    try:
-        parsed = json.loads(response)
-    except Exception as e:
-        parsed = {"error": str(e), "raw_response": response}
+def row_to_location(row) -> dict:
+    return {
+        "name": row["name"],
+        "category": row["category"],
+        "address": row["address"],
+        "open_hours": row["hours"],
+        "time": helper.format_vermont_time(row["time"])
+    }
 
-    return parsed
+def build_results_frame(df: pd.DataFrame, results: list) -> pd.DataFrame:
+    """
+    Joins the results (one result_schema.ModerationResult or result dict per row of `df`,
+    in order) onto `df` with every result key prefixed by 'res: '; labels are categorical
+    columns like the ones result_writer.ResultWriter streams.
+    """
+    records = [r if isinstance(r, ModerationResult) else ModerationResult.from_dict(r) for r in results]
+    results_df = pd.DataFrame(
+        {f"res: {key}": pd.Categorical(values, categories=result_schema.ALLOWED[key])
+         if key in result_schema.ALLOWED else values
+         for key, values in result_schema.result_columns(records).items()},
+        index=df.index
+    )
 
+    # Join results with original df using index
+    return df.join(results_df, how="left")
 
-######################### GET LLM Labelled Results ##########################
 
-client = LLMClient()
+async def moderate_batched(df: pd.DataFrame, indices: list, client, batch_size: int = 10,
+                           concurrency: int = 32, timeout: float = 60.0, on_result=None,
+                           builder: PromptBuilder = None, progress: bool = True) -> dict:
+    """
+    Labels df.loc[indices] with `batch_size` reviews per request. Reviews whose entry is
+    missing or malformed in the batched answer are re-submitted individually.
 
-if __name__ == "__main__":
-    df = pd.read_excel("../cleaned_data/cleaned_reviews.xlsx") 
-    df = pick_training_rows(df, start_index=0, n=1000).reset_index(drop=True)
-    for i, row in df.iterrows():
-        review_text = row["text"]
-        location = {
-            "name": row["name"],
-            "category": row["category"],
-            "address": row["address"],
-            "open_hours": row["hours"],
-            "timestamp": row["time"]
-        }
-
-        full_prompt = generate_review_prompt(review_text, location)
-        response = client.call_LLM(full_prompt)
-
-        if not response:
-            parsed = {"error": "No response", "raw_response": None}
+    Returns:
+        dict: index -> parsed result
+    """
+    locations = {i: row_to_location(df.loc[i]) for i in indices}
+    batches = [indices[k:k + batch_size] for k in range(0, len(indices), batch_size)]
+    prompts = [
+        generate_batch_prompt([(str(i), df.at[i, "text"], locations[i]) for i in batch], builder)
+        for batch in batches
+    ]
+
+    results, retry = {}, []
+
+    def collect(b, response):
+        parsed, missing = parse_batch_response(response, [str(i) for i in batches[b]])
+        for i in batches[b]:
+            if str(i) in parsed:
+                results[i] = parsed[str(i)]
+                if on_result is not None:
+                    on_result(i, results[i])
+        retry.extend(int(i) for i in missing)
+
+    await moderation_engine.moderate_prompts(
+        prompts, client, concurrency=concurrency, timeout=timeout, on_result=collect, progress=progress
+    )
+
+    if retry:
+        if progress:
+            print(f"[batch] {len(retry)}/{len(indices)} reviews missing or malformed, re-submitting individually")
+        retry.sort()
+        single = [generate_review_prompt(df.at[i, "text"], locations[i], builder) for i in retry]
+
+        def collect_single(j, parsed):
+            results[retry[j]] = parsed
+            if on_result is not None:
+                on_result(retry[j], parsed)
+
+        await moderation_engine.moderate_prompts(
+            single, client, concurrency=concurrency, timeout=timeout,
+            parse=parse_response, on_result=collect_single, progress=progress
+        )
+    return results
+
+
+async def moderate_rows(df: pd.DataFrame, indices: list, client, builder: PromptBuilder = None,
+                        batch_size: int = 1, concurrency: int = 32, on_result=None, progress: bool = True) -> dict:
+    """
+    Labels df.loc[indices] with the LLM (`batch_size` reviews per request), then asks once more,
+    for the affected fields only, about answers whose labels stayed invalid after local repair.
+    Per-attempt timeouts and retries are left to the client. `on_result(index, result)` sees
+    every result as it arrives, including the merged re-ask answers.
+
+    Returns:
+        dict: index -> result (results still invalid after the re-ask carry "error")
+    """
+    results, invalid = {}, {}
+
+    def record(i, parsed):
+        results[i] = parsed
+        if "invalid_fields" in parsed:
+            invalid[i] = parsed
         else:
-            try:
-                parsed = json.loads(response)
-            except Exception as e:
-                parsed = {"error": str(e), "raw_response": response}
-
-        parsed["row_index"] = i
-        results.append(parsed)
-
-    # Save results
-    # Create results dataframe and align it with input
-    results_df = pd.DataFrame(results)
-
-    # Rename result keys with 'res: ' prefix
-    results_df = results_df.rename(columns={
-        "Advertisement": "res: Advertisement",
-        "Irrelevant Review": "res: Irrelevant Review",
-        "False Review": "res: False Review",
-        "Vulgar Language": "res: Vulgar Language",
-        "Relevance Score": "res: Relevance Score",
-        "Quality Score": "res: Quality Score",
-        "Extraction Justification": "res: Extraction Justification",
-        "error": "res: error"
-    })
+            invalid.pop(i, None)
+        if on_result is not None:
+            on_result(i, parsed)
 
-    # Join results with original df using index
-    final_df = df.copy()
-    results_df.set_index("row_index", inplace=True)
-    final_df = final_df.join(results_df, how="left")
+    if batch_size > 1:
+        await moderate_batched(df, indices, client, batch_size=batch_size, concurrency=concurrency, timeout=None,
+                               on_result=record, builder=builder, progress=progress)
+    else:
+        prompts = [generate_review_prompt(df.at[i, "text"], row_to_location(df.loc[i]), builder) for i in indices]
+        await moderation_engine.moderate_prompts(
+            prompts, client, concurrency=concurrency, timeout=None, parse=parse_response,
+            on_result=lambda j, parsed: record(indices[j], parsed), progress=progress
+        )
+    if invalid:
+        if progress:
+            print(f"[schema] {len(invalid)} answers with invalid labels; asking again for those fields only")
+        await reask_invalid(df, dict(invalid), client, builder, concurrency, on_result=record, progress=progress)
+        if progress:
+            print(f"[schema] {len(invalid)} answers still invalid (kept as errors, retried on --resume)")
+    return results
+
+
+######################### GET LLM Labelled Results ##########################
+
+_client = None
 
-    # Save
-    final_df.to_csv("moderated_reviews_with_results.csv", index=False)
+def get_client() -> LLMClient:
+    """
+    Shared synchronous client, built on first use so that importing this module
+    needs no API key and opens no connection.
+    """
+    global _client
+    if _client is None:
+        _client = LLMClient()
+    return _client
+
+def label_rows(df: pd.DataFrame, output: str, args, journal_path: str = None, resume: bool = False):
+    """
+    Labels every row of `df` (prefilter, then LLM) and streams the joined table to `output`.
+    `args` carries the client/pacing/prefilter/output options parsed in main().
+    """
+    with ResultWriter(df, output, chunk_rows=args.flush_rows) as writer:
+        _label_rows(df, writer, args, journal_path or os.path.splitext(output)[0] + ".journal.jsonl", resume)
+    print(f"[output] wrote {len(df)} rows to {output}")
+
+def _label_rows(df: pd.DataFrame, writer: ResultWriter, args, journal_path: str, resume: bool):
+    # every result is journaled as it arrives, keyed on gmap_id + review hash
+    keys = [row_key(g, t) for g, t in zip(df["gmap_id"], df["text"])]
+    journal = RowJournal(journal_path)
+    done = journal.completed() if resume else {}
+    pending = [i for i in df.index if keys[i] not in done]
+    if resume:
+        print(f"[journal] resuming: {len(df) - len(pending)} rows already labelled, {len(pending)} to go")
+        for i in df.index:
+            if keys[i] in done:
+                writer.record(i, done[keys[i]])
+        del done
+
+    # obvious violations are decided by rules; only the rest costs an API call
+    if args.no_prefilter:
+        decided, to_llm = {}, pending
+    else:
+        with metrics.stage("prefilter", rows=len(pending)):
+            decided, to_llm, report = Prefilter().split(df.loc[pending, "text"], df.loc[pending, "name"])
+        print(report)
+    # a local classifier trained on earlier LLM labels accepts the reviews it is confident about
+    if args.local_model:
+        with metrics.stage("local_model", rows=len(to_llm)):
+            local, to_llm, report = LocalClassifier.load(args.local_model).split(df.loc[to_llm], args.local_confidence)
+        print(report)
+        decided.update(local)
+    for i, verdict in decided.items():
+        journal.record(keys[i], verdict)
+        writer.record(i, verdict)
+
+    # near-identical reviews (e.g. one ad posted across many businesses) are labelled once
+    followers = {}
+    if args.near_duplicates:
+        with metrics.stage("near_duplicates", rows=len(to_llm)):
+            to_llm, followers, report = NearDuplicateIndex(args.near_duplicates).split(df.loc[to_llm, "text"])
+        print(report)
+
+    # an answer with invalid labels is asked about once more (moderate_rows); the next answer is final
+    reasked = set()
+
+    def record(i, parsed):
+        final = "invalid_fields" not in parsed or i in reasked
+        if not final:
+            reasked.add(i)
+        if i in followers:
+            # the cluster id (representative's row key) is kept on every member for audit; members
+            # only take over the flags that do not depend on their own business
+            parsed = {**parsed, "cluster_id": keys[i]}
+            member = member_result(parsed, keys[i])
+            for j in followers[i]:
+                journal.record(keys[j], member)
+                writer.record(j, member, final)
+        journal.record(keys[i], parsed)
+        writer.record(i, parsed, final)
+
+    cache = ResponseCache(args.cache_path, bypass=args.no_cache)
+    async_client = AsyncLLMClient(
+        model=args.model, base_url=args.base_url, timeout=args.timeout, cache=cache,
+        rate_limiter=RateLimiter(args.rpm, args.tpm), max_concurrency=args.concurrency,
+    )
+    builder = make_prompt_builder(args.max_prompt_tokens or None, args.model)
+
+    with metrics.stage("llm", rows=len(to_llm)):
+        moderation_engine.run_with_client(async_client, lambda: moderate_rows(
+            df, to_llm, async_client, builder, args.batch_size, args.concurrency, on_result=record))
+    print(builder.report)
+    metrics.inc("prompt_metadata_tokens_saved_total", builder.report.metadata_tokens_saved)
+    metrics.inc("prompt_truncated_tokens_total", builder.report.truncated_tokens)
+    print(f"[cache] {cache.stats()}")
+    journal.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Label cleaned reviews with the LLM moderator")
+    parser.add_argument("--input", default="../cleaned_data/cleaned_reviews.parquet", help="parquet, csv or xlsx")
+    parser.add_argument("--output", default="moderated_reviews_with_results.parquet", help="parquet, csv or xlsx")
+    parser.add_argument("--start-index", type=int, default=0)
+    parser.add_argument("-n", "--num-rows", type=int, default=1000)
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint, e.g. a local fake server")
+    parser.add_argument("--concurrency", type=int, default=32, help="maximum number of in-flight LLM requests")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-attempt request timeout in seconds")
+    parser.add_argument("--rpm", type=float, default=None, help="requests/min budget (also learnt from rate-limit headers)")
+    parser.add_argument("--tpm", type=float, default=None, help="tokens/min budget (also learnt from rate-limit headers)")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="on-disk LLM response cache")
+    parser.add_argument("--no-cache", action="store_true", help="always call the API (fresh responses are still cached)")
+    parser.add_argument("--no-prefilter", action="store_true", help="send every review to the LLM, skipping the rule pre-filter")
+    parser.add_argument("--journal", default=None,
+                        help="append-only row journal (default: <output>.journal.jsonl)")
+    parser.add_argument("--resume", action="store_true", help="skip rows already labelled in the journal")
+    parser.add_argument("--flush-rows", type=int, default=5000,
+                        help="labelled rows joined and written per output chunk (parquet/xlsx chunks go to "
+                             "<output stem>.parts/ until the run ends)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="reviews packed into one LLM request (1 = one review per request)")
+    parser.add_argument("--max-prompt-tokens", type=int, default=4000,
+                        help="per-request prompt token budget; longer reviews are truncated to fit (0 = no limit)")
+    parser.add_argument("--near-duplicates", type=float, default=None, metavar="THRESHOLD",
+                        help="label one review per near-duplicate cluster (MinHash Jaccard >= THRESHOLD, e.g. 0.8) "
+                             "and copy its label to the others")
+    parser.add_argument("--local-model", default=None,
+                        help="trained local_classifier.py model; its confident predictions skip the LLM")
+    parser.add_argument("--local-confidence", type=float, default=0.9,
+                        help="minimum calibrated confidence (on every label) to accept a local prediction")
+    parser.add_argument("--deltas", default=None, metavar="MANIFEST_DIR",
+                        help="label every incremental delta partition without a labelled output yet "
+                             "(see data_preprocessing.py --incremental); --input/--output/-n are ignored")
+    parser.add_argument("--metrics-out", nargs="*", default=[], metavar="PATH",
+                        help="write run metrics; .prom/.txt paths get Prometheus text format, others JSON")
+    args = parser.parse_args()
+
+    if args.deltas:
+        # one output (and journal) per partition, so each day's delta is labelled exactly once
+        for partition in ReviewManifest(args.deltas).partition_paths():
+            output = os.path.splitext(partition)[0] + ".moderated.parquet"
+            if os.path.exists(output):
+                continue
+            print(f"[deltas] labelling {partition}")
+            with metrics.stage("read") as stage:
+                df = storage.read_table(partition)
+                stage["rows"] = len(df)
+            label_rows(df, output, args, resume=True)
+    else:
+        with metrics.stage("read") as stage:
+            df = storage.read_table(args.input)
+            df = pick_training_rows(df, start_index=args.start_index, n=args.num_rows).reset_index(drop=True)
+            stage["rows"] = len(df)
+        label_rows(df, args.output, args, journal_path=args.journal, resume=args.resume)
+
+    print(metrics.summary())
+    for path in args.metrics_out:
+        metrics.write(path)
+        print(f"[metrics] wrote {path}")
+
+if __name__ == "__main__":
+    main()
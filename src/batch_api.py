@@ -0,0 +1,207 @@
+# offline bulk labelling through the OpenAI Batch API
+# trades latency (results within the 24h completion window) for higher aggregate throughput and lower cost
+# usage: python batch_api.py submit -n 100000          -> writes the batch files, uploads them, saves <output>.batch.json
+#        python batch_api.py status                    -> prints the status of every batch
+#        python batch_api.py collect                   -> waits for completion, downloads and joins results to rows
+#        python batch_api.py run -n 1000               -> all of the above in one go
+import argparse
+import json
+import os
+import time
+import pandas as pd
+import storage
+from LLMClient import LLMClient, REQUEST_PARAMS
+from LLM_structuring import (
+    build_results_frame, generate_review_prompt, make_prompt_builder, parse_response, pick_training_rows,
+    row_to_location,
+)
+from journal import row_key
+from prefilter import Prefilter
+
+ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Batch API limits per batch input file; bigger runs are split into several batches
+MAX_BATCH_REQUESTS = 50_000
+MAX_BATCH_BYTES = 200 * 1024 * 1024
+
+
+def build_batch_requests(df: pd.DataFrame, indices: list, model: str, builder=None) -> list:
+    """
+    One Batch API request line per review; custom_id is the journal row key (gmap_id + text hash),
+    so results can be matched back to rows regardless of order. `builder` (see
+    LLM_structuring.make_prompt_builder) sets the prompt token budget.
+    """
+    return [
+        {
+            "custom_id": row_key(df.at[i, "gmap_id"], df.at[i, "text"]),
+            "method": "POST",
+            "url": ENDPOINT,
+            "body": {
+                "model": model,
+                "messages": generate_review_prompt(df.at[i, "text"], row_to_location(df.loc[i]), builder),
+                **REQUEST_PARAMS,
+            },
+        }
+        for i in indices
+    ]
+
+
+def write_batch_files(requests: list, stem: str, max_requests: int = MAX_BATCH_REQUESTS,
+                      max_bytes: int = MAX_BATCH_BYTES) -> list:
+    """
+    Writes the requests to <stem>.batch_input.<n>.jsonl files, each within the Batch API's
+    request and size limits. Returns the file paths.
+    """
+    paths, f, count, size = [], None, 0, 0
+    for request in requests:
+        line = (json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8")
+        if f is None or count >= max_requests or size + len(line) > max_bytes:
+            if f is not None:
+                f.close()
+            paths.append(f"{stem}.batch_input.{len(paths)}.jsonl")
+            f, count, size = open(paths[-1], "wb"), 0, 0
+        f.write(line)
+        count += 1
+        size += len(line)
+    if f is not None:
+        f.close()
+    return paths
+
+
+def submit_batch(client, path: str, metadata: dict = None):
+    """Uploads the JSONL file and creates the batch job. Returns the Batch object."""
+    with open(path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    return client.batches.create(
+        input_file_id=uploaded.id, endpoint=ENDPOINT, completion_window="24h", metadata=metadata,
+    )
+
+
+def wait_for_batch(client, batch_id: str, poll_interval: float = 60.0):
+    """Polls until the batch reaches a terminal status and returns it."""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        done = f"{counts.completed}/{counts.total}" if counts else "?"
+        print(f"[batch] {batch_id}: {batch.status} ({done} requests done)")
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+
+def download_results(client, batch) -> dict:
+    """
+    Returns {custom_id: parsed result} from the batch output (and error) files, using the same
+    parsing as the interactive path.
+    """
+    results = {}
+    if batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") == 200:
+                content = response["body"]["choices"][0]["message"]["content"]
+                results[item["custom_id"]] = parse_response(content)
+            else:
+                results[item["custom_id"]] = {"error": f"HTTP {response.get('status_code')}", "raw_response": None}
+    if batch.error_file_id:
+        for line in client.files.content(batch.error_file_id).text.splitlines():
+            if line.strip():
+                item = json.loads(line)
+                results.setdefault(item["custom_id"], {"error": str(item.get("error")), "raw_response": None})
+    return results
+
+
+def reconcile(df: pd.DataFrame, decided: dict, batch_results: dict) -> pd.DataFrame:
+    """
+    Joins pre-filter verdicts and batch results back to the input rows, in the same layout
+    as LLM_structuring's output (moderated_reviews_with_results).
+    """
+    keys = [row_key(g, t) for g, t in zip(df["gmap_id"], df["text"])]
+    results = [
+        decided.get(i) or batch_results.get(keys[i]) or {"error": "Not labelled", "raw_response": None}
+        for i in df.index
+    ]
+    return build_results_frame(df, results)
+
+
+def _load_rows(input_path: str, start_index: int, num_rows: int) -> pd.DataFrame:
+    df = storage.read_table(input_path)
+    return pick_training_rows(df, start_index=start_index, n=num_rows).reset_index(drop=True)
+
+
+def _split(df: pd.DataFrame, use_prefilter: bool) -> tuple:
+    if not use_prefilter:
+        return {}, list(df.index)
+    decided, to_llm, report = Prefilter().split(df["text"], df["name"])
+    print(report)
+    return decided, to_llm
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Label reviews with the OpenAI Batch API")
+    parser.add_argument("command", choices=["submit", "status", "collect", "run"])
+    parser.add_argument("--input", default="../cleaned_data/cleaned_reviews.parquet", help="parquet, csv or xlsx")
+    parser.add_argument("--output", default="moderated_reviews_with_results.parquet", help="parquet, csv or xlsx")
+    parser.add_argument("--start-index", type=int, default=0)
+    parser.add_argument("-n", "--num-rows", type=int, default=1000)
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint, e.g. a local fake server")
+    parser.add_argument("--no-prefilter", action="store_true", help="send every review to the batch")
+    parser.add_argument("--max-prompt-tokens", type=int, default=4000,
+                        help="per-request prompt token budget; longer reviews are truncated to fit (0 = no limit)")
+    parser.add_argument("--poll-interval", type=float, default=60.0, help="seconds between status checks")
+    args = parser.parse_args()
+
+    client = LLMClient(model=args.model, base_url=args.base_url).client
+    stem = os.path.splitext(args.output)[0]
+    state_path = stem + ".batch.json"
+
+    if args.command in ("submit", "run"):
+        df = _load_rows(args.input, args.start_index, args.num_rows)
+        _, to_llm = _split(df, not args.no_prefilter)
+        batch_ids = []
+        builder = make_prompt_builder(args.max_prompt_tokens or None, args.model)
+        requests = build_batch_requests(df, to_llm, args.model, builder)
+        print(builder.report)
+        for batch_file in write_batch_files(requests, stem):
+            batch_ids.append(submit_batch(client, batch_file).id)
+            # saved after every batch, so an interrupted submit still knows what was created
+            with open(state_path, "w", encoding="utf-8") as f:
+                json.dump({"batch_ids": batch_ids, "input": args.input, "start_index": args.start_index,
+                           "num_rows": args.num_rows, "model": args.model,
+                           "prefilter": not args.no_prefilter}, f, indent=2)
+        print(f"[ok] submitted {len(to_llm)} requests as {len(batch_ids)} batches: {', '.join(batch_ids)} "
+              f"(state in {state_path})")
+        if args.command == "submit":
+            return
+
+    with open(state_path, encoding="utf-8") as f:
+        state = json.load(f)
+    batch_ids = state["batch_ids"]
+
+    if args.command == "status":
+        for batch_id in batch_ids:
+            batch = client.batches.retrieve(batch_id)
+            print(f"[batch] {batch.id}: {batch.status} {batch.request_counts}")
+        return
+
+    results = {}
+    for batch_id in batch_ids:
+        batch = wait_for_batch(client, batch_id, args.poll_interval)
+        if batch.status != "completed":
+            print(f"[warn] batch {batch_id} ended as {batch.status}; collecting whatever results exist")
+        results.update(download_results(client, batch))
+
+    # rebuild the exact row selection the batches were submitted for
+    df = _load_rows(state["input"], state["start_index"], state["num_rows"])
+    decided, _ = _split(df, state["prefilter"])
+    final_df = reconcile(df, decided, results)
+    storage.write_table(final_df, args.output)
+    print(f"[ok] wrote {len(final_df)} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
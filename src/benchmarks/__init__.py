@@ -0,0 +1,2 @@
+# Benchmarks for the review moderation pipeline.
+# Run from src/, e.g. `python -m benchmarks.bench_preprocessing --rows 1000000`
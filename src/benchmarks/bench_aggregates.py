@@ -0,0 +1,59 @@
+# per-category aggregation: explode + groupby (old data_exploratory) vs interned CSR aggregates
+# usage (from src/): python -m benchmarks.bench_aggregates -n 500000
+import argparse
+import ast
+import time
+import numpy as np
+from benchmarks.synthetic import generate_metadata, generate_reviews
+from category_aggregates import ReviewAggregates
+from data_preprocessing import match_metadata_reviews
+from result_schema import POLICY_FIELDS, SCORE_FIELDS
+
+
+def explode_groupby(df):
+    # the previous data_exploratory.reviews_per_category
+    df = df.copy()
+    df["category"] = df["category"].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
+    exploded = df.explode("category")
+    return exploded.groupby("category")["text"].nunique().sort_values(ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--num-reviews", type=int, default=500_000)
+    parser.add_argument("--businesses", type=int, default=2_000)
+    parser.add_argument("--batches", type=int, default=10, help="incremental updates for the aggregates")
+    parser.add_argument("--string-categories", action="store_true",
+                        help="categories as stringified lists, as read back from csv/xlsx")
+    args = parser.parse_args()
+
+    meta = generate_metadata(args.businesses)
+    df = match_metadata_reviews(meta, generate_reviews(args.num_reviews, meta)).reset_index(drop=True)
+    rng = np.random.default_rng(0)
+    for policy in POLICY_FIELDS:
+        df[f"res: {policy}"] = np.where(rng.random(len(df)) < 0.05, "Yes", "No")
+    for score in SCORE_FIELDS:
+        df[f"res: {score}"] = rng.choice(["High", "Average", "Low"], len(df))
+    if args.string_categories:
+        df["category"] = df["category"].map(lambda c: str([str(x) for x in c]))
+
+    start = time.perf_counter()
+    expected = explode_groupby(df)
+    old = time.perf_counter() - start
+    print(f"explode + groupby: {old:.2f}s (unique review counts only)")
+
+    start = time.perf_counter()
+    aggregates = ReviewAggregates()
+    for batch in np.array_split(np.arange(len(df)), args.batches):
+        aggregates.update(df.iloc[batch])
+    new = time.perf_counter() - start
+    print(f"aggregates: {new:.2f}s in {args.batches} batches (categories, businesses, months; "
+          f"counts, flag rates and score shares) - {len(df) / new:,.0f} reviews/s")
+
+    table = aggregates.table("category").set_index("category")["unique_review_count"]
+    assert (table.reindex(expected.index) == expected).all(), "unique counts differ from explode + groupby"
+    print("unique review counts match explode + groupby")
+
+
+if __name__ == "__main__":
+    main()
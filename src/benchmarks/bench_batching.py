@@ -0,0 +1,84 @@
+# multi-review batching vs one review per request: token volume, wall time and label agreement
+# usage (from src/): python -m benchmarks.bench_batching --input ../cleaned_data/cleaned_reviews.parquet -n 200
+#                    python -m benchmarks.bench_batching --fake   (synthetic data + local fake server)
+import argparse
+import os
+import time
+import LLM_structuring
+import moderation_engine
+import storage
+from LLMClient import AsyncLLMClient
+from benchmarks.synthetic import generate_metadata, generate_reviews
+from data_preprocessing import match_metadata_reviews
+from fake_openai_server import start_fake_server, estimate_tokens
+
+
+def prompt_tokens(messages: list) -> int:
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+
+def label(df, batch_size, args):
+    client = AsyncLLMClient(model=args.model, base_url=args.base_url)
+    indices = list(df.index)
+    start = time.perf_counter()
+    if batch_size == 1:
+        prompts = [LLM_structuring.generate_review_prompt(df.at[i, "text"], LLM_structuring.row_to_location(df.loc[i]))
+                   for i in indices]
+        parsed = moderation_engine.run_moderation(prompts, client, concurrency=args.concurrency,
+                                                  parse=LLM_structuring.parse_response)
+        results = dict(zip(indices, parsed))
+        tokens = sum(prompt_tokens(p) for p in prompts)
+    else:
+        results = moderation_engine.run_with_client(client, lambda: LLM_structuring.moderate_batched(
+            df, indices, client, batch_size=batch_size, concurrency=args.concurrency))
+        tokens = sum(
+            prompt_tokens(LLM_structuring.generate_batch_prompt(
+                [(str(i), df.at[i, "text"], LLM_structuring.row_to_location(df.loc[i])) for i in indices[k:k + batch_size]]
+            ))
+            for k in range(0, len(indices), batch_size)
+        )
+    return results, time.perf_counter() - start, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--input", default=None, help="cleaned reviews table; synthetic data if omitted")
+    parser.add_argument("-n", "--num-rows", type=int, default=200)
+    parser.add_argument("--batch-sizes", default="1,5,10,20")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--base-url", default=None)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--fake", action="store_true", help="start a local fake OpenAI server and use it")
+    args = parser.parse_args()
+
+    if args.fake:
+        server = start_fake_server(latency=0.2)
+        args.base_url = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+    if args.input:
+        df = storage.read_table(args.input)
+    else:
+        meta = generate_metadata(100)
+        df = match_metadata_reviews(meta, generate_reviews(args.num_rows * 2, meta))
+    df = df.iloc[:args.num_rows].reset_index(drop=True)
+
+    sizes = [int(x) for x in args.batch_sizes.split(",")]
+    if 1 not in sizes:
+        sizes.insert(0, 1)
+    runs = {size: label(df, size, args) for size in sizes}
+
+    reference = runs[1][0]
+    print(f"\n{'batch':>5} {'secs':>7} {'est. prompt tokens/review':>26} {'agreement':>10}  per-field agreement")
+    for size, (results, secs, tokens) in runs.items():
+        per_field = {}
+        for key in LLM_structuring.RESULT_KEYS[:-1]:
+            same = sum(results[i].get(key) == reference[i].get(key) for i in df.index)
+            per_field[key] = same / len(df)
+        overall = sum(per_field.values()) / len(per_field)
+        fields = ", ".join(f"{k}={v:.2f}" for k, v in per_field.items())
+        print(f"{size:>5} {secs:>7.2f} {tokens / len(df):>26.0f} {overall:>10.3f}  {fields}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# cold import cost of each pipeline module, measured in fresh interpreters
+# also reports heavy optional dependencies pulled in and any data files touched at import time
+# usage (from src/): python -m benchmarks.bench_imports --repeat 5
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+MODULES = [
+    "helper", "pii_detection", "prefilter", "storage", "journal", "response_cache", "rate_limiter",
+    "LLMClient", "moderation_engine", "LLM_structuring", "batch_api", "validation",
+    "data_preprocessing", "data_exploratory",
+]
+HEAVY = ["pandas", "openai", "sklearn", "emoji", "pyarrow"]
+
+# runs in the child: times the import, then lists loaded heavy packages and non-code files opened
+PROBE = """
+import json, os, sys, time
+opened = []
+code_roots = tuple(os.path.realpath(p) for p in {roots!r})
+def hook(event, args):
+    if event == "open" and isinstance(args[0], str):
+        path = os.path.realpath(args[0])
+        if not path.startswith(code_roots) and not path.endswith((".py", ".pyc", ".so", ".pth")):
+            opened.append(args[0])
+sys.addaudithook(hook)
+start = time.perf_counter()
+error = None
+try:
+    import {module}
+except Exception as e:
+    error = f"{{type(e).__name__}}: {{e}}"
+secs = time.perf_counter() - start
+print(json.dumps({{"secs": secs, "error": error, "opened": opened,
+                  "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def probe(module: str, src_dir: str) -> dict:
+    """
+    Imports `module` in a fresh interpreter, from an empty working directory and without an
+    API key, so hidden relative-path reads/writes and key checks surface as errors or opened files.
+    """
+    roots = [sys.prefix, sys.base_prefix, src_dir, "/dev", "/proc", "/etc", "/usr/share/zoneinfo"]
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env["PYTHONPATH"] = src_dir
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    with tempfile.TemporaryDirectory() as cwd:
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, roots=roots, heavy=HEAVY)],
+            cwd=cwd, env=env, capture_output=True, text=True,
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        result["written"] = os.listdir(cwd)
+        result["printed"] = len(out.stdout.strip().splitlines()) - 1
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per module (median is reported)")
+    parser.add_argument("--modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    print(f"{'module':<20}{'median ms':>10}  heavy deps loaded / side effects")
+    for module in args.modules:
+        runs = [probe(module, src_dir) for _ in range(args.repeat)]
+        last = runs[-1]
+        notes = ",".join(last["heavy"]) or "-"
+        if last["error"]:
+            notes += f"  ERROR {last['error']}"
+        if last["printed"]:
+            notes += f"  printed {last['printed']} lines"
+        if last["opened"]:
+            notes += f"  opened {last['opened'][:3]}"
+        if last["written"]:
+            notes += f"  wrote {last['written']}"
+        print(f"{module:<20}{statistics.median(r['secs'] for r in runs) * 1000:>10.0f}  {notes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# local classifier fast path: training time, reviews/sec and agreement with the LLM labels
+# usage (from src/): python -m benchmarks.bench_local_classifier --input moderated_reviews_with_results.parquet
+#                    python -m benchmarks.bench_local_classifier -n 50000   (synthetic reviews with rule-made labels)
+import argparse
+import time
+import pandas as pd
+import storage
+from benchmarks.synthetic import generate_metadata, generate_reviews
+from data_preprocessing import match_metadata_reviews
+from local_classifier import LocalClassifier, TARGETS, evaluate, training_frame
+from prefilter import Prefilter
+
+
+def synthetic_labelled(n: int) -> pd.DataFrame:
+    """
+    Synthetic reviews with stand-in LLM labels (rule verdicts for ads, length-based scores),
+    enough to time the classifier and check it learns a text -> label mapping.
+    """
+    meta = generate_metadata(500)
+    df = match_metadata_reviews(meta, generate_reviews(n, meta)).reset_index(drop=True)
+    decided, _, _ = Prefilter().split(df["text"], df["name"])
+    length = df["text"].str.len()
+    for target in TARGETS:
+        df[f"res: {target}"] = "No"
+    df["res: Relevance Score"] = ["High" if "food" in t or "coffee" in t or "rooms" in t else "Average"
+                                  for t in df["text"].str.lower()]
+    df["res: Quality Score"] = pd.cut(length, [0, 40, 80, 10**6], labels=["Low", "Average", "High"]).astype(str)
+    for i, verdict in decided.items():
+        for target in TARGETS:
+            if verdict[target] is not None:
+                df.at[i, f"res: {target}"] = verdict[target]
+    df["res: Extraction Justification"] = "synthetic"
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--input", nargs="*", default=None, help="LLM-labelled outputs; synthetic data if omitted")
+    parser.add_argument("-n", "--num-rows", type=int, default=20_000, help="synthetic reviews to generate")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    args = parser.parse_args()
+
+    raw = pd.concat([storage.read_table(p) for p in args.input], ignore_index=True) if args.input \
+        else synthetic_labelled(args.num_rows)
+    df = training_frame(raw)
+    test = df.sample(frac=args.holdout, random_state=0)
+    train = df.drop(test.index)
+
+    start = time.perf_counter()
+    model = LocalClassifier().fit(train)
+    fit_secs = time.perf_counter() - start
+    print(f"trained on {len(train)} rows in {fit_secs:.1f}s")
+
+    start = time.perf_counter()
+    model.predict(test)
+    secs = time.perf_counter() - start
+    print(f"prediction: {len(test)} reviews in {secs:.2f}s ({len(test) / secs:,.0f} reviews/s on one core)")
+
+    metrics = evaluate(model, test)
+    print("agreement with the LLM labels (all held-out rows):")
+    for target, acc in metrics["per_target"].items():
+        print(f"  {target:<20} {acc:.3f}")
+    print(f"{'gate':>8} {'accepted':>9} {'agreement':>10}")
+    for threshold, gate in metrics["gate"].items():
+        print(f"{threshold:>8} {gate['coverage']:>9.1%} {gate['agreement']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
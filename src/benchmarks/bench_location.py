@@ -0,0 +1,39 @@
+# location-consistency scoring throughput (gazetteer build + reviews/sec)
+# usage (from src/): python -m benchmarks.bench_location -n 200000
+import argparse
+import time
+import numpy as np
+from benchmarks.synthetic import generate_metadata, generate_reviews
+from data_preprocessing import match_metadata_reviews
+from location_consistency import Gazetteer, add_location_scores
+
+# appended to the synthetic reviews so that some mention far-away, local and chain places
+MENTIONS = ["", "", "", " better than in New York City", " like the Dunkin Donuts downtown", " near Burlington"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--num-reviews", type=int, default=200_000)
+    parser.add_argument("--businesses", type=int, default=2_000)
+    args = parser.parse_args()
+
+    meta = generate_metadata(args.businesses)
+    # a chain with enough locations to use the KD-tree path
+    meta.loc[meta.index[:100], "name"] = "Dunkin Donuts"
+    df = match_metadata_reviews(meta, generate_reviews(args.num_reviews, meta)).reset_index(drop=True)
+    rng = np.random.default_rng(0)
+    df["text"] = df["text"] + np.array(MENTIONS)[rng.integers(0, len(MENTIONS), len(df))]
+
+    start = time.perf_counter()
+    gazetteer = Gazetteer.from_metadata(meta)
+    print(f"gazetteer: {len(gazetteer.names)} places in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    _, report = add_location_scores(df, gazetteer)
+    secs = time.perf_counter() - start
+    print(f"scoring: {len(df)} reviews in {secs:.2f}s ({len(df) / secs:,.0f} reviews/s on one core)")
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
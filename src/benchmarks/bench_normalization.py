@@ -0,0 +1,51 @@
+# throughput of data_preprocessing.clean_text_column from 1 to N worker processes
+# usage (from src/): python -m benchmarks.bench_normalization --rows 500000 --max-workers 16
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import data_preprocessing
+from benchmarks.synthetic import generate_metadata, generate_reviews
+
+
+def worker_counts(max_workers: int) -> list:
+    counts, n = [], 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    return counts + [max_workers]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=2_000, help="texts per task sent to a worker")
+    args = parser.parse_args()
+
+    reviews = generate_reviews(args.rows, generate_metadata(1_000))
+    text = reviews["text"].astype(str)
+    print(f"{args.rows} texts, {(~text.str.isascii()).mean():.0%} non-ASCII, {os.cpu_count()} CPU cores")
+
+    baseline, base_secs = None, None
+    print(f"{'workers':>8}{'secs':>8}{'rows/s':>12}{'speedup':>9}{'efficiency':>11}  identical")
+    for workers in worker_counts(args.max_workers):
+        pool = ProcessPoolExecutor(workers) if workers > 1 else None
+        if pool is not None:
+            # start the workers (and their imports) before timing
+            list(pool.map(data_preprocessing._normalize_chunk, [[]] * workers))
+        start = time.perf_counter()
+        cleaned = data_preprocessing.clean_text_column(text, pool=pool, chunksize=args.chunksize)
+        secs = time.perf_counter() - start
+        if pool is not None:
+            pool.shutdown()
+
+        if baseline is None:
+            baseline, base_secs = cleaned, secs
+        speedup = base_secs / secs
+        print(f"{workers:>8}{secs:>8.2f}{args.rows / secs:>12,.0f}{speedup:>8.2f}x{speedup / workers:>10.0%}"
+              f"  {cleaned.equals(baseline)}")
+
+
+if __name__ == "__main__":
+    main()
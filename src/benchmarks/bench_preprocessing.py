@@ -0,0 +1,56 @@
+# rows/sec of data_preprocessing.match_metadata_reviews before (row-wise loop) and after (column-wise)
+# usage (from src/): python -m benchmarks.bench_preprocessing --rows 1000000 --reference-rows 100000
+import argparse
+import time
+import pandas as pd
+import data_preprocessing
+import helper
+from benchmarks.synthetic import generate_metadata, generate_reviews
+
+
+def reference_clean(cleaned_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The previous iterrows() implementation, with each step feeding the next.
+    """
+    cleaned_df = cleaned_df.astype({"time": object, "text": object})
+    for idx, row in cleaned_df.iterrows():
+        text = helper.normalize_whitespace(row["text"])
+        text = helper.standardize_quotes_dashes(text)
+        cleaned_df.at[idx, "text"] = helper.clean_emojis(text)
+        cleaned_df.at[idx, "time"] = helper.unix_to_vermont_time(int(row["time"]) // 1000)
+    return cleaned_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--businesses", type=int, default=10_000)
+    parser.add_argument("--reference-rows", type=int, default=100_000,
+                        help="rows timed with the old row-wise loop (it is too slow for the full set)")
+    args = parser.parse_args()
+
+    meta = generate_metadata(args.businesses)
+    reviews = generate_reviews(args.rows, meta)
+
+    start = time.perf_counter()
+    cleaned = data_preprocessing.match_metadata_reviews(meta, reviews)
+    new_secs = time.perf_counter() - start
+    print(f"column-wise: {args.rows} rows in {new_secs:.2f}s ({args.rows / new_secs:,.0f} rows/s)")
+
+    # time only the per-row cleaning step of the old implementation on a subset of the same input
+    n_ref = min(args.reference_rows, args.rows)
+    sub_reviews = reviews.iloc[:n_ref]
+    sub_new = data_preprocessing.match_metadata_reviews(meta, sub_reviews)
+    uncleaned = data_preprocessing.merge_and_filter(meta, sub_reviews)
+    start = time.perf_counter()
+    expected = reference_clean(uncleaned)
+    ref_secs = time.perf_counter() - start
+    print(f"row-wise (cleaning loop only): {n_ref} rows in {ref_secs:.2f}s ({n_ref / ref_secs:,.0f} rows/s)")
+
+    identical = expected["text"].tolist() == sub_new["text"].tolist() and \
+        expected["time"].tolist() == sub_new["time"].dt.strftime(helper.TIME_FORMAT).tolist()
+    print(f"outputs identical on {len(sub_new)} cleaned rows: {identical}")
+
+
+if __name__ == "__main__":
+    main()
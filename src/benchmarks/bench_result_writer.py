@@ -0,0 +1,82 @@
+# labelled output: results kept as dicts and joined at the end (previous label_rows) vs ResultWriter
+# results arrive roughly in row order (as with concurrent requests); each mode runs in its own process
+# so their peak RSS can be compared (the first figure is the peak while generating the input)
+# usage (from src/): python -m benchmarks.bench_result_writer -n 200000
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import storage
+from benchmarks.synthetic import generate_metadata, generate_reviews
+from LLM_structuring import build_results_frame
+from result_writer import ResultWriter
+
+
+def arrivals(n: int, seed: int = 0):
+    """Row order of results: in order up to a jitter of ~64 rows, like 32 requests in flight."""
+    rng = np.random.default_rng(seed)
+    order = np.argsort(np.arange(n) + rng.exponential(32, n), kind="stable")
+    labels = ["Yes", "No"]
+    for i in order:
+        yield int(i), {
+            "Advertisement": labels[rng.random() < 0.95], "Irrelevant Review": "No", "False Review": "No",
+            "Vulgar Language": "No", "Relevance Score": "High", "Quality Score": "Average",
+            "Extraction Justification": f"The review of row {i} describes the visit and matches the business. " * 2,
+        }
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(mode: str, n: int, output: str) -> dict:
+    meta = generate_metadata(max(10, n // 100))
+    df = generate_reviews(n, meta).reset_index(drop=True)
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    first_output = None
+    if mode == "old":
+        results = {}
+        for i, result in arrivals(n):
+            results[i] = result
+        storage.write_table(build_results_frame(df, [results[i] for i in range(n)]), output)
+        first_output = time.perf_counter() - start
+    else:
+        with ResultWriter(df, output) as writer:
+            for i, result in arrivals(n):
+                writer.record(i, result)
+                if first_output is None and writer.written:
+                    first_output = time.perf_counter() - start
+    return {"mode": mode, "seconds": round(time.perf_counter() - start, 2),
+            "first_output_seconds": round(first_output, 3), "input_peak_rss_mb": round(before, 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--num-rows", type=int, default=200_000)
+    parser.add_argument("--format", choices=["parquet", "csv"], default="parquet")
+    parser.add_argument("--mode", choices=["old", "new"], default=None, help="run one mode in this process")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, f"labelled.{args.format}")
+        if args.mode:
+            print(json.dumps(run(args.mode, args.num_rows, output)))
+            return
+        for mode in ("old", "new"):
+            proc = subprocess.run([sys.executable, "-m", "benchmarks.bench_result_writer", "-n", str(args.num_rows),
+                                   "--format", args.format, "--mode", mode], capture_output=True, text=True, check=True)
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            name = "dicts + join at the end" if mode == "old" else "ResultWriter"
+            print(f"{name:<24} {r['seconds']:>6.2f}s, first rows on disk after {r['first_output_seconds']:.3f}s, "
+                  f"peak RSS {r['input_peak_rss_mb']:.0f} -> {r['peak_rss_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# load generator for moderation_service.py against a stub LLM backend (fake_openai_server)
+# reviews arrive as a Poisson process at --rate reviews/s over --connections keep-alive connections
+# (open loop: latency is measured from each review's scheduled send time, so a slow service is not
+# hidden by the generator slowing down); --rate 0 sends back-to-back on every connection instead.
+# usage (from src/): python -m benchmarks.bench_service -n 3000 --rate 300 --latency 0.2
+#                    python -m benchmarks.bench_service --url http://127.0.0.1:8080 -n 1000   # a running service
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from urllib.parse import urlparse
+import numpy as np
+from benchmarks.synthetic import generate_metadata, generate_reviews
+
+
+def make_reviews(n: int, seed: int = 0) -> list:
+    """Posted-review payloads: review text plus its business metadata, time in Unix ms."""
+    meta = generate_metadata(max(10, n // 50), seed=seed).set_index("gmap_id")
+    reviews = generate_reviews(n, meta.reset_index(), seed=seed)
+    payloads = []
+    for text, gmap_id, t in zip(reviews["text"], reviews["gmap_id"], reviews["time"]):
+        business = meta.loc[gmap_id]
+        payloads.append({"text": text, "gmap_id": gmap_id, "name": business["name"],
+                         "category": [str(c) for c in business["category"]], "address": business["address"],
+                         "hours": business["hours"], "time": int(t)})
+    return payloads
+
+
+class Connection:
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, payload=None) -> tuple:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, await self.reader.readexactly(length)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def run_load(host: str, port: int, reviews: list, rate: float, connections: int) -> dict:
+    pool = asyncio.Queue()
+    for _ in range(connections):
+        pool.put_nowait(Connection(host, port))
+    latencies, statuses, errors = [], {}, 0
+    start = time.perf_counter()
+
+    async def send(review, scheduled):
+        nonlocal errors
+        await asyncio.sleep(max(0.0, scheduled - (time.perf_counter() - start)))
+        conn = await pool.get()
+        try:
+            status, _ = await conn.request("POST", "/moderate", review)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(time.perf_counter() - start - scheduled)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            errors += 1
+            conn.close()
+            conn = Connection(host, port)
+        finally:
+            pool.put_nowait(conn)
+
+    if rate > 0:
+        arrivals = np.cumsum(np.random.default_rng(1).exponential(1 / rate, len(reviews)))
+        await asyncio.gather(*(send(r, t) for r, t in zip(reviews, arrivals)))
+    else:
+        # closed loop: each connection sends its next review as soon as the previous one is answered
+        queue = list(reversed(reviews))
+
+        async def worker():
+            while queue:
+                await send(queue.pop(), time.perf_counter() - start)
+
+        await asyncio.gather(*(worker() for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+
+    stats_conn = Connection(host, port)
+    _, body = await stats_conn.request("GET", "/stats")
+    stats_conn.close()
+    while not pool.empty():
+        pool.get_nowait().close()
+
+    lat = np.array(latencies) * 1000
+    pct = lambda q: round(float(np.percentile(lat, q)), 1) if len(lat) else None
+    return {
+        "reviews": len(reviews), "seconds": round(elapsed, 2), "ok": statuses.get(200, 0),
+        "rejected": statuses.get(429, 0), "errors": errors + sum(v for k, v in statuses.items() if k not in (200, 429)),
+        "reviews_per_second": round(statuses.get(200, 0) / elapsed, 1),
+        "latency_ms": {"p50": pct(50), "p95": pct(95), "p99": pct(99)},
+        "service": json.loads(body),
+    }
+
+
+def main():
+    from moderation_service import add_service_arguments
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--num-reviews", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200.0, help="offered load in reviews/s (0 = closed loop)")
+    parser.add_argument("--connections", type=int, default=64, help="keep-alive connections used by the generator")
+    parser.add_argument("--url", default=None, help="load an already running service instead of an in-process one")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub LLM latency in seconds")
+    parser.add_argument("--backend-rpm", type=int, default=None, help="stub LLM requests/min before it answers 429")
+    parser.add_argument("--output", default=None, help="also write the results as JSON")
+    add_service_arguments(parser)
+    args = parser.parse_args()
+    reviews = make_reviews(args.num_reviews)
+
+    async def bench():
+        if args.url:
+            url = urlparse(args.url)
+            return await run_load(url.hostname, url.port, reviews, args.rate, args.connections)
+
+        from fake_openai_server import start_fake_server
+        from moderation_service import build_service
+
+        backend = start_fake_server(latency=args.latency, requests_per_minute=args.backend_rpm)
+        os.environ.setdefault("OPENAI_API_KEY", "fake")
+        args.base_url = backend.base_url
+        with tempfile.TemporaryDirectory() as tmp:
+            # a fresh cache per run, so repeated texts within the run are the only cache hits
+            args.cache_path = os.path.join(tmp, "cache.sqlite")
+            service = build_service(args)
+            server = await service.start("127.0.0.1", 0)
+            try:
+                result = await run_load("127.0.0.1", server.sockets[0].getsockname()[1], reviews,
+                                        args.rate, args.connections)
+            finally:
+                server.close()
+                await service.close()
+                backend.shutdown()
+        result["backend_requests"] = backend.request_count
+        return result
+
+    result = asyncio.run(bench())
+    s = result["service"]
+    print(f"[load] {result['ok']}/{result['reviews']} reviews labelled in {result['seconds']}s "
+          f"({result['reviews_per_second']} reviews/s), {result['rejected']} rejected (429), {result['errors']} errors")
+    print(f"[load] client latency p50/p95/p99 = {result['latency_ms']['p50']}/{result['latency_ms']['p95']}/"
+          f"{result['latency_ms']['p99']} ms; within {s['slo_ms']} ms SLO: "
+          f"{s['slo_met']:.1%}" if s["slo_met"] is not None else "[load] no review completed")
+    print(f"[load] service: mean batch {s['mean_batch_size'] or 0:.1f}, queue wait p99 {s['queue_wait_ms']['p99']} ms, "
+          f"sources {s['sources']}, {s['llm_calls']} LLM calls")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
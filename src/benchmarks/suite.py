@@ -0,0 +1,206 @@
+# reproducible benchmark suite: synthetic meta/review JSON files -> every pipeline stage -> JSON results
+# inputs come from fixed seeds and LLM calls go to the local fake server (configurable latency, error
+# rate and rate limit), so runs need no real data or API key and two commits can be compared on the
+# same machine
+# usage (from src/): python -m benchmarks.suite --scale small
+#                    python -m benchmarks.suite --scale medium --latency 0.2 --error-rate 0.02 --rpm 3000
+#                    python -m benchmarks.suite --compare outputs/benchmarks/<old>.json outputs/benchmarks/<new>.json
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import storage
+from benchmarks.synthetic import generate_labels, write_json_dataset
+from data_exploratory import checks_for_pii, reviews_per_category
+from data_preprocessing import match_metadata_reviews
+from fake_openai_server import start_fake_server
+
+SUITE_VERSION = 1
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCALES = {
+    "small": {"businesses": 500, "reviews": 20_000, "llm_reviews": 200, "validation_reviews": 50},
+    "medium": {"businesses": 5_000, "reviews": 200_000, "llm_reviews": 1_000, "validation_reviews": 200},
+    "large": {"businesses": 20_000, "reviews": 2_000_000, "llm_reviews": 5_000, "validation_reviews": 500},
+}
+
+
+def environment() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=SRC, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def timed(fn, repeat: int) -> tuple:
+    """Median wall time of `repeat` calls of fn() (stdout swallowed) and the last result."""
+    times, result = [], None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def entry(seconds: float, rows: int, **extra) -> dict:
+    return {"seconds": round(seconds, 4), "rows": rows, "rows_per_second": round(rows / seconds, 1), **extra}
+
+
+def run_script(script: str, args: list, env: dict, cwd: str) -> float:
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.join(SRC, script), *args], cwd=cwd, env=env,
+                          capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"{script} failed:\n{proc.stdout[-2000:]}\n{proc.stderr[-2000:]}")
+    return seconds
+
+
+def llm_summary(metrics_path: str) -> dict:
+    snap = json.load(open(metrics_path, encoding="utf-8"))
+    c, latency = snap["counters"], snap["histograms"].get("llm_latency_seconds", {})
+    return {
+        "llm_calls": int(c.get("llm_calls_total", 0)), "retries": int(c.get("llm_retries_total", 0)),
+        "failures": int(c.get("llm_failures_total", 0)),
+        "latency_p50": latency.get("p50"), "latency_p99": latency.get("p99"),
+    }
+
+
+def backend_counts(server) -> dict:
+    return {"backend_requests": server.request_count, "backend_errors": server.error_count,
+            "backend_rate_limited": server.rate_limited_count}
+
+
+def run_suite(scale: dict, args, tmp: str) -> dict:
+    results = {}
+    meta_path, review_path = write_json_dataset(os.path.join(tmp, "data"), scale["businesses"], scale["reviews"])
+
+    seconds, (meta, reviews) = timed(
+        lambda: (pd.read_json(meta_path, lines=True), pd.read_json(review_path, lines=True)), args.repeat)
+    results["read_json"] = entry(seconds, len(reviews))
+    seconds, cleaned = timed(lambda: match_metadata_reviews(meta, reviews), args.repeat)
+    results["match_metadata_reviews"] = entry(seconds, len(reviews), cleaned_rows=len(cleaned))
+    seconds, _ = timed(lambda: checks_for_pii(cleaned), args.repeat)
+    results["checks_for_pii"] = entry(seconds, len(cleaned))
+    seconds, counts = timed(lambda: reviews_per_category(cleaned), args.repeat)
+    results["reviews_per_category"] = entry(seconds, len(cleaned), categories=len(counts))
+    for name, r in results.items():
+        print(f"[suite] {name}: {r['rows_per_second']:,.0f} rows/s ({r['seconds']:.3f}s)")
+
+    cleaned_path = os.path.join(tmp, "cleaned_reviews.parquet")
+    storage.write_table(cleaned, cleaned_path)
+    labelled = cleaned.head(scale["validation_reviews"]).reset_index(drop=True)
+    labelled = pd.concat([labelled, generate_labels(len(labelled))], axis=1)
+    labelled_path = os.path.join(tmp, "labelled_reviews.parquet")
+    storage.write_table(labelled, labelled_path)
+
+    server = start_fake_server(latency=args.latency, requests_per_minute=args.rpm, error_rate=args.error_rate)
+    env = dict(os.environ, OPENAI_API_KEY="fake")
+    cache = ["--no-cache", "--cache-path", os.path.join(tmp, "cache.sqlite")]
+    try:
+        n = scale["llm_reviews"]
+        metrics_path = os.path.join(tmp, "llm_metrics.json")
+        seconds = run_script("LLM_structuring.py", [
+            "--input", cleaned_path, "-n", str(n), "--output", os.path.join(tmp, "moderated.parquet"),
+            "--base-url", server.base_url, "--concurrency", str(args.concurrency), "--metrics-out", metrics_path,
+            *cache], env, SRC)
+        results["LLM_structuring"] = entry(seconds, n, **llm_summary(metrics_path), **backend_counts(server))
+
+        before = backend_counts(server)
+        seconds = run_script("validation.py", ["--input", labelled_path, "--base-url", server.base_url, *cache],
+                             env, tmp)
+        results["validation"] = entry(seconds, len(labelled),
+                                      **{k: v - before[k] for k, v in backend_counts(server).items()})
+    finally:
+        server.shutdown()
+    for name in ("LLM_structuring", "validation"):
+        print(f"[suite] {name}: {results[name]['rows_per_second']:,.1f} reviews/s ({results[name]['seconds']:.1f}s)")
+    return results
+
+
+def compare(old: dict, new: dict, tolerance: float) -> int:
+    """Prints rows/s old vs new for every benchmark in both runs; returns the number of regressions."""
+    print(f"[compare] {str(old['environment']['commit'])[:10]} -> {str(new['environment']['commit'])[:10]}")
+    if old["config"] != new["config"]:
+        print(f"[compare] warning: configurations differ: {old['config']} vs {new['config']}")
+    regressions = 0
+    for name, r in new["benchmarks"].items():
+        if name not in old["benchmarks"]:
+            continue
+        before, after = old["benchmarks"][name]["rows_per_second"], r["rows_per_second"]
+        change = after / before - 1 if before else 0.0
+        flag = ""
+        if change < -tolerance:
+            flag, regressions = "  REGRESSION", regressions + 1
+        print(f"[compare] {name:<24}{before:>14,.1f}{after:>14,.1f} rows/s {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic data")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per in-process benchmark (the median is kept)")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake LLM latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake LLM calls answered 503")
+    parser.add_argument("--rpm", type=int, default=None, help="fake LLM requests/min before answering 429")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--output", default=None,
+                        help="results file (default: outputs/benchmarks/<commit>-<scale>.json)")
+    parser.add_argument("--baseline", default=None, help="earlier results file to compare this run against")
+    parser.add_argument("--compare", nargs=2, default=None, metavar=("OLD", "NEW"),
+                        help="only compare two results files")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="slowdown (share of rows/s) reported as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        old, new = (json.load(open(p, encoding="utf-8")) for p in args.compare)
+        sys.exit(1 if compare(old, new, args.tolerance) else 0)
+
+    scale = SCALES[args.scale]
+    env = environment()
+    with tempfile.TemporaryDirectory() as tmp:
+        benchmarks = run_suite(scale, args, tmp)
+    result = {
+        "suite_version": SUITE_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": env,
+        "config": {"scale": args.scale, **scale, "repeat": args.repeat, "latency": args.latency,
+                   "error_rate": args.error_rate, "rpm": args.rpm, "concurrency": args.concurrency},
+        "benchmarks": benchmarks,
+    }
+    commit = (env["commit"] or "nogit")[:10] + ("-dirty" if env["dirty"] else "")
+    output = args.output or os.path.join("outputs", "benchmarks", f"{commit}-{args.scale}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"[ok] wrote {output}")
+
+    if args.baseline:
+        sys.exit(1 if compare(json.load(open(args.baseline, encoding="utf-8")), result, args.tolerance) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# synthetic Google Local style metadata/review frames for benchmarking
+# texts mix the things helper.py has to handle: emojis (incl. surrogate form), curly quotes,
+# long dashes, irregular whitespace, URLs, phone numbers and duplicate texts
+# usage (from src/): python -m benchmarks.synthetic --out ../data/synthetic --reviews 1000000 --businesses 10000
+#   writes meta-Synthetic.json and review-Synthetic.json (JSON lines, like the downloaded files)
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+CATEGORIES = [
+    "Restaurant", "Cafe", "Bar", "Pizza restaurant", "Hotel", "Gas station",
+    "Grocery store", "Hardware store", "Tourist attraction", "Bridge", "Park", "Bakery",
+]
+
+REVIEW_SNIPPETS = [
+    "Great food and friendly staff.",
+    "The pizza was   cold\tand the wait\nwas long.",
+    "“Best coffee in town” — would come again!",
+    "Nice place 😀 will be back 🥰",
+    "Service was ok ‘nothing special’ – prices fair.",
+    "Visit www.cheap-deals.com for a discount code!!!",
+    "Call me at +1 802-555-0199 for a better offer",
+    "Join my telegram t.me/FASTCASHTODAY for fast cash",
+    "Loved the view 😍 from the bridge",
+    "Clean rooms, comfy beds, breakfast from 7 to 10.",
+    "Terrible. Never again.",
+    "Good",
+]
+
+HOURS = [
+    [["Monday", "8AM-5PM"], ["Tuesday", "8AM-5PM"], ["Wednesday", "8AM-5PM"],
+     ["Thursday", "8AM-5PM"], ["Friday", "8AM-5PM"], ["Saturday", "Closed"], ["Sunday", "Closed"]],
+    [["Friday", "Open 24 hours"], ["Saturday", "Open 24 hours"], ["Sunday", "Open 24 hours"],
+     ["Monday", "Open 24 hours"], ["Tuesday", "Open 24 hours"], ["Wednesday", "Open 24 hours"],
+     ["Thursday", "Open 24 hours"]],
+]
+
+
+def generate_metadata(n_businesses: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Metadata frame with the same columns as the meta-<state>.json files.
+    """
+    rng = np.random.default_rng(seed)
+    ids = [f"0x{i:016x}:0x{i * 7919:x}" for i in range(n_businesses)]
+    return pd.DataFrame({
+        "name": [f"Business {i}" for i in range(n_businesses)],
+        "address": [f"Business {i}, {i % 900 + 1} Main St, Burlington, VT 05401" for i in range(n_businesses)],
+        "gmap_id": ids,
+        "description": None,
+        "latitude": rng.uniform(42.7, 45.0, n_businesses),
+        "longitude": rng.uniform(-73.4, -71.5, n_businesses),
+        "category": [[str(c) for c in rng.choice(CATEGORIES, size=rng.integers(1, 4), replace=False)]
+                     for _ in range(n_businesses)],
+        "avg_rating": rng.uniform(1, 5, n_businesses).round(1),
+        "num_of_reviews": rng.integers(1, 500, n_businesses),
+        "price": None,
+        "hours": [HOURS[i % len(HOURS)] for i in range(n_businesses)],
+        "MISC": None,
+        "state": "Open",
+        "relative_results": None,
+        "url": [f"https://www.google.com/maps/place//data={i}" for i in range(n_businesses)],
+    })
+
+
+def generate_reviews(n_reviews: int, metadata: pd.DataFrame, duplicate_rate: float = 0.05,
+                     seed: int = 0) -> pd.DataFrame:
+    """
+    Review frame with the same columns as the review-<state>.json files.
+    About `duplicate_rate` of the texts are exact copies of an earlier text.
+    """
+    rng = np.random.default_rng(seed)
+    snippets = np.array(REVIEW_SNIPPETS, dtype=object)
+    first = snippets[rng.integers(0, len(snippets), n_reviews)]
+    second = snippets[rng.integers(0, len(snippets), n_reviews)]
+    texts = [f"{a} {b} #{i}" for i, (a, b) in enumerate(zip(first, second))]
+    n_dup = int(n_reviews * duplicate_rate)
+    if n_dup:
+        dup_pos = rng.integers(1, n_reviews, n_dup)
+        for pos in dup_pos:
+            texts[pos] = texts[rng.integers(0, pos)]
+
+    return pd.DataFrame({
+        "user_id": [f"1{u:020d}" for u in rng.integers(0, 10**18, n_reviews)],
+        "name": [f"User {i}" for i in range(n_reviews)],
+        "time": rng.integers(1_400_000_000_000, 1_700_000_000_000, n_reviews),
+        "rating": rng.integers(1, 6, n_reviews),
+        "text": texts,
+        "pics": None,
+        "resp": None,
+        "gmap_id": metadata["gmap_id"].to_numpy()[rng.integers(0, len(metadata), n_reviews)],
+    })
+
+
+def generate_labels(n_reviews: int, seed: int = 0) -> pd.DataFrame:
+    """Human-style ground truth columns, as in the labelled sheet validation.py reads."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Relevance Score": rng.choice(["High", "Average", "Low"], n_reviews, p=[0.5, 0.35, 0.15]),
+        "Quality Score": rng.choice(["High", "Average", "Low"], n_reviews, p=[0.4, 0.4, 0.2]),
+    })
+
+
+def write_json_dataset(directory: str, n_businesses: int, n_reviews: int, state: str = "Synthetic",
+                       seed: int = 0) -> tuple:
+    """
+    Writes meta-<state>.json and review-<state>.json (JSON lines) under `directory`.
+
+    Returns:
+        tuple: (metadata path, review path)
+    """
+    os.makedirs(directory, exist_ok=True)
+    meta = generate_metadata(n_businesses, seed=seed)
+    meta_path = os.path.join(directory, f"meta-{state}.json")
+    review_path = os.path.join(directory, f"review-{state}.json")
+    meta.to_json(meta_path, orient="records", lines=True)
+    generate_reviews(n_reviews, meta, seed=seed).to_json(review_path, orient="records", lines=True)
+    return meta_path, review_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic meta/review JSON files")
+    parser.add_argument("--out", default="../data/synthetic")
+    parser.add_argument("--reviews", type=int, default=100_000)
+    parser.add_argument("--businesses", type=int, default=2_000)
+    parser.add_argument("--state", default="Synthetic")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for path in write_json_dataset(args.out, args.businesses, args.reviews, args.state, args.seed):
+        print(f"[ok] wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
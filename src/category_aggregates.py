@@ -0,0 +1,283 @@
+# per-category / per-business / per-time-window aggregates of (labelled) reviews
+# categories are interned to integer codes and row membership is a sparse CSR matrix, so each
+# statistic is one sparse product instead of an explode + groupby over the text column; reviews
+# are identified by 64-bit text hashes. Aggregates can be updated batch by batch as labels arrive
+# and saved between runs.
+# usage: python category_aggregates.py --input moderated_reviews_with_results.parquet --state ../cleaned_data/aggregates.pkl
+import argparse
+import ast
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import storage
+from result_schema import POLICY_FIELDS, SCORE_FIELDS, SCORE_LABELS
+
+# combines a text hash with a group code into one 64-bit key (golden-ratio multiplier)
+_GROUP_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+# columns of the per-row value matrix that every grouping sums
+VALUE_COLUMNS = (["reviews", "labelled"] + [f"{p} flags" for p in POLICY_FIELDS]
+                 + [f"{s}: {label}" for s in SCORE_FIELDS for label in SCORE_LABELS])
+
+
+def text_ids(text: pd.Series) -> np.ndarray:
+    """64-bit ids of the values in `text`; each distinct value is hashed once."""
+    codes, uniques = pd.factorize(text.astype(str))
+    return pd.util.hash_pandas_object(pd.Series(uniques), index=False).to_numpy()[codes]
+
+
+def _first_unseen(seen: np.ndarray, keys: np.ndarray) -> tuple:
+    """
+    Marks the first occurrence of every key that is not in the sorted array `seen`.
+
+    Returns:
+        tuple: (bool mask over keys, `seen` with the new keys inserted, still sorted)
+    """
+    uniq, first = np.unique(keys, return_index=True)
+    pos = np.searchsorted(seen, uniq)
+    present = np.zeros(len(uniq), dtype=bool)
+    if len(seen):
+        present = seen[np.minimum(pos, len(seen) - 1)] == uniq
+    mask = np.zeros(len(keys), dtype=bool)
+    mask[first[~present]] = True
+    return mask, np.insert(seen, pos[~present], uniq[~present])
+
+
+def _replace_rows(seen: np.ndarray, stored: np.ndarray, keys: np.ndarray, values: np.ndarray) -> tuple:
+    """
+    Records `values` as the latest values of the rows `keys` (a later duplicate in the batch wins)
+    in the sorted array `seen` and the per-row values `stored` aligned with it.
+
+    Returns:
+        tuple: (positions in the batch of the rows whose counted values change, in batch order,
+                the change for each of them (their values if the row is new),
+                updated `seen`, updated `stored`)
+    """
+    uniq, last = np.unique(keys[::-1], return_index=True)
+    last = len(keys) - 1 - last
+    pos = np.searchsorted(seen, uniq)
+    present = np.zeros(len(uniq), dtype=bool)
+    if len(seen):
+        present = seen[np.minimum(pos, len(seen) - 1)] == uniq
+    latest = values[last]
+    delta = latest.copy()
+    delta[present] -= stored[pos[present]]
+    stored[pos[present]] = latest[present]
+    seen = np.insert(seen, pos[~present], uniq[~present])
+    stored = np.insert(stored, pos[~present], latest[~present], axis=0)
+    changed = ~present | delta.any(axis=1)
+    order = np.argsort(last[changed], kind="stable")
+    return last[changed][order], delta[changed][order], seen, stored
+
+
+def parse_categories(categories: pd.Series) -> list:
+    # parquet gives arrays; csv/xlsx give stringified lists, which repeat for every review of a
+    # business, so each distinct string is parsed once
+    parsed = {}
+    return [(parsed.get(c) or parsed.setdefault(c, ast.literal_eval(c))) if isinstance(c, str) else c
+            for c in categories]
+
+
+class _Grouping:
+    def __init__(self, name: str):
+        self.name = name
+        self.labels = []
+        self.codes = {}
+        self.seen_pairs = np.empty(0, dtype=np.uint64)
+        self.sums = np.zeros((0, len(VALUE_COLUMNS)))
+        self.unique = np.zeros(0, dtype=np.int64)
+
+    def membership(self, values: pd.Series):
+        """
+        CSR matrix (rows x labels) from one label per row, or one list of labels per row
+        (categories). Missing labels give empty rows; new labels are interned to the next free codes.
+        """
+        from scipy.sparse import csr_matrix
+
+        n_rows = len(values)
+        values = pd.Series(values.to_numpy() if isinstance(values, pd.Series) else values, dtype=object).explode()
+        rows = values.index.to_numpy()
+        inverse, uniques = pd.factorize(values)
+        for label in uniques:
+            if label not in self.codes:
+                self.codes[label] = len(self.labels)
+                self.labels.append(label)
+        lookup = np.array([self.codes[label] for label in uniques], dtype=np.int64)
+        keep = inverse >= 0
+        indices = lookup[inverse[keep]]
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(rows[keep], minlength=n_rows))))
+        matrix = csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n_rows, len(self.labels)))
+        matrix.sum_duplicates()
+        matrix.data[:] = 1.0  # a category listed twice still counts once
+        return matrix
+
+    def update(self, matrix, ids: np.ndarray, values: np.ndarray):
+        n = len(self.labels)
+        if len(self.sums) < n:
+            self.sums = np.vstack([self.sums, np.zeros((n - len(self.sums), len(VALUE_COLUMNS)))])
+            self.unique = np.concatenate([self.unique, np.zeros(n - len(self.unique), dtype=np.int64)])
+        self.sums += matrix.T @ values
+
+        # unique review texts per group, via (text hash, group) keys seen in any batch so far
+        rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        groups = matrix.indices.astype(np.uint64)
+        with np.errstate(over="ignore"):
+            keys = ids[rows] + groups * _GROUP_MULTIPLIER
+        new, self.seen_pairs = _first_unseen(self.seen_pairs, keys)
+        self.unique += np.bincount(matrix.indices[new], minlength=n)
+
+    def table(self) -> pd.DataFrame:
+        table = pd.DataFrame(self.sums, columns=VALUE_COLUMNS)
+        table.insert(0, self.name, self.labels)
+        table.insert(1, "unique_review_count", self.unique)
+        labelled = table["labelled"].where(table["labelled"] > 0)
+        for policy in POLICY_FIELDS:
+            table[f"{policy} rate"] = table[f"{policy} flags"] / labelled
+        for score in SCORE_FIELDS:
+            cols = [f"{score}: {label}" for label in SCORE_LABELS]
+            table[cols] = table[cols].div(labelled, axis=0)
+        int_cols = ["reviews", "labelled"] + [f"{p} flags" for p in POLICY_FIELDS]
+        table[int_cols] = table[int_cols].astype(np.int64)
+        return table.sort_values("unique_review_count", ascending=False, kind="stable").reset_index(drop=True)
+
+
+class ReviewAggregates:
+    def __init__(self, window: str = "M"):
+        """
+        window: pandas period alias for the time windows ("M" = month, "W" = week, "D" = day).
+        Each row (same gmap_id and text) is counted once: when a later update brings it again,
+        e.g. re-fed after it was labelled or retried on --resume, its previous contribution is
+        replaced by the new one, so overlapping batches do not double count.
+        """
+        self.window = window
+        self.groupings = {name: _Grouping(name) for name in ("category", "gmap_id", "window")}
+        self.seen_rows = np.empty(0, dtype=np.uint64)
+        # last counted values of each row in seen_rows (the values are 0/1 flags)
+        self.row_values = np.zeros((0, len(VALUE_COLUMNS)), dtype=np.int8)
+
+    def _values(self, df: pd.DataFrame) -> np.ndarray:
+        values = np.zeros((len(df), len(VALUE_COLUMNS)))
+        values[:, 0] = 1.0
+        policy_cols = [f"res: {p}" for p in POLICY_FIELDS]
+        if not set(policy_cols) <= set(df.columns):
+            return values
+        policies = df[policy_cols].astype(str).apply(lambda c: c.str.strip())
+        valid = policies.isin(["Yes", "No"])
+        # rule pre-filter verdicts leave the policies they do not evaluate unset; a row without an
+        # error counts as labelled, with its unset policies not flagged
+        unset = policies.isna() | policies.isin(["", "None", "nan", "<NA>"])
+        ok = df["res: error"].isna().to_numpy() if "res: error" in df.columns else np.ones(len(df), dtype=bool)
+        labelled = ((valid | unset).all(axis=1) & valid.any(axis=1)).to_numpy() & ok
+        values[:, 1] = labelled
+        values[:, 2:2 + len(POLICY_FIELDS)] = (policies == "Yes").to_numpy() & labelled[:, None]
+        col = 2 + len(POLICY_FIELDS)
+        for score in SCORE_FIELDS:
+            scores = df.get(f"res: {score}", pd.Series("", index=df.index)).astype(str).str.strip()
+            for label in SCORE_LABELS:
+                values[:, col] = (scores == label).to_numpy() & labelled
+                col += 1
+        return values
+
+    def _windows(self, time: pd.Series) -> pd.Series:
+        # windows are in Vermont local time; csv/xlsx hold it as "2021-08-10 15:17:12 EDT"
+        if pd.api.types.is_datetime64_any_dtype(time):
+            t = time.dt.tz_convert("America/New_York").dt.tz_localize(None) if time.dt.tz else time
+        else:
+            t = pd.to_datetime(time.astype(str).str.replace(r"\s+[A-Z]{3,4}$", "", regex=True),
+                               format="%Y-%m-%d %H:%M:%S", errors="coerce")
+        periods = t.dt.to_period(self.window)
+        # labels are strings ("2021-06") so saved aggregates do not depend on pandas Period pickles
+        codes, uniques = pd.factorize(periods)
+        return pd.Series(np.append(uniques.astype(str).to_numpy(dtype=object), None)[codes])
+
+    def update(self, df: pd.DataFrame) -> int:
+        """
+        Adds a batch of cleaned or labelled reviews (text, gmap_id, category, time and optionally
+        the 'res: ' label columns); rows seen before have their labels replaced. Returns the
+        number of rows that were new.
+        """
+        ids = text_ids(df["text"])
+        with np.errstate(over="ignore"):
+            row_ids = ids ^ (text_ids(df["gmap_id"]) * _GROUP_MULTIPLIER)
+        known = len(self.seen_rows)
+        rows, values, self.seen_rows, self.row_values = _replace_rows(
+            self.seen_rows, self.row_values, row_ids, self._values(df).astype(np.int8))
+        added = len(self.seen_rows) - known
+        df, ids = df.iloc[rows], ids[rows]
+        if len(df) == 0:
+            return added
+        values = values.astype(float)
+        members = {
+            "category": lambda: parse_categories(df["category"]),
+            "gmap_id": lambda: df["gmap_id"],
+            "window": lambda: self._windows(df["time"]) if "time" in df.columns else pd.Series([None] * len(df)),
+        }
+        for name, grouping in self.groupings.items():
+            grouping.update(grouping.membership(members[name]()), ids, values)
+        return added
+
+    def table(self, by: str = "category") -> pd.DataFrame:
+        """
+        One row per category, business (gmap_id) or time window: reviews, unique_review_count,
+        labelled reviews, flag counts and rates per policy and the share of each score label.
+        """
+        return self.groupings[by].table()
+
+    def save(self, path: str):
+        # plain lists/arrays rather than the objects, so the file does not depend on how this
+        # module was imported (python category_aggregates.py pickles classes as __main__.*)
+        state = {"window": self.window, "seen_rows": self.seen_rows, "row_values": self.row_values,
+                 "groupings": {name: dict(vars(g)) for name, g in self.groupings.items()}}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(state, f)
+
+    @staticmethod
+    def load(path: str) -> "ReviewAggregates":
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        aggregates = ReviewAggregates(state["window"])
+        aggregates.seen_rows = state["seen_rows"]
+        aggregates.row_values = state["row_values"]
+        for name, attrs in state["groupings"].items():
+            vars(aggregates.groupings[name]).update(attrs)
+        return aggregates
+
+
+def unique_reviews_per_category(df: pd.DataFrame) -> pd.DataFrame:
+    """category and unique_review_count (distinct review texts), largest first."""
+    aggregates = ReviewAggregates()
+    aggregates.groupings = {"category": aggregates.groupings["category"]}
+    aggregates.update(df)
+    return aggregates.table("category")[["category", "unique_review_count"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate reviews and labels per category, business and time window")
+    parser.add_argument("--input", nargs="+", default=["moderated_reviews_with_results.parquet"],
+                        help="cleaned or labelled tables (parquet, csv or xlsx)")
+    parser.add_argument("--state", default=None,
+                        help="saved aggregates to update (created if missing); without it nothing is kept")
+    parser.add_argument("--window", default="M", help="time window: pandas period alias (M, W, D)")
+    parser.add_argument("--by", choices=["category", "gmap_id", "window"], default="category")
+    parser.add_argument("--output", default=None, help="optionally write the table (parquet, csv or xlsx)")
+    args = parser.parse_args()
+
+    aggregates = ReviewAggregates.load(args.state) if args.state and os.path.exists(args.state) \
+        else ReviewAggregates(args.window)
+    for path in args.input:
+        added = aggregates.update(storage.read_table(path))
+        print(f"[aggregates] {path}: {added} new rows")
+    if args.state:
+        aggregates.save(args.state)
+
+    table = aggregates.table(args.by)
+    print(table.head(20).to_string())
+    if args.output:
+        storage.write_table(table, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,76 @@
 # clean and remove null values
 # match the metadata and review to the corresponding 
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-import os
-import csv
+import argparse
 import helper
+import storage
+from manifest import ReviewManifest
+from instrumentation import metrics
+from location_consistency import Gazetteer
+
+def to_vermont_datetime(unix_ms: pd.Series) -> pd.Series:
+    """
+    Converts millisecond Unix timestamps to timezone-aware Vermont datetimes (kept typed in storage).
+    """
+    return (
+        pd.to_datetime(unix_ms.astype("int64") // 1000, unit="s", utc=True)
+          .dt.tz_convert("America/New_York")
+    )
+
+
+def to_vermont_time(unix_ms: pd.Series) -> pd.Series:
+    """
+    Column-wise helper.unix_to_vermont_time for millisecond Unix timestamps.
+    """
+    return to_vermont_datetime(unix_ms).dt.strftime(helper.TIME_FORMAT)
+
+
+def _normalize_chunk(texts: list) -> tuple:
+    # also returns the CPU time spent, which the parent cannot see when this runs in a worker process
+    start = time.process_time()
+    return [helper.normalize_text(t) for t in texts], time.process_time() - start
+
+
+def clean_text_column(text: pd.Series, pool=None, chunksize: int = 2_000) -> pd.Series:
+    """
+    Column-wise version of normalize_whitespace -> standardize_quotes_dashes -> clean_emojis.
 
-def match_metadata_reviews(metadata, reviews):
+    Pure-ASCII rows cannot hold emojis and are cleaned with vectorized string passes. The
+    remaining rows run helper.normalize_text, the CPU-bound part; with a
+    concurrent.futures.ProcessPoolExecutor as `pool` they are sent to the workers in
+    `chunksize` slices and reassembled in row order.
+    """
+    with metrics.stage("normalize_text", rows=len(text)) as stage:
+        ascii_rows = text.str.isascii()
+        text = text.copy()
+        if ascii_rows.any():
+            text[ascii_rows] = (
+                text[ascii_rows].str.replace(helper.WHITESPACE_REGEX, " ", regex=True)
+                                .str.strip(" ")
+                                .str.translate(helper.QUOTES_DASHES_TABLE)
+            )
+        if not ascii_rows.all():
+            values = text[~ascii_rows].tolist()
+            metrics.inc("emoji_pass_rows_total", len(values))
+            chunks = [values[i:i + chunksize] for i in range(0, len(values), chunksize)]
+            mapper = pool.map if pool is not None else map
+            cleaned = []
+            for chunk, cpu in mapper(_normalize_chunk, chunks):
+                cleaned.extend(chunk)
+                if pool is not None:
+                    stage["worker_cpu_seconds"] = stage.get("worker_cpu_seconds", 0.0) + cpu
+            text[~ascii_rows] = cleaned
+    return text
 
+
+def merge_and_filter(metadata, reviews):
+    """
+    Joins reviews to their business metadata, drops unused columns, nulls and duplicate texts.
+    """
     merged_df = pd.merge(metadata, reviews, on='gmap_id', how='inner')
 
     merged_df["text"] = (
@@ -28,23 +91,179 @@ def match_metadata_reviews(metadata, reviews):
     cleaned_df = cleaned_df[cleaned_df["text"].str.lower() != "none"]
     # remove rows with null values in critical columns
     #cleaned_df = merged_df.dropna(subset=['name', 'category', 'latitude', 'longitude','text','hours'])
-    for idx, row in cleaned_df.iterrows():
-        cleaned_df.at[idx, "time"] = helper.unix_to_vermont_time(int(row["time"])//1000)
-        cleaned_df.at[idx, "text"] = helper.normalize_whitespace(row["text"])
-        cleaned_df.at[idx, "text"] = helper.standardize_quotes_dashes(row["text"])
-        cleaned_df.at[idx, "text"] = helper.clean_emojis(row["text"])
-
     return cleaned_df
 
 
+def match_metadata_reviews(metadata, reviews, pool=None, gazetteer=None):
+    with metrics.stage("merge_filter", rows=len(reviews)):
+        cleaned_df = merge_and_filter(metadata, reviews)
+    with metrics.stage("timestamps", rows=len(cleaned_df)):
+        cleaned_df["time"] = to_vermont_datetime(cleaned_df["time"])
+    cleaned_df["text"] = clean_text_column(cleaned_df["text"], pool=pool)
+
+    return add_location_columns(cleaned_df, gazetteer)
+
+
+def add_location_columns(cleaned_df, gazetteer=None):
+    """
+    Adds the location_consistency.Gazetteer signal (location_mentions, location_distance_km,
+    location_consistency) when a gazetteer is given.
+    """
+    if gazetteer is None:
+        return cleaned_df
+    with metrics.stage("location", rows=len(cleaned_df)):
+        return cleaned_df.join(gazetteer.score(cleaned_df))
+
+
+def drop_seen_texts(df, seen: set):
+    """
+    Drops rows whose text was already emitted by an earlier chunk and records the new ones.
+    Texts are tracked as 64-bit hashes, so memory grows with the number of unique texts
+    (~70 bytes each), not with their length.
+    """
+    digests = pd.util.hash_pandas_object(df["text"], index=False).to_numpy()
+    keep = np.fromiter((d not in seen for d in digests), dtype=bool, count=len(digests))
+    seen.update(digests[keep].tolist())
+    return df[keep]
+
+
+def stream_match_metadata_reviews(metadata, review_path, output_file, chunksize=100_000, pool=None,
+                                  gazetteer=None):
+    """
+    Chunked version of match_metadata_reviews for review files too large to load at once.
+
+    The metadata stays in memory as a gmap_id-indexed lookup while the reviews are read
+    `chunksize` lines at a time. Each chunk is joined, cleaned, deduplicated against
+    all earlier chunks and appended to `output_file` (parquet or csv), so peak memory
+    is bounded by the chunk size rather than the file size. `pool` is passed on to
+    clean_text_column and reused across chunks, `gazetteer` to add_location_columns.
+
+    Returns:
+        int: number of rows written.
+    """
+    meta_lookup = metadata.set_index("gmap_id", drop=False)
+    seen = set()
+
+    with storage.TableWriter(output_file) as writer:
+        for reviews in pd.read_json(review_path, lines=True, chunksize=chunksize):
+            writer.write(_clean_review_chunk(meta_lookup, reviews, seen, pool, gazetteer))
+            print(f"[stream] {writer.rows} rows written")
+
+    return writer.rows
+
+
+def _clean_review_chunk(meta_lookup, reviews, seen: set, pool=None, gazetteer=None):
+    # join one chunk of reviews against the gmap_id-indexed metadata, then dedup and clean it
+    with metrics.stage("merge_filter", rows=len(reviews)):
+        chunk_meta = meta_lookup[meta_lookup.index.isin(reviews["gmap_id"].unique())]
+        cleaned = merge_and_filter(chunk_meta.reset_index(drop=True), reviews)
+        cleaned = drop_seen_texts(cleaned, seen)
+    with metrics.stage("timestamps", rows=len(cleaned)):
+        cleaned["time"] = to_vermont_datetime(cleaned["time"])
+    cleaned["text"] = clean_text_column(cleaned["text"], pool=pool)
+    return add_location_columns(cleaned, gazetteer)
+
+
+def incremental_match_metadata_reviews(metadata, review_chunks, manifest, pool=None, gazetteer=None):
+    """
+    Cleans only the reviews that are new or changed since the last run and writes them as
+    a new delta partition of `manifest` (a manifest.ReviewManifest).
+
+    Reviews are identified by (gmap_id, user_id, time); the manifest remembers a content
+    digest per key and a high-water mark, and texts already emitted by earlier runs are
+    dropped as duplicates. Each row of the delta carries its `review_key`, so a later edit
+    of the same review supersedes it in ReviewManifest.read_partitions().
+
+    Args:
+        review_chunks: iterable of review frames (one frame, or pd.read_json(..., chunksize=...)).
+
+    Returns:
+        str: path of the delta partition, or None if nothing was new.
+    """
+    meta_lookup = metadata.set_index("gmap_id", drop=False)
+    path = manifest.new_partition_path()
+    totals = {"new": 0, "changed": 0, "unchanged": 0}
+
+    with storage.TableWriter(path) as writer:
+        for reviews in review_chunks:
+            keys, digests, todo, counts = manifest.classify(reviews)
+            totals = {k: totals[k] + counts[k] for k in totals}
+            if todo.any():
+                delta = reviews[todo].assign(review_key=keys[todo])
+                # every review looked at is recorded, including those merge_and_filter drops (no text,
+                # null metadata fields), except reviews of a business without metadata yet: a later
+                # run considers those again once the metadata arrives
+                has_meta = delta["gmap_id"].isin(meta_lookup.index).to_numpy()
+                manifest.record(keys[todo][has_meta], digests[todo][has_meta],
+                                reviews["time"].to_numpy()[todo][has_meta])
+                writer.write(_clean_review_chunk(meta_lookup, delta, manifest.seen_texts, pool, gazetteer))
+
+    print(f"[incremental] {totals['new']} new, {totals['changed']} changed, "
+          f"{totals['unchanged']} unchanged reviews; {writer.rows} rows in the delta")
+    if writer.rows:
+        manifest.add_partition(path, writer.rows)
+    elif os.path.exists(path):
+        os.remove(path)
+    manifest.save()
+    return path if writer.rows else None
+
+
 def main():
-    meta = pd.read_json("../data/meta-Vermont.json", lines=True)
-    reviews = pd.read_json("../data/review-Vermont.json",lines= True)
-    cleaned = match_metadata_reviews(meta,reviews)
-    output_dir = "../cleaned_data"
-    os.makedirs(output_dir, exist_ok=True)
-    output_file = os.path.join(output_dir, "cleaned_reviews.csv")
-    cleaned.to_csv(output_file, index=False, encoding="utf-8", quoting=csv.QUOTE_ALL)
+    parser = argparse.ArgumentParser(description="Clean and merge Google Local reviews with metadata")
+    parser.add_argument("--meta", default="../data/meta-Vermont.json")
+    parser.add_argument("--reviews", default="../data/review-Vermont.json")
+    parser.add_argument("--format", choices=["parquet", "csv"], default=storage.DEFAULT_FORMAT,
+                        help="output format of cleaned_reviews")
+    parser.add_argument("--stream", action="store_true",
+                        help="read reviews in chunks (for review files that do not fit in memory)")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="review lines per chunk in --stream mode")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only clean reviews that are new or changed since the last run, as a delta partition")
+    parser.add_argument("--manifest", default="../cleaned_data/incremental",
+                        help="manifest directory (and delta partitions) for --incremental")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes for text normalization (0 = one per CPU core)")
+    parser.add_argument("--location-scores", action="store_true",
+                        help="add a location-consistency signal (places mentioned far from the business)")
+    parser.add_argument("--metrics-out", nargs="*", default=[], metavar="PATH",
+                        help="write run metrics; .prom/.txt paths get Prometheus text format, others JSON")
+    args = parser.parse_args()
+
+    output_file = storage.table_path("../cleaned_data/cleaned_reviews", args.format)
+    workers = args.workers or os.cpu_count()
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+
+    try:
+        with metrics.stage("read") as stage:
+            meta = pd.read_json(args.meta, lines=True)
+            stage["rows"] = len(meta)
+        gazetteer = Gazetteer.from_metadata(meta) if args.location_scores else None
+        if args.incremental:
+            review_chunks = pd.read_json(args.reviews, lines=True, chunksize=args.chunksize) if args.stream \
+                else [pd.read_json(args.reviews, lines=True)]
+            delta = incremental_match_metadata_reviews(meta, review_chunks, ReviewManifest(args.manifest), pool=pool,
+                                                       gazetteer=gazetteer)
+            if delta:
+                print(f"[ok] wrote {delta}")
+            return
+        if args.stream:
+            stream_match_metadata_reviews(meta, args.reviews, output_file, chunksize=args.chunksize, pool=pool,
+                                          gazetteer=gazetteer)
+            return
+
+        with metrics.stage("read") as stage:
+            reviews = pd.read_json(args.reviews,lines= True)
+            stage["rows"] = len(reviews)
+        cleaned = match_metadata_reviews(meta,reviews, pool=pool, gazetteer=gazetteer)
+        with metrics.stage("write", rows=len(cleaned)):
+            storage.write_table(cleaned, output_file)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        print(metrics.summary())
+        for path in args.metrics_out:
+            metrics.write(path)
+            print(f"[metrics] wrote {path}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,293 @@
+# minimal local OpenAI-compatible server for exercising the pipeline without an API key
+# implements chat completions plus the file/batch endpoints used by batch_api.py
+# usage: python fake_openai_server.py --port 8000 --latency 0.5 [--error-rate 0.02] [--rpm 600]
+#        OPENAI_API_KEY=fake python LLM_structuring.py --base-url http://127.0.0.1:8000/v1
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+import email.policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESULT = {
+    "Advertisement": "No",
+    "Irrelevant Review": "No",
+    "False Review": "No",
+    "Vulgar Language": "No",
+    "Relevance Score": "Average",
+    "Quality Score": "Average",
+    "Extraction Justification": "Fake server response.",
+}
+
+# batched prompts (LLM_structuring.generate_batch_prompt) mark each review with this header
+BATCH_ID_PATTERN = re.compile(r"^\s*### Review ID: (\S+)", re.MULTILINE)
+
+
+def default_respond(messages: list) -> dict:
+    """
+    Answers single-review prompts with DEFAULT_RESULT and batched prompts with one
+    DEFAULT_RESULT entry per review ID.
+    """
+    ids = BATCH_ID_PATTERN.findall(messages[-1]["content"])
+    if ids:
+        return {"results": [{"id": review_id, **DEFAULT_RESULT} for review_id in ids]}
+    return DEFAULT_RESULT
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text; good enough for a fake usage block
+    return max(1, len(text) // 4)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/chat/completions"):
+            self._chat_completion(self._read_json())
+        elif path.endswith("/files"):
+            self._upload_file()
+        elif path.endswith("/batches"):
+            self._send_json(200, self.server.create_batch(self._read_json()))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _chat_completion(self, request: dict):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            limited, rate_headers = server.check_rate_limit()
+        if limited:
+            with server.lock:
+                server.rate_limited_count += 1
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, rate_headers)
+            return
+        if server.latency:
+            time.sleep(server.latency)
+        if server.inject_error():
+            self._send_json(503, {"error": {"message": "The server is overloaded", "type": "server_error"}})
+            return
+        self._send_json(200, server.complete(request), rate_headers)
+
+    # ---- Batch API: /files, /files/{id}/content, /batches, /batches/{id} ----
+
+    def _upload_file(self):
+        # multipart/form-data upload as sent by client.files.create(file=..., purpose="batch")
+        length = int(self.headers.get("Content-Length", 0))
+        message = BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + self.rfile.read(length)
+        )
+        fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+        upload = fields["file"]
+        content = upload.get_payload(decode=True)
+        purpose = fields["purpose"].get_payload(decode=True).decode() if "purpose" in fields else "batch"
+        self._send_json(200, self.server.store_file(content, upload.get_filename() or "upload.jsonl", purpose))
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        server = self.server
+        if len(parts) >= 3 and parts[-3] == "files" and parts[-1] == "content" and parts[-2] in server.files:
+            body = server.files[parts[-2]]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif len(parts) >= 2 and parts[-2] == "files" and parts[-1] in server.files:
+            self._send_json(200, server.files[parts[-1]]["meta"])
+        elif len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in server.batches:
+            self._send_json(200, server.batches[parts[-1]])
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, respond=None,
+                 requests_per_minute: int = None, window: float = 60.0, error_rate: float = 0.0, seed: int = 0):
+        """
+        latency: seconds slept before answering each chat completion.
+        respond: callable(messages) -> dict used as the JSON content of the reply.
+        requests_per_minute: answer 429 (with Retry-After) once this many requests arrived within
+            `window` seconds; every reply carries x-ratelimit-* headers like the real API.
+        error_rate: share of chat completions answered with a retryable 503 (drawn from `seed`).
+        """
+        super().__init__((host, port), FakeOpenAIHandler)
+        self.latency = latency
+        self.respond = respond or default_respond
+        self.requests_per_minute = requests_per_minute
+        self.window = window
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self.error_rate = error_rate
+        self.error_count = 0
+        self._random = random.Random(seed)
+        self._recent = deque()
+        self.files = {}
+        self.batches = {}
+        self.batch_delay = 0.0
+
+    def complete(self, request: dict) -> dict:
+        """Builds the chat.completion body for one request."""
+        content = json.dumps(self.respond(request["messages"]))
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in request["messages"])
+        completion_tokens = estimate_tokens(content)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def inject_error(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self.lock:
+            failed = self._random.random() < self.error_rate
+            self.error_count += failed
+        return failed
+
+    def store_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        meta = {
+            "id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": filename, "purpose": purpose, "status": "processed",
+        }
+        with self.lock:
+            self.files[file_id] = {"meta": meta, "content": content}
+        return meta
+
+    def create_batch(self, request: dict) -> dict:
+        """
+        Registers a batch and processes it on a background thread; status goes
+        validating -> in_progress -> completed after `batch_delay` seconds.
+        """
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": request["endpoint"],
+            "input_file_id": request["input_file_id"], "completion_window": request["completion_window"],
+            "status": "validating", "created_at": int(time.time()),
+            "output_file_id": None, "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": request.get("metadata"),
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+        threading.Thread(target=self._run_batch, args=(batch_id,), daemon=True).start()
+        return dict(batch)
+
+    def _run_batch(self, batch_id: str):
+        batch = self.batches[batch_id]
+        lines = self.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+        batch["status"] = "in_progress"
+        batch["request_counts"]["total"] = len(lines)
+        time.sleep(self.batch_delay)
+
+        outputs = []
+        for line in lines:
+            item = json.loads(line)
+            outputs.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:24]}",
+                "custom_id": item["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": self.complete(item["body"])},
+                "error": None,
+            }))
+        output = self.store_file(("\n".join(outputs) + "\n").encode("utf-8"), f"{batch_id}_output.jsonl", "batch_output")
+        batch["request_counts"]["completed"] = len(outputs)
+        batch["output_file_id"] = output["id"]
+        batch["completed_at"] = int(time.time())
+        batch["status"] = "completed"
+
+    def check_rate_limit(self) -> tuple:
+        """
+        Sliding-window request limit. Returns (limited, headers); call with `lock` held.
+        """
+        if not self.requests_per_minute:
+            return False, {}
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] >= self.window:
+            self._recent.popleft()
+        reset = self.window - (now - self._recent[0]) if self._recent else 0.0
+        limited = len(self._recent) >= self.requests_per_minute
+        if not limited:
+            self._recent.append(now)
+        headers = {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute * 60.0 / self.window),
+            "x-ratelimit-remaining-requests": str(self.requests_per_minute - len(self._recent)),
+            "x-ratelimit-reset-requests": f"{reset:.3f}s",
+        }
+        if limited:
+            headers["retry-after"] = f"{reset:.3f}"
+        return limited, headers
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_fake_server(**kwargs) -> FakeOpenAIServer:
+    """
+    Starts a FakeOpenAIServer on a background thread (random free port by default).
+    Call `.shutdown()` on the returned server when done.
+    """
+    server = FakeOpenAIServer(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=None, help="requests per minute before answering 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of completions answered with a 503")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.host, args.port, latency=args.latency, requests_per_minute=args.rpm,
+                              error_rate=args.error_rate)
+    print(f"Fake OpenAI server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 import re
 from datetime import datetime
+from functools import lru_cache
 from zoneinfo import ZoneInfo
-import emoji
-import re
 
 ### TEXT-CLEANING AND NORMALISATION FUNCTIONS
 
 # Remove extra whitespaces
+# every character str.isspace() accepts, spelled out so the same pattern behaves identically
+# under Python's re and the pyarrow (RE2) kernels used by pandas' vectorized .str methods
+WHITESPACE_REGEX = "[\t\n\x0b\x0c\r\x1c-\x1f \x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]+"
+
 def normalize_whitespace(text: str) -> str:
     """
     Collapse multiple spaces, tabs, and newlines into a single space.
@@ -15,28 +18,25 @@ def normalize_whitespace(text: str) -> str:
         return ""
     return re.sub(r"\s+", " ", text).strip()
 
-#e.g. 
-print(normalize_whitespace(".   meow    //"))
-
-
+#e.g. normalize_whitespace(".   meow    //") -> ". meow //"
 
 # Standardisation of punctuation
+QUOTES_DASHES_TABLE = str.maketrans({
+    "“": '"', "”": '"', "„": '"', "«": '"', "»": '"',
+    "‘": "'", "’": "'", "‚": "'", "`": "'",
+    "–": "-", "—": "-", "―": "-",
+})
+
 def standardize_quotes_dashes(text: str) -> str:
     """
     Map curly quotes and long dashes to simple ASCII equivalents.
     """
     if not text:
         return ""
-    replacements = {
-        "“": '"', "”": '"', "„": '"', "«": '"', "»": '"',
-        "‘": "'", "’": "'", "‚": "'", "`": "'",
-        "–": "-", "—": "-", "―": "-",
-    }
-    for k, v in replacements.items():
-        text = text.replace(k, v)
-    return text
+    return text.translate(QUOTES_DASHES_TABLE)
 
 # Convert from UNIX to Vermont time
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S %Z'
 
 def unix_to_vermont_time(unix_time: int) -> str:
     """
@@ -44,87 +44,123 @@ def unix_to_vermont_time(unix_time: int) -> str:
     """
     dt_utc = datetime.utcfromtimestamp(unix_time)
     dt_vermont = dt_utc.replace(tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo("America/New_York"))
-    return dt_vermont.strftime('%Y-%m-%d %H:%M:%S %Z')
+    return dt_vermont.strftime(TIME_FORMAT)
+
+#e.g. unix_to_vermont_time(1700000000) -> "2023-11-14 17:13:20 EST"
 
-print(unix_to_vermont_time(1662467100)) 
-print(unix_to_vermont_time(1700000000))  
+def format_vermont_time(value) -> str:
+    """
+    Renders a timestamp read back from storage (typed datetime or already-formatted string)
+    the same way unix_to_vermont_time does.
+    """
+    if hasattr(value, "strftime"):
+        return value.strftime(TIME_FORMAT)
+    return value
 
 
 ### REMOVING LINKS AND PII
 
+# Patterns are compiled once at import; the raw strings (with inline flags) are also
+# used by pii_detection for vectorized pandas `.str` passes over whole columns.
+URL_REGEX = r'(?i)(https?://|www\.)[\w\-@:%._\+~#=]{2,256}\.[a-z]{2,6}\b[^\s]*'
+EMAIL_REGEX = r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+'
+PHONE_REGEX = r'\+?\d[\d\-\s\(\)]{7,}\d'
+TELEGRAM_REGEX = r'(?i)(t\.me/[^\s]+|@[\w\d_]{4,})'
+WHATSAPP_REGEX = r'(?i)(wa\.me/\d+|WhatsApp\s*[:\-]?\s*\+?\d+)'
+DM_REGEX = r'(?i)\b(dm|message|pm)\b\s*(me|us)?'
+
+URL_PATTERN = re.compile(URL_REGEX)
+EMAIL_PATTERN = re.compile(EMAIL_REGEX)
+PHONE_PATTERN = re.compile(PHONE_REGEX)
+TELEGRAM_PATTERN = re.compile(TELEGRAM_REGEX)
+WHATSAPP_PATTERN = re.compile(WHATSAPP_REGEX)
+DM_PATTERN = re.compile(DM_REGEX)
+
+PROMO_KEYWORDS = [
+    "promo code", "use code", "discount", "referral", "coupon",
+    "limited time offer", "sale", "get your"
+]
+CTA_KEYWORDS = [
+    "subscribe", "join", "click here", "dm me", "message me",
+    "call now", "sign up", "follow us", "visit now", "book now", "follow me"
+]
+
 # Identifying links
 def find_urls(text: str) -> list[str]:
-    url_pattern = re.compile(
-        r'(https?://|www\.)[\w\-@:%._\+~#=]{2,256}\.[a-z]{2,6}\b[^\s]*',
-        re.IGNORECASE
-    )
-    return url_pattern.findall(text)
+    return URL_PATTERN.findall(text)
 
 # Identifying emails
 def find_emails(text: str) -> list[str]:
-    email_pattern = re.compile(
-        r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+'
-    )
-    return email_pattern.findall(text)
+    return EMAIL_PATTERN.findall(text)
 
 
 # Identifying phone numbers
 def find_phone_numbers(text: str) -> list[str]:
-    phone_pattern = re.compile(
-        r'\+?\d[\d\-\s\(\)]{7,}\d'
-    )
-    return phone_pattern.findall(text)
+    return PHONE_PATTERN.findall(text)
 
 
 # Finding social handles
 def find_social_handles(text: str) -> dict:
     results = {
-        "telegram": re.findall(r'(t\.me/[^\s]+|@[\w\d_]{4,})', text, re.IGNORECASE),
-        "whatsapp": re.findall(r'(wa\.me/\d+|WhatsApp\s*[:\-]?\s*\+?\d+)', text, re.IGNORECASE),
-        "dm": re.findall(r'\b(dm|message|pm)\b\s*(me|us)?', text, re.IGNORECASE)
+        "telegram": TELEGRAM_PATTERN.findall(text),
+        "whatsapp": WHATSAPP_PATTERN.findall(text),
+        "dm": DM_PATTERN.findall(text)
     }
     return {k: v for k, v in results.items() if v}
-print(find_social_handles("message me at whatsapp"))
+#e.g. find_social_handles("message me at whatsapp") -> {"dm": [("message", "me")]}
+
 
+# keywords match whole words only, so "sale" does not match "wholesale" nor "join" "joined"
+PROMO_REGEX = r"(?i)\b(?:" + "|".join(re.escape(kw) for kw in PROMO_KEYWORDS) + r")\b"
+CTA_REGEX = r"(?i)\b(?:" + "|".join(re.escape(kw) for kw in CTA_KEYWORDS) + r")\b"
+PROMO_PATTERN = re.compile(PROMO_REGEX)
+CTA_PATTERN = re.compile(CTA_REGEX)
 
 # Finding promotional language
 def has_promo_language(text: str) -> bool:
-    promo_keywords = [
-        "promo code", "use code", "discount", "referral", "coupon",
-        "limited time offer", "sale", "get your"
-    ]
-    text = text.lower()
-    return any(kw in text for kw in promo_keywords)
+    return PROMO_PATTERN.search(text) is not None
 
 def has_call_to_action(text: str) -> bool:
-    cta_keywords = [
-        "subscribe", "join", "click here", "dm me", "message me",
-        "call now", "sign up", "follow us", "visit now", "book now", "follow me"
-    ]
-    text = text.lower()
-    return any(kw in text for kw in cta_keywords)
+    return CTA_PATTERN.search(text) is not None
 
 # cleaning of emojis
+# any string containing an emoji contains at least one of these characters (surrogates included),
+# so texts without them can skip the emoji pass entirely.
+# Built on first use: importing emoji and scanning its table costs more than the rest of this module.
+@lru_cache(maxsize=None)
+def emoji_char_pattern() -> re.Pattern:
+    import emoji
+    return re.compile("[" + "".join(sorted(
+        re.escape(c) for c in {c for e in emoji.EMOJI_DATA for c in e if ord(c) > 127}
+    )) + "\ud800-\udfff]")
+
+def _describe_emoji(chars: str, data: dict) -> str:
+    return "[" + data["en"].strip(":").replace("_", " ") + "]"
+
 def clean_emojis(text: str) -> str:
     """
     Convert emojis (even utf surrogate form) into descriptive words
     inside square brackets.
     Example: "\ud83e\udd70" -> "[smiling face with hearts]"
     """
-    # Step 1: decode surrogate pairs (like \ud83e\udd70) into proper emoji
-    if isinstance(text, str):
-        try:
-            text = text.encode("utf-16", "surrogatepass").decode("utf-16")
-        except UnicodeEncodeError:
-            pass  # if already clean
+    if not isinstance(text, str) or not emoji_char_pattern().search(text):
+        return text
 
-    # Step 2: convert emoji -> :shortcode: form
-    text = emoji.demojize(text)
-
-    # Step 3: turn :shortcode: into [description]
-    def replace_match(match):
-        desc = match.group(0).strip(":").replace("_", " ")
-        return f"[{desc}]"
+    # Step 1: decode surrogate pairs (like \ud83e\udd70) into proper emoji
+    try:
+        text = text.encode("utf-16", "surrogatepass").decode("utf-16")
+    except UnicodeError:
+        pass  # if already clean, or a lone surrogate that cannot be decoded
 
-    text = re.sub(r":[a-zA-Z0-9_&+\-]+:", replace_match, text)
+    # Step 2: turn each emoji into [description]
+    # (only real emoji are replaced, so "10:30:45" or ":)" in the text stay untouched)
+    import emoji
+    return emoji.replace_emoji(text, replace=_describe_emoji)
 
+def normalize_text(text: str) -> str:
+    """
+    normalize_whitespace -> standardize_quotes_dashes -> clean_emojis on a single string.
+    Pure-ASCII text cannot contain an emoji, so it skips the emoji step.
+    """
+    text = standardize_quotes_dashes(normalize_whitespace(text))
+    return text if text.isascii() else clean_emojis(text)
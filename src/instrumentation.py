@@ -0,0 +1,186 @@
+# per-stage timings and LLM call metrics for the moderation pipeline
+# every module records into the shared `metrics` registry; scripts print metrics.summary() at the end
+# and can export with metrics.write("run_metrics.json") or metrics.write("run_metrics.prom") (Prometheus text)
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = "moderation_"
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RESERVOIR_SIZE = 50_000
+# share of time a stage must spend on CPU (or, for the LLM stage, waiting on rate limits)
+# before the summary calls it CPU- (or rate-limit-) bound
+BOUND_THRESHOLD = 0.5
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.sample = []  # reservoir of observations for percentiles
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for k, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[k] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        if len(self.sample) < RESERVOIR_SIZE:
+            self.sample.append(value)
+        else:
+            slot = random.randrange(self.count)
+            if slot < RESERVOIR_SIZE:
+                self.sample[slot] = value
+
+    def percentile(self, q: float):
+        if not self.sample:
+            return None
+        ordered = sorted(self.sample)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.stages = {}
+            self.started = time.time()
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self.histograms.setdefault(name, Histogram()).observe(value)
+
+    @contextmanager
+    def stage(self, name: str, rows: int = None):
+        """
+        Times a pipeline stage (wall and process CPU time). `rows` may also be set on the
+        yielded dict once known, e.g. `with metrics.stage("read") as s: ...; s["rows"] = len(df)`,
+        and CPU time spent in worker processes added as s["worker_cpu_seconds"].
+        """
+        info = {"rows": rows}
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield info
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            with self._lock:
+                entry = self.stages.setdefault(name, {"wall_seconds": 0.0, "cpu_seconds": 0.0, "rows": 0, "runs": 0})
+                entry["wall_seconds"] += wall
+                entry["cpu_seconds"] += cpu + info.get("worker_cpu_seconds", 0.0)
+                entry["rows"] += info["rows"] or 0
+                entry["runs"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {
+                name: {**s, "rows_per_second": s["rows"] / s["wall_seconds"] if s["wall_seconds"] else None,
+                       "bound": self._bound(name, s)}
+                for name, s in self.stages.items()
+            }
+            histograms = {
+                name: {"count": h.count, "sum": h.sum, "p50": h.percentile(50), "p95": h.percentile(95),
+                       "p99": h.percentile(99)}
+                for name, h in self.histograms.items()
+            }
+            return {"elapsed_seconds": time.time() - self.started, "stages": stages,
+                    "counters": dict(self.counters), "histograms": histograms}
+
+    def _bound(self, name: str, stage: dict) -> str:
+        # callers hold the lock
+        if not stage["wall_seconds"]:
+            return "idle"
+        if name == "llm":
+            # time requests spent waiting on the rate limiter or backing off after 429s/errors,
+            # against time spent on the network; both are summed over concurrent requests
+            waited = self.counters.get("rate_limit_wait_seconds", 0) + self.counters.get("retry_backoff_seconds", 0)
+            latency = self.histograms.get("llm_latency_seconds")
+            on_network = latency.sum if latency else 0.0
+            if waited + on_network and waited / (waited + on_network) >= BOUND_THRESHOLD:
+                return "rate-limit-bound"
+            if stage["cpu_seconds"] / stage["wall_seconds"] >= BOUND_THRESHOLD:
+                return "CPU-bound"
+            return "network-bound"
+        # with worker processes cpu_seconds can exceed the wall time; that is still CPU-bound
+        if stage["cpu_seconds"] / stage["wall_seconds"] >= BOUND_THRESHOLD:
+            return "CPU-bound"
+        return "I/O-bound"
+
+    def summary(self) -> str:
+        snap = self.snapshot()
+        stages = snap["stages"]
+        if not stages:
+            return "[metrics] no stages recorded"
+        total = sum(s["wall_seconds"] for s in stages.values())
+        lines = [f"[metrics] {'stage':<18}{'wall s':>9}{'cpu s':>9}{'rows':>10}{'rows/s':>12}  bound"]
+        for name, s in sorted(stages.items(), key=lambda kv: -kv[1]["wall_seconds"]):
+            rate = f"{s['rows_per_second']:,.0f}" if s["rows_per_second"] and s["rows"] else "-"
+            lines.append(f"[metrics] {name:<18}{s['wall_seconds']:>9.2f}{s['cpu_seconds']:>9.2f}"
+                         f"{s['rows'] or '-':>10}{rate:>12}  {s['bound']}")
+        latency = snap["histograms"].get("llm_latency_seconds")
+        if latency:
+            c = snap["counters"]
+            lines.append(
+                f"[metrics] LLM: {latency['count']} calls, latency p50/p95/p99 = "
+                f"{latency['p50']:.2f}/{latency['p95']:.2f}/{latency['p99']:.2f}s, "
+                f"tokens {c.get('prompt_tokens_total', 0):.0f} prompt + {c.get('completion_tokens_total', 0):.0f} completion, "
+                f"{c.get('cache_hits_total', 0):.0f} cache hits, {c.get('llm_retries_total', 0):.0f} retries "
+                f"({c.get('rate_limited_total', 0):.0f} rate-limited), {c.get('llm_failures_total', 0):.0f} failures, "
+                f"{c.get('parse_failures_total', 0):.0f} parse failures")
+        slowest, s = max(stages.items(), key=lambda kv: kv[1]["wall_seconds"])
+        lines.append(f"[metrics] run is {s['bound']}: '{slowest}' took "
+                     f"{s['wall_seconds'] / total:.0%} of {total:.1f}s of stage time")
+        return "\n".join(lines)
+
+    def to_prometheus(self) -> str:
+        snap = self.snapshot()
+        out = []
+        for name, value in sorted(snap["counters"].items()):
+            metric = PREFIX + name
+            out += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        with self._lock:
+            histograms = {name: (h.buckets, list(h.counts), h.sum, h.count) for name, h in self.histograms.items()}
+        for name, (buckets, counts, total, count) in sorted(histograms.items()):
+            metric = PREFIX + name
+            out.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for upper, n in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += n
+                out.append(f'{metric}_bucket{{le="{upper}"}} {cumulative}')
+            out += [f"{metric}_sum {total}", f"{metric}_count {count}"]
+        for field in ("wall_seconds", "cpu_seconds", "rows", "rows_per_second"):
+            metric = f"{PREFIX}stage_{field}"
+            out.append(f"# TYPE {metric} gauge")
+            for stage, s in sorted(snap["stages"].items()):
+                if s[field] is not None:
+                    out.append(f'{metric}{{stage="{stage}"}} {s[field]}')
+        return "\n".join(out) + "\n"
+
+    def write(self, path: str):
+        """Writes Prometheus text format for .prom/.txt paths and JSON otherwise."""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), f, indent=2)
+
+
+metrics = Metrics()
@@ -0,0 +1,67 @@
+# append-only JSONL journal of labelled rows, so interrupted LLM runs can be resumed
+# each line: {"key": "<gmap_id>:<review hash>", "result": {...parsed LLM/prefilter result...}}
+import hashlib
+import json
+import os
+
+
+def row_key(gmap_id, text) -> str:
+    """
+    Stable identity of a review: business id plus a hash of the review text.
+    """
+    digest = hashlib.sha1(str(text).encode("utf-8")).hexdigest()[:16]
+    return f"{gmap_id}:{digest}"
+
+
+def is_labelled(result: dict) -> bool:
+    # failed calls are journaled too (for auditing) but are retried on resume
+    return bool(result) and "error" not in result
+
+
+class RowJournal:
+    def __init__(self, path: str):
+        """
+        path: JSONL file, created if missing. Existing entries are kept; later entries win.
+        """
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        # a crash mid-write leaves a torn last line; start on a fresh line so new entries stay parseable
+        if self._file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+    def load(self) -> dict:
+        """
+        Returns {key: result} for every journaled row, skipping a torn last line left by a crash.
+        """
+        entries = {}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                entries[entry["key"]] = entry["result"]
+        return entries
+
+    def completed(self) -> dict:
+        """Only the successfully labelled rows, i.e. the ones a resumed run can skip."""
+        return {k: v for k, v in self.load().items() if is_labelled(v)}
+
+    def record(self, key: str, result: dict):
+        # one line per row, flushed immediately so a crash loses at most the in-flight rows
+        self._file.write(json.dumps({"key": key, "result": result}, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,208 @@
+# CPU-only fast path in front of the LLM: hashed n-gram features + calibrated linear classifiers
+# trained on earlier LLM labels (moderated_reviews_with_results). Confident predictions are
+# accepted as the label; everything else escalates to the LLM.
+# usage: python local_classifier.py train --input moderated_reviews_with_results.parquet
+#        python LLM_structuring.py --local-model ../models/local_classifier.pkl --local-confidence 0.9
+import argparse
+import pickle
+import os
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+import storage
+from prefilter import POLICIES
+
+DEFAULT_MODEL_PATH = "../models/local_classifier.pkl"
+SCORES = ["Relevance Score", "Quality Score"]
+TARGETS = POLICIES + SCORES
+VALID_LABELS = {**{p: {"Yes", "No"} for p in POLICIES}, **{s: {"High", "Average", "Low", "-"} for s in SCORES}}
+
+
+def _documents(df: pd.DataFrame) -> list:
+    # the business category matters for relevance, so it is appended as extra tokens
+    texts = df["text"].astype(str).tolist()
+    if "category" not in df.columns:
+        return texts
+    return [
+        t + " " + " ".join("cat_" + str(c).lower().replace(" ", "_") for c in cats)
+        if isinstance(cats, (list, np.ndarray)) else t
+        for t, cats in zip(texts, df["category"])
+    ]
+
+
+def training_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rows of a labelled output usable as training data: all six labels valid, and labelled by
+    the LLM itself (rule pre-filter and local-model verdicts are left out, so the model
+    does not learn from its own output).
+    """
+    df = df.rename(columns={f"res: {t}": t for t in TARGETS})
+    ok = pd.Series(True, index=df.index)
+    for target in TARGETS:
+        ok &= df[target].astype(str).str.strip().isin(VALID_LABELS[target])
+    if "res: Extraction Justification" in df.columns:
+        ok &= ~df["res: Extraction Justification"].astype(str).str.startswith("[")
+    df = df[ok].copy()
+    for target in TARGETS:
+        df[target] = df[target].astype(str).str.strip()
+    return df
+
+
+@dataclass
+class GateReport:
+    total: int = 0
+    accepted: int = 0
+    min_confidence: float = 0.0
+    untrained: list = field(default_factory=list)
+
+    def __str__(self) -> str:
+        share = self.accepted / self.total if self.total else 0.0
+        note = f"; untrained targets always escalate: {self.untrained}" if self.untrained else ""
+        return (f"[local model] {self.accepted}/{self.total} reviews accepted at confidence >= {self.min_confidence} "
+                f"({share:.1%} of LLM calls skipped); {self.total - self.accepted} escalated to LLM{note}")
+
+
+class LocalClassifier:
+    def __init__(self, n_features: int = 2 ** 20, min_class_count: int = 5):
+        """
+        n_features: hash space of the word and character n-gram features.
+        min_class_count: labels with fewer examples are not learnt. A target left with fewer than
+        two learnable labels is not trained and its reviews escalate to the LLM: a model that
+        never saw the other label (e.g. no ads, since the rule pre-filter took the obvious ones
+        out of the training data) would wave through exactly the cases it cannot recognise.
+        """
+        self.n_features = n_features
+        self.min_class_count = min_class_count
+        self.models = {}
+
+    def _features(self, df: pd.DataFrame):
+        from scipy.sparse import hstack
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        docs = _documents(df)
+        words = HashingVectorizer(n_features=self.n_features, ngram_range=(1, 2), alternate_sign=False)
+        chars = HashingVectorizer(n_features=self.n_features, analyzer="char_wb", ngram_range=(3, 5),
+                                  alternate_sign=False)
+        return hstack([words.transform(docs), chars.transform(docs)]).tocsr()
+
+    def fit(self, df: pd.DataFrame):
+        """df: output of training_frame(), i.e. text (+ category) and the six label columns."""
+        from sklearn.calibration import CalibratedClassifierCV
+        from sklearn.linear_model import SGDClassifier
+
+        X = self._features(df)
+        self.models = {}
+        for target in TARGETS:
+            counts = df[target].value_counts()
+            usable = counts[counts >= self.min_class_count].index
+            if len(usable) < 2:
+                continue
+            rows = df[target].isin(usable).to_numpy()
+            # sigmoid calibration over cross-validated linear SVMs: the probabilities are what the gate thresholds
+            model = CalibratedClassifierCV(SGDClassifier(loss="hinge", alpha=1e-5, class_weight="balanced"),
+                                           method="sigmoid", cv=min(3, int(counts[usable].min())))
+            self.models[target] = model.fit(X[rows], df[target].to_numpy()[rows])
+        return self
+
+    def predict(self, df: pd.DataFrame) -> tuple:
+        """
+        Returns:
+            tuple: (DataFrame of predicted labels, DataFrame of their calibrated probabilities),
+            both indexed like `df` with one column per target. Untrained targets get confidence 0.
+        """
+        labels = pd.DataFrame(index=df.index, columns=TARGETS, dtype=object)
+        confidence = pd.DataFrame(0.0, index=df.index, columns=TARGETS)
+        if len(df) == 0 or not self.models:
+            return labels, confidence
+        X = self._features(df)
+        for target, model in self.models.items():
+            proba = model.predict_proba(X)
+            best = proba.argmax(axis=1)
+            labels[target] = model.classes_[best]
+            confidence[target] = proba[np.arange(len(best)), best]
+        return labels, confidence
+
+    def split(self, df: pd.DataFrame, min_confidence: float = 0.9) -> tuple:
+        """
+        Accepts a prediction only when every target is at least `min_confidence` sure and the
+        labels are consistent (violations are never scored, non-violations always are).
+
+        Returns:
+            tuple: (dict of index -> result in the LLM's JSON schema for accepted reviews,
+                    list of indexes that still need the LLM,
+                    GateReport)
+        """
+        labels, confidence = self.predict(df)
+        report = GateReport(total=len(df), min_confidence=min_confidence,
+                            untrained=[t for t in TARGETS if t not in self.models])
+        sure = confidence.min(axis=1)
+        violation = (labels[POLICIES] == "Yes").any(axis=1)
+        unscored = (labels[SCORES] == "-").all(axis=1)
+        accept = (sure >= min_confidence) & (violation == unscored)
+
+        decided = {}
+        for idx, row in labels[accept].iterrows():
+            decided[idx] = {**row.to_dict(),
+                            "Extraction Justification": f"[local model] min confidence {sure[idx]:.2f}"}
+        report.accepted = len(decided)
+        return decided, [idx for idx in df.index if idx not in decided], report
+
+    def save(self, path: str = DEFAULT_MODEL_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path: str = DEFAULT_MODEL_PATH) -> "LocalClassifier":
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+def evaluate(model: LocalClassifier, df: pd.DataFrame, thresholds=(0.8, 0.9, 0.95, 0.99)) -> dict:
+    """
+    Agreement with the LLM labels of `df` (a training_frame): per target over all rows, and
+    for each gate threshold the share of rows accepted and the agreement on those rows.
+    """
+    labels, _ = model.predict(df)
+    metrics = {"per_target": {t: float((labels[t] == df[t]).mean()) for t in TARGETS}, "gate": {}}
+    for threshold in thresholds:
+        decided, _, _ = model.split(df, threshold)
+        accepted = list(decided)
+        agree = np.mean([decided[i][t] == df.at[i, t] for i in accepted for t in TARGETS]) if accepted else float("nan")
+        metrics["gate"][threshold] = {"coverage": len(accepted) / len(df) if len(df) else 0.0,
+                                      "agreement": float(agree)}
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local classifier on LLM-labelled reviews")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train = sub.add_parser("train")
+    train.add_argument("--input", nargs="+", default=["moderated_reviews_with_results.parquet"],
+                       help="labelled outputs of LLM_structuring.py (parquet, csv or xlsx)")
+    train.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    train.add_argument("--holdout", type=float, default=0.2, help="share of rows kept back to measure agreement")
+    args = parser.parse_args()
+
+    df = training_frame(pd.concat([storage.read_table(p) for p in args.input], ignore_index=True))
+    if len(df) < 50:
+        raise ValueError(f"Only {len(df)} LLM-labelled rows found; label more reviews before training")
+    test = df.sample(frac=args.holdout, random_state=0)
+    model = LocalClassifier().fit(df.drop(test.index))
+    metrics = evaluate(model, test)
+    print(f"[local model] trained on {len(df) - len(test)} rows; held-out agreement with the LLM:")
+    for target, acc in metrics["per_target"].items():
+        print(f"  {target:<20} {acc:.3f}")
+    for threshold, gate in metrics["gate"].items():
+        print(f"  gate >= {threshold}: {gate['coverage']:.1%} accepted, agreement {gate['agreement']:.3f}")
+
+    # the saved model uses every row; built from the imported module so that it unpickles
+    # outside `python local_classifier.py` too
+    import local_classifier
+    local_classifier.LocalClassifier().fit(df).save(args.model)
+    print(f"[ok] wrote {args.model}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# location-consistency signal computed locally, before the LLM stage
+# a gazetteer of place names (businesses and towns from the meta file, plus US states and
+# nearby cities) is matched against every review; places mentioned far from the reviewed
+# business (e.g. a New York chain on a Vermont listing) lower the review's consistency score
+# usage: python location_consistency.py --meta ../data/meta-Vermont.json --input ../cleaned_data/cleaned_reviews.parquet
+from dataclasses import dataclass
+import argparse
+import re
+import numpy as np
+import pandas as pd
+import storage
+
+EARTH_RADIUS_KM = 6371.0
+# mentions within this distance are always consistent; beyond it the score decays exponentially
+LOCAL_RADIUS_KM = 30.0
+DECAY_KM = 100.0
+# places with more locations than this (chains) get a KD-tree instead of a brute-force distance
+KD_TREE_MIN_POINTS = 32
+
+# approximate geographic centres; a mention of the business's own state is always consistent
+STATES = {
+    "Alabama": ("AL", 32.8, -86.8), "Alaska": ("AK", 64.2, -152.5), "Arizona": ("AZ", 34.3, -111.7),
+    "Arkansas": ("AR", 34.9, -92.4), "California": ("CA", 37.2, -119.5), "Colorado": ("CO", 39.0, -105.5),
+    "Connecticut": ("CT", 41.6, -72.7), "Delaware": ("DE", 39.0, -75.5), "Florida": ("FL", 28.6, -82.4),
+    "Georgia": ("GA", 32.7, -83.4), "Hawaii": ("HI", 20.3, -156.4), "Idaho": ("ID", 44.4, -114.6),
+    "Illinois": ("IL", 40.0, -89.2), "Indiana": ("IN", 39.9, -86.3), "Iowa": ("IA", 42.1, -93.5),
+    "Kansas": ("KS", 38.5, -98.4), "Kentucky": ("KY", 37.5, -85.3), "Louisiana": ("LA", 31.1, -92.0),
+    "Maine": ("ME", 45.4, -69.2), "Maryland": ("MD", 39.0, -76.8), "Massachusetts": ("MA", 42.3, -71.8),
+    "Michigan": ("MI", 44.3, -85.4), "Minnesota": ("MN", 46.3, -94.3), "Mississippi": ("MS", 32.7, -89.7),
+    "Missouri": ("MO", 38.4, -92.5), "Montana": ("MT", 47.0, -109.6), "Nebraska": ("NE", 41.5, -99.8),
+    "Nevada": ("NV", 39.3, -116.6), "New Hampshire": ("NH", 43.7, -71.6), "New Jersey": ("NJ", 40.2, -74.7),
+    "New Mexico": ("NM", 34.4, -106.1), "New York": ("NY", 42.9, -75.5), "North Carolina": ("NC", 35.6, -79.4),
+    "North Dakota": ("ND", 47.5, -100.5), "Ohio": ("OH", 40.3, -82.8), "Oklahoma": ("OK", 35.6, -97.5),
+    "Oregon": ("OR", 43.9, -120.6), "Pennsylvania": ("PA", 40.9, -77.8), "Rhode Island": ("RI", 41.7, -71.5),
+    "South Carolina": ("SC", 33.9, -80.9), "South Dakota": ("SD", 44.4, -100.2), "Tennessee": ("TN", 35.9, -86.4),
+    "Texas": ("TX", 31.5, -99.3), "Utah": ("UT", 39.3, -111.7), "Vermont": ("VT", 44.1, -72.7),
+    "Virginia": ("VA", 37.5, -78.9), "Washington": ("WA", 47.4, -120.5), "West Virginia": ("WV", 38.6, -80.6),
+    "Wisconsin": ("WI", 44.6, -89.9), "Wyoming": ("WY", 43.0, -107.6),
+}
+CITIES = {
+    "New York City": (40.71, -74.01), "NYC": (40.71, -74.01), "Manhattan": (40.78, -73.97),
+    "Brooklyn": (40.68, -73.94), "Boston": (42.36, -71.06), "Philadelphia": (39.95, -75.17),
+    "Chicago": (41.88, -87.63), "Los Angeles": (34.05, -118.24), "San Francisco": (37.77, -122.42),
+    "Miami": (25.76, -80.19), "Montreal": (45.50, -73.57), "Toronto": (43.65, -79.38), "Quebec City": (46.81, -71.21),
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def tokenize(text: str) -> tuple:
+    return tuple(_TOKEN.findall(str(text).lower()))
+
+
+def _unit_vectors(lat, lon) -> np.ndarray:
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def parse_address(address) -> tuple:
+    """'Name, 1 Main St, Burlington, VT 05401' -> ('Burlington', 'VT'); (None, None) if unparseable."""
+    parts = [p.strip() for p in str(address).split(",")] if isinstance(address, str) else []
+    if len(parts) < 2:
+        return None, None
+    state = parts[-1].split()[0] if parts[-1] else ""
+    if not re.fullmatch(r"[A-Z]{2}", state):
+        return None, None
+    return parts[-2] or None, state
+
+
+def consistency_from_distance(distance_km: np.ndarray) -> np.ndarray:
+    """1.0 for no or local mentions, decaying towards 0 for places far from the business."""
+    excess = np.maximum(0.0, np.nan_to_num(distance_km, nan=0.0) - LOCAL_RADIUS_KM)
+    return np.exp(-excess / DECAY_KM)
+
+
+@dataclass
+class LocationReport:
+    total: int = 0
+    with_mentions: int = 0
+    inconsistent: int = 0
+    threshold: float = 0.5
+
+    def __str__(self) -> str:
+        share = self.inconsistent / self.total if self.total else 0.0
+        return (f"[location] {self.total} reviews, {self.with_mentions} mention a known place, "
+                f"{self.inconsistent} ({share:.1%}) score below {self.threshold} (place far from the business)")
+
+
+class Gazetteer:
+    def __init__(self, min_name_chars: int = 5):
+        """
+        Place names -> coordinates. A name can have several locations (chains, or a town
+        that shares a state's name); distances use the closest one.
+        min_name_chars: single-word names shorter than this are not indexed (too ambiguous),
+            unless they are added as curated (the STATES and CITIES entries).
+        """
+        self.min_name_chars = min_name_chars
+        self.names = []
+        self.coords = []       # per place: (k, 2) array of lat/lon
+        self.states = []       # per place: state code if the name is a state, else None
+        self._ids = {}
+        self._trie = {}
+        self._trees = {}
+        self.generic = set()   # words never indexed on their own (category names)
+
+    def add(self, name: str, lat, lon, state: str = None, curated: bool = False):
+        tokens = tokenize(name)
+        if not tokens:
+            return
+        if not curated and len(tokens) == 1 and (len(tokens[0]) < self.min_name_chars or tokens[0] in self.generic):
+            return
+        if not (np.isfinite(lat) and np.isfinite(lon)):
+            return
+        place = self._ids.get(tokens)
+        if place is None:
+            place = self._ids[tokens] = len(self.names)
+            self.names.append(name)
+            self.coords.append([])
+            self.states.append(None)
+            node = self._trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[None] = place
+        self.coords[place].append((lat, lon))
+        if state is not None:
+            self.states[place] = state
+
+    @staticmethod
+    def from_metadata(metadata: pd.DataFrame) -> "Gazetteer":
+        """Businesses and towns of a meta-<state>.json frame, plus STATES and CITIES."""
+        gaz = Gazetteer()
+        categories = metadata["category"].dropna() if "category" in metadata.columns else []
+        gaz.generic = {t for cats in categories if isinstance(cats, (list, np.ndarray))
+                       for c in cats for t in tokenize(c)}
+        meta = metadata.dropna(subset=["latitude", "longitude"])
+        lat, lon = meta["latitude"].to_numpy(float), meta["longitude"].to_numpy(float)
+        for name, la, lo in zip(meta["name"], lat, lon):
+            gaz.add(str(name), la, lo)
+        # towns are placed at the median of their businesses
+        towns = pd.DataFrame({"town": [parse_address(a)[0] for a in meta["address"]],
+                              "lat": lat, "lon": lon}).dropna(subset=["town"])
+        for town, group in towns.groupby("town"):
+            gaz.add(town, group["lat"].median(), group["lon"].median())
+        for state, (code, la, lo) in STATES.items():
+            gaz.add(state, la, lo, state=code, curated=True)
+        for city, (la, lo) in CITIES.items():
+            gaz.add(city, la, lo, curated=True)
+        gaz.coords = [np.array(c, dtype=float) for c in gaz.coords]
+        return gaz
+
+    def find(self, text: str) -> list:
+        """Ids of the places mentioned in `text` (longest match at each word, each place once)."""
+        tokens = tokenize(text)
+        found, i = [], 0
+        while i < len(tokens):
+            node, j, match = self._trie, i, None
+            while j < len(tokens) and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if None in node:
+                    match = (node[None], j)
+            if match is None:
+                i += 1
+                continue
+            if match[0] not in found:
+                found.append(match[0])
+            i = match[1]
+        return found
+
+    def _distances(self, place: int, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        # km from each (lat, lon) to the closest location of `place`
+        points = self.coords[place]
+        if len(points) < KD_TREE_MIN_POINTS:
+            return haversine_km(lat[:, None], lon[:, None], points[None, :, 0], points[None, :, 1]).min(axis=1)
+        tree = self._trees.get(place)
+        if tree is None:
+            from scipy.spatial import cKDTree
+            tree = self._trees[place] = cKDTree(_unit_vectors(points[:, 0], points[:, 1]))
+        chord, _ = tree.query(_unit_vectors(lat, lon))
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+    def score(self, df: pd.DataFrame, batch_size: int = 100_000) -> pd.DataFrame:
+        """
+        Location signal for every review of a cleaned frame (text, name, address, latitude, longitude).
+
+        Returns:
+            DataFrame indexed like `df`: location_mentions (names of mentioned places other than
+            the business itself), location_distance_km (distance to the farthest of them, NaN if
+            none) and location_consistency (1.0 = nothing mentioned far away).
+        """
+        parts = [self._score_batch(df.iloc[k:k + batch_size]) for k in range(0, len(df), batch_size)]
+        return pd.concat(parts) if parts else pd.DataFrame(
+            columns=["location_mentions", "location_distance_km", "location_consistency"])
+
+    def _score_batch(self, df: pd.DataFrame) -> pd.DataFrame:
+        own = [self._ids.get(tokenize(n)) for n in df["name"]]
+        mentions = [[p for p in self.find(t) if p != o] for t, o in zip(df["text"], own)]
+        rows = np.repeat(np.arange(len(df)), [len(m) for m in mentions])
+        places = np.fromiter((p for m in mentions for p in m), dtype=np.int64, count=len(rows))
+
+        lat, lon = df["latitude"].to_numpy(float), df["longitude"].to_numpy(float)
+        own_state = np.array([parse_address(a)[1] for a in df["address"]], dtype=object)
+        distance = np.full(len(rows), np.nan)
+        order = np.argsort(places, kind="stable")
+        bounds = np.flatnonzero(np.diff(places[order])) + 1
+        for group in np.split(order, bounds) if len(order) else []:
+            place = places[group[0]]
+            r = rows[group]
+            distance[group] = self._distances(place, lat[r], lon[r])
+            if self.states[place] is not None:
+                distance[group[own_state[r] == self.states[place]]] = 0.0
+
+        farthest = np.full(len(df), np.nan)
+        valid = ~np.isnan(distance)
+        np.fmax.at(farthest, rows[valid], distance[valid])
+        return pd.DataFrame({
+            "location_mentions": [[self.names[p] for p in m] for m in mentions],
+            "location_distance_km": farthest,
+            "location_consistency": consistency_from_distance(farthest),
+        }, index=df.index)
+
+
+def add_location_scores(df: pd.DataFrame, gazetteer: Gazetteer, threshold: float = 0.5) -> tuple:
+    """Returns (df with the three location columns, LocationReport)."""
+    scores = gazetteer.score(df)
+    report = LocationReport(total=len(df), with_mentions=int((scores["location_mentions"].str.len() > 0).sum()),
+                            inconsistent=int((scores["location_consistency"] < threshold).sum()), threshold=threshold)
+    return df.join(scores), report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score reviews for mentions of places far from the business")
+    parser.add_argument("--meta", default="../data/meta-Vermont.json")
+    parser.add_argument("--input", default="../cleaned_data/cleaned_reviews.parquet", help="parquet, csv or xlsx")
+    parser.add_argument("--output", default=None, help="optionally write the scored table (parquet, csv or xlsx)")
+    parser.add_argument("--threshold", type=float, default=0.5, help="consistency below which a review is listed")
+    args = parser.parse_args()
+
+    gazetteer = Gazetteer.from_metadata(pd.read_json(args.meta, lines=True))
+    print(f"[location] gazetteer of {len(gazetteer.names)} places")
+    df, report = add_location_scores(storage.read_table(args.input), gazetteer, args.threshold)
+    print(report)
+    flagged = df[df["location_consistency"] < args.threshold]
+    print(flagged[["name", "location_mentions", "location_distance_km", "text"]].head(20).to_string())
+    if args.output:
+        storage.write_table(df, args.output)
+
+
+if __name__ == "__main__":
+    main()
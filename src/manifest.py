@@ -0,0 +1,157 @@
+# manifest of reviews already preprocessed, so daily runs only clean and label what is new
+# one directory holds:
+# - reviews.parquet: a 64-bit hash of every review key (gmap_id, user_id, time) and of its content
+# - texts.parquet: hashes of every review text already emitted (duplicates are dropped across runs)
+# - state.json: the high-water mark (newest review time seen) and the delta partitions written so far
+# - delta-<n>-<timestamp>.parquet: the cleaned new/changed rows of each incremental run
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import storage
+
+KEY_COLUMNS = ["gmap_id", "user_id", "time"]
+# a review whose key is known but whose text differs has been edited and is emitted again
+# (the text is all the labelling stage looks at, so e.g. a rating-only edit is not re-emitted)
+CONTENT_COLUMNS = ["text"]
+
+
+def _hash_columns(df: pd.DataFrame, columns: list) -> np.ndarray:
+    # cast to str first, so ids and times parsed as int in one dump and str/float in another hash alike
+    return pd.util.hash_pandas_object(df[columns].astype(str), index=False).to_numpy()
+
+
+def review_keys(reviews: pd.DataFrame) -> np.ndarray:
+    return _hash_columns(reviews, KEY_COLUMNS)
+
+
+def content_digests(reviews: pd.DataFrame) -> np.ndarray:
+    return _hash_columns(reviews, CONTENT_COLUMNS)
+
+
+def _write_atomic(df: pd.DataFrame, path: str):
+    df.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+class ReviewManifest:
+    def __init__(self, directory: str):
+        """
+        directory: created if missing; an empty directory is an empty manifest (first run).
+        Nothing is persisted until `save()`, so a run that crashes is simply redone.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.high_water_mark = None
+        self.partitions = []
+
+        state_path = os.path.join(directory, "state.json")
+        if os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.high_water_mark = state["high_water_mark"]
+            self.partitions = state["partitions"]
+
+        reviews_path = os.path.join(directory, "reviews.parquet")
+        if os.path.exists(reviews_path):
+            known = pd.read_parquet(reviews_path)
+            self._digests = pd.Series(known["digest"].to_numpy(), index=known["key"].to_numpy())
+        else:
+            self._digests = pd.Series([], index=np.array([], dtype=np.uint64), dtype=np.uint64)
+
+        # keys recorded by this run; merged into the stored digests once, by save()
+        self._pending = {}
+
+        texts_path = os.path.join(directory, "texts.parquet")
+        self.seen_texts = set(pd.read_parquet(texts_path)["text_hash"].tolist()) if os.path.exists(texts_path) else set()
+
+    def classify(self, reviews: pd.DataFrame) -> tuple:
+        """
+        Splits a review frame into rows to process and rows already processed unchanged.
+
+        Rows newer than the high-water mark are new without a lookup; older rows (late
+        arrivals and edits) are checked against the stored key -> content digest.
+
+        Returns:
+            (keys, digests, mask, counts): key/content hashes of every row, a boolean mask of the
+            new or changed rows, and {"new": ..., "changed": ..., "unchanged": ...}.
+        """
+        keys, digests = review_keys(reviews), content_digests(reviews)
+        after_mark = np.ones(len(reviews), dtype=bool) if self.high_water_mark is None \
+            else reviews["time"].to_numpy() > self.high_water_mark
+
+        known = np.zeros(len(reviews), dtype=bool)
+        changed = np.zeros(len(reviews), dtype=bool)
+        lookup = ~after_mark
+        if lookup.any():
+            positions = self._digests.index.get_indexer(keys[lookup])
+            found = positions >= 0
+            stored = self._digests.to_numpy()[positions[found]]
+            idx = np.flatnonzero(lookup)
+            known[idx[found]] = True
+            changed[idx[found]] = stored != digests[idx[found]]
+            if self._pending:
+                # keys recorded earlier in this run win over the stored ones
+                for j in idx:
+                    digest = self._pending.get(int(keys[j]))
+                    if digest is not None:
+                        known[j], changed[j] = True, digest != int(digests[j])
+
+        counts = {"new": int((~known).sum()), "changed": int(changed.sum()),
+                  "unchanged": int((known & ~changed).sum())}
+        return keys, digests, ~known | changed, counts
+
+    def record(self, keys: np.ndarray, digests: np.ndarray, times):
+        """
+        Marks these reviews as processed (later records of the same key win). Costs O(len(keys));
+        the stored digests are only rewritten by save().
+        """
+        self._pending.update(zip(keys.tolist(), digests.tolist()))
+        if len(times):
+            newest = int(times.max())
+            self.high_water_mark = newest if self.high_water_mark is None else max(self.high_water_mark, newest)
+
+    def new_partition_path(self) -> str:
+        name = f"delta-{len(self.partitions) + 1:05d}-{time.strftime('%Y%m%dT%H%M%S')}.parquet"
+        return os.path.join(self.directory, name)
+
+    def add_partition(self, path: str, rows: int):
+        self.partitions.append({"file": os.path.basename(path), "rows": rows,
+                                "created": time.strftime("%Y-%m-%d %H:%M:%S")})
+
+    def partition_paths(self) -> list:
+        return [os.path.join(self.directory, p["file"]) for p in self.partitions]
+
+    def read_partitions(self) -> pd.DataFrame:
+        """
+        All delta partitions as one cleaned table; an edited review keeps only its latest version.
+        """
+        frames = [storage.read_table(p) for p in self.partition_paths()]
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True)
+        return df.drop_duplicates(subset=["review_key"], keep="last").reset_index(drop=True)
+
+    def _merged_digests(self) -> pd.Series:
+        if not self._pending:
+            return self._digests
+        update = pd.Series(np.fromiter(self._pending.values(), dtype=np.uint64, count=len(self._pending)),
+                           index=np.fromiter(self._pending.keys(), dtype=np.uint64, count=len(self._pending)))
+        return pd.concat([self._digests[~self._digests.index.isin(update.index)], update])
+
+    def save(self):
+        self._digests, self._pending = self._merged_digests(), {}
+        _write_atomic(pd.DataFrame({"key": self._digests.index.to_numpy(dtype=np.uint64),
+                                    "digest": self._digests.to_numpy(dtype=np.uint64)}),
+                      os.path.join(self.directory, "reviews.parquet"))
+        _write_atomic(pd.DataFrame({"text_hash": np.fromiter(self.seen_texts, dtype=np.uint64,
+                                                             count=len(self.seen_texts))}),
+                      os.path.join(self.directory, "texts.parquet"))
+        state_path = os.path.join(self.directory, "state.json")
+        with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"high_water_mark": self.high_water_mark, "partitions": self.partitions}, f, indent=2)
+        os.replace(state_path + ".tmp", state_path)
+
+    def __len__(self):
+        return len(self._merged_digests())
@@ -0,0 +1,84 @@
+# asyncio batch moderation engine
+# keeps up to `concurrency` LLM requests in flight and writes results back in row order
+import asyncio
+import time
+
+
+async def _moderate_one(idx, prompt, client, semaphore, timeout, parse):
+    async with semaphore:
+        try:
+            response = await asyncio.wait_for(client.call_LLM(prompt), timeout=timeout)
+        except asyncio.TimeoutError:
+            return idx, {"error": f"Timed out after {timeout}s", "raw_response": None}
+    return idx, parse(response)
+
+
+async def moderate_prompts(prompts: list, client, concurrency: int = 32, timeout: float = 60.0, parse=None,
+                           on_result=None, progress: bool = True) -> list:
+    """
+    Sends every prompt to `client.call_LLM` with at most `concurrency` requests in flight.
+
+    Args:
+        prompts (list): list of message lists, one per review.
+        client: any object with an async `call_LLM(prompt)` method (e.g. LLMClient.AsyncLLMClient).
+        concurrency (int): maximum number of in-flight requests.
+        timeout (float): per-request timeout in seconds (None = no limit; retries included).
+        parse (callable): turns the raw response into a result dict. Defaults to returning it unchanged.
+        on_result (callable): called as on_result(index, result) as soon as each result arrives
+            (e.g. to journal it), in completion order.
+        progress (bool): print throughput every 100 results (off for small service batches).
+
+    Returns:
+        list: one result per prompt, in the same order as `prompts`.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    if parse is None:
+        parse = lambda response: response
+
+    semaphore = asyncio.Semaphore(concurrency)
+    results = [None] * len(prompts)
+    tasks = [
+        asyncio.create_task(_moderate_one(i, p, client, semaphore, timeout, parse))
+        for i, p in enumerate(prompts)
+    ]
+
+    start = time.perf_counter()
+    done = 0
+    for finished in asyncio.as_completed(tasks):
+        idx, parsed = await finished
+        results[idx] = parsed
+        if on_result is not None:
+            on_result(idx, parsed)
+        done += 1
+        if progress and (done % 100 == 0 or done == len(tasks)):
+            elapsed = time.perf_counter() - start
+            print(f"[engine] {done}/{len(tasks)} done ({done / elapsed:.1f} reviews/s)")
+
+    return results
+
+
+def run_with_client(client, make_coroutine):
+    """
+    Runs `make_coroutine()` on a fresh event loop and closes the client afterwards if it
+    supports it. Lets one script drive several passes over the same client.
+    """
+    async def _run():
+        try:
+            return await make_coroutine()
+        finally:
+            if hasattr(client, "close"):
+                await client.close()
+
+    return asyncio.run(_run())
+
+
+def run_moderation(prompts: list, client, concurrency: int = 32, timeout: float = 60.0, parse=None,
+                   on_result=None) -> list:
+    """
+    Synchronous entry point for scripts: runs `moderate_prompts` on a fresh event loop
+    and closes the client afterwards if it supports it.
+    """
+    return run_with_client(
+        client, lambda: moderate_prompts(prompts, client, concurrency, timeout, parse, on_result)
+    )
@@ -0,0 +1,345 @@
+# long-running moderation service for reviews as they are posted
+# reviews arrive one per HTTP request and are coalesced into micro-batches (up to --max-batch
+# reviews or --max-wait-ms after the first one), which then go through the rule pre-filter, the
+# response cache and the LLM like LLM_structuring.py. When --max-queue reviews are waiting, new
+# requests are answered 429 straight away instead of queueing without bound.
+# usage: OPENAI_API_KEY=... python moderation_service.py --port 8080
+#        curl -X POST localhost:8080/moderate -d '{"text": "Great pizza", "name": "Luigi", "category": ["Pizza restaurant"]}'
+#        curl localhost:8080/stats      # latency percentiles, SLO compliance, throughput
+#        curl localhost:8080/metrics    # Prometheus text format
+# load test against a stub LLM: python -m benchmarks.bench_service
+import argparse
+import asyncio
+import json
+import time
+import pandas as pd
+import helper
+from LLM_structuring import generate_review_prompt, make_prompt_builder, moderate_rows, parse_response, row_to_location
+from LLMClient import AsyncLLMClient, REQUEST_PARAMS
+from instrumentation import metrics
+from prefilter import Prefilter
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache, DEFAULT_CACHE_PATH, cache_key
+
+# review fields used to build the prompt; anything else in the request body is ignored
+REVIEW_FIELDS = ["text", "gmap_id", "name", "category", "address", "hours", "time"]
+MAX_BODY_BYTES = 1_000_000
+
+
+class QueueFull(Exception):
+    pass
+
+
+def reviews_frame(reviews: list) -> pd.DataFrame:
+    """One row per posted review, with the columns row_to_location expects."""
+    df = pd.DataFrame([{f: r.get(f) for f in REVIEW_FIELDS} for r in reviews], columns=REVIEW_FIELDS)
+    # raw review-*.json timestamps are Unix milliseconds; strings are used as given
+    df["time"] = [helper.unix_to_vermont_time(int(t) // 1000) if isinstance(t, (int, float)) else t
+                  for t in df["time"]]
+    df["text"] = df["text"].astype(str)
+    return df
+
+
+class MicroBatcher:
+    def __init__(self, process, max_batch: int = 16, max_wait: float = 0.05, max_queue: int = 1000,
+                 max_inflight: int = 8):
+        """
+        process: async callable(list of items) -> list of results, one per item.
+        max_batch / max_wait: a batch is closed at `max_batch` items or `max_wait` seconds after its
+            first item arrived, whichever comes first.
+        max_queue: items waiting for a batch; submit() raises QueueFull beyond it.
+        max_inflight: batches processed concurrently; when all are busy the queue fills up.
+        """
+        self.process = process
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.slots = asyncio.Semaphore(max_inflight)
+        self.inflight = 0
+
+    async def submit(self, item):
+        """Queues `item` and waits for its result; raises QueueFull if the queue is full."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((item, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise QueueFull() from None
+        return await future
+
+    async def _next_batch(self) -> list:
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run_batch(self, batch: list):
+        started = time.perf_counter()
+        for _, _, queued in batch:
+            metrics.observe("service_queue_wait_seconds", started - queued)
+        metrics.inc("service_batches_total")
+        metrics.inc("service_batched_reviews_total", len(batch))
+        try:
+            results = await self.process([item for item, _, _ in batch])
+        except Exception as e:
+            print(f"[service] batch of {len(batch)} failed: {e}")
+            results = [{"error": f"Moderation failed: {e}"}] * len(batch)
+        finally:
+            self.inflight -= 1
+            self.slots.release()
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():  # the client may have disconnected
+                future.set_result(result)
+
+    async def run(self):
+        tasks = set()
+        while True:
+            # wait for a free slot before forming the next batch, so a slow backend lets the
+            # queue (and then the 429s) absorb the excess instead of piling up tasks
+            await self.slots.acquire()
+            batch = await self._next_batch()
+            self.inflight += 1
+            task = asyncio.create_task(self._run_batch(batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+
+class ModerationService:
+    def __init__(self, client, cache: ResponseCache = None, prefilter: Prefilter = None, builder=None,
+                 llm_batch_size: int = 1, concurrency: int = 32, slo: float = 1.0, **batcher_options):
+        """
+        client: AsyncLLMClient (without a cache: the service caches per review itself, so packed
+            --llm-batch-size prompts still share cache entries with single-review runs).
+        slo: latency objective in seconds; /stats reports the share of requests within it.
+        batcher_options: max_batch, max_wait, max_queue, max_inflight (see MicroBatcher).
+        """
+        self.client = client
+        self.cache = cache
+        self.prefilter = prefilter
+        self.builder = builder or make_prompt_builder()
+        self.llm_batch_size = llm_batch_size
+        self.concurrency = concurrency
+        self.slo = slo
+        self.batcher = MicroBatcher(self.label, **batcher_options)
+        self.started = time.time()
+
+    async def label(self, reviews: list) -> list:
+        """Labels one micro-batch: rules first, then the cache, then the LLM for the rest."""
+        df = reviews_frame(reviews)
+        results, sources = {}, {}
+        if self.prefilter is not None:
+            decided, pending, _ = self.prefilter.split(df["text"], df["name"])
+            results.update(decided)
+            sources.update({i: "prefilter" for i in decided})
+        else:
+            pending = list(df.index)
+
+        keys = {}
+        for i in pending:
+            prompt = generate_review_prompt(df.at[i, "text"], row_to_location(df.loc[i]), self.builder)
+            keys[i] = cache_key(self.client.model, prompt, **REQUEST_PARAMS)
+            cached = self.cache.get(keys[i]) if self.cache is not None else None
+            if cached is not None:
+                parsed = parse_response(cached)
+                if "invalid_fields" not in parsed:
+                    results[i], sources[i] = parsed, "cache"
+        to_llm = [i for i in pending if i not in results]
+
+        if to_llm:
+            labelled = await moderate_rows(df, to_llm, self.client, self.builder, self.llm_batch_size,
+                                           self.concurrency, progress=False)
+            for i, parsed in labelled.items():
+                results[i], sources[i] = parsed, "llm"
+                if self.cache is not None and "error" not in parsed:
+                    self.cache.set(keys[i], json.dumps(parsed))
+
+        out = []
+        for i in df.index:
+            source = sources.get(i, "none")
+            metrics.inc(f"service_{source}_total")
+            out.append({**results.get(i, {"error": "Not labelled"}), "source": source})
+        return out
+
+    async def moderate(self, review: dict) -> dict:
+        start = time.perf_counter()
+        metrics.inc("service_requests_total")
+        try:
+            result = await self.batcher.submit(review)
+        except QueueFull:
+            metrics.inc("service_rejected_total")
+            raise
+        latency = time.perf_counter() - start
+        metrics.observe("service_latency_seconds", latency)
+        metrics.inc("service_completed_total")
+        metrics.inc("service_slo_met_total" if latency <= self.slo else "service_slo_missed_total")
+        return result
+
+    def stats(self) -> dict:
+        snap = metrics.snapshot()
+        c, h = snap["counters"], snap["histograms"]
+        latency = h.get("service_latency_seconds", {})
+        wait = h.get("service_queue_wait_seconds", {})
+        completed = c.get("service_completed_total", 0)
+        ms = lambda v: round(v * 1000, 1) if v is not None else None
+        return {
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "requests": int(c.get("service_requests_total", 0)),
+            "completed": int(completed),
+            "rejected": int(c.get("service_rejected_total", 0)),
+            "queued": self.batcher.queue.qsize(),
+            "inflight_batches": self.batcher.inflight,
+            "reviews_per_second": round(completed / (time.time() - self.started), 1),
+            "latency_ms": {q: ms(latency.get(q)) for q in ("p50", "p95", "p99")},
+            "queue_wait_ms": {q: ms(wait.get(q)) for q in ("p50", "p95", "p99")},
+            "slo_ms": ms(self.slo),
+            "slo_met": c.get("service_slo_met_total", 0) / completed if completed else None,
+            "mean_batch_size": (c.get("service_batched_reviews_total", 0) / c["service_batches_total"]
+                                if c.get("service_batches_total") else None),
+            "sources": {s: int(c.get(f"service_{s}_total", 0)) for s in ("prefilter", "cache", "llm", "none")},
+            "llm_calls": int(c.get("llm_calls_total", 0)),
+        }
+
+    # ---- HTTP/1.1 (keep-alive) on asyncio streams: POST /moderate, GET /stats, /metrics, /healthz ----
+
+    async def _route(self, method: str, path: str, body: bytes) -> tuple:
+        if method == "POST" and path == "/moderate":
+            try:
+                review = json.loads(body or b"{}")
+            except ValueError:
+                return 400, {"error": "body is not valid JSON"}, {}
+            if not isinstance(review, dict) or not review.get("text"):
+                return 400, {"error": "expected a JSON object with a non-empty 'text'"}, {}
+            try:
+                return 200, await self.moderate(review), {}
+            except QueueFull:
+                return 429, {"error": "moderation queue is full, retry later"}, {"Retry-After": "1"}
+        if method == "GET" and path == "/stats":
+            return 200, self.stats(), {}
+        if method == "GET" and path == "/metrics":
+            return 200, metrics.to_prometheus(), {}
+        if method == "GET" and path == "/healthz":
+            return 200, {"status": "ok"}, {}
+        return 404, {"error": f"unknown endpoint {method} {path}"}, {}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    status, payload, extra = 413, {"error": "request body too large"}, {}
+                    headers["connection"] = "close"
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload, extra = await self._route(method, target.split("?")[0].rstrip("/"), body)
+
+                if isinstance(payload, str):
+                    data, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+                else:
+                    data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+                head = [f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}",
+                        f"Content-Type: {content_type}", f"Content-Length: {len(data)}"]
+                head += [f"{k}: {v}" for k, v in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> asyncio.AbstractServer:
+        """Starts the batcher and the HTTP listener on the running loop (port 0 = any free port)."""
+        self._batcher_task = asyncio.create_task(self.batcher.run())
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def close(self):
+        self._batcher_task.cancel()
+        await self.client.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+def build_service(args) -> ModerationService:
+    client = AsyncLLMClient(model=args.model, base_url=args.base_url, timeout=args.timeout,
+                            rate_limiter=RateLimiter(args.rpm, args.tpm), max_concurrency=args.concurrency)
+    return ModerationService(
+        client,
+        cache=None if args.no_cache else ResponseCache(args.cache_path),
+        prefilter=None if args.no_prefilter else Prefilter(),
+        builder=make_prompt_builder(args.max_prompt_tokens or None, args.model),
+        llm_batch_size=args.llm_batch_size, concurrency=args.concurrency, slo=args.slo_ms / 1000,
+        max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000, max_queue=args.max_queue,
+        max_inflight=args.max_inflight,
+    )
+
+
+def add_service_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint, e.g. a local fake server")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-attempt LLM request timeout in seconds")
+    parser.add_argument("--rpm", type=float, default=None, help="requests/min budget (also learnt from rate-limit headers)")
+    parser.add_argument("--tpm", type=float, default=None, help="tokens/min budget (also learnt from rate-limit headers)")
+    parser.add_argument("--concurrency", type=int, default=32, help="maximum number of in-flight LLM requests")
+    parser.add_argument("--max-batch", type=int, default=16, help="reviews per micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=50.0,
+                        help="longest a review waits for its micro-batch to fill")
+    parser.add_argument("--max-queue", type=int, default=1000,
+                        help="reviews waiting for a batch before new requests get 429")
+    parser.add_argument("--max-inflight", type=int, default=8, help="micro-batches processed concurrently")
+    parser.add_argument("--llm-batch-size", type=int, default=1,
+                        help="reviews packed into one LLM request (1 = one review per request)")
+    parser.add_argument("--max-prompt-tokens", type=int, default=4000,
+                        help="per-request prompt token budget (0 = no limit)")
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="latency objective reported by /stats")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="on-disk LLM response cache")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--no-prefilter", action="store_true")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP moderation service with micro-batching")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_service_arguments(parser)
+    args = parser.parse_args()
+
+    async def serve():
+        service = build_service(args)
+        server = await service.start(args.host, args.port)
+        print(f"[service] listening on http://{args.host}:{args.port} (POST /moderate, GET /stats, /metrics)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            print(f"[service] {json.dumps(service.stats())}")
+            await service.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
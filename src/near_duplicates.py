@@ -0,0 +1,243 @@
+# near-duplicate review clustering with MinHash + LSH
+# spam campaigns post slightly varied copies of one ad across many businesses; each cluster of
+# near-identical texts is labelled once (its representative) and its text-only policy flags are
+# copied to the rest (see member_result)
+# usage: python near_duplicates.py --input ../cleaned_data/cleaned_reviews.parquet --min-size 5
+import argparse
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import helper
+import storage
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+# labels that follow from the text alone and so carry over to the other reviews of a cluster;
+# Irrelevant Review and the scores depend on each review's own business and are not copied
+PROPAGATED_FIELDS = ["Advertisement", "False Review", "Vulgar Language"]
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer: spreads the rolling hash of a shingle over all 64 bits
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def shingle_hashes(texts: list, k: int = 5) -> tuple:
+    """
+    Hashes of every k-byte shingle of every text, computed over one concatenated buffer.
+
+    Returns:
+        (hashes, starts): 32-bit shingle hashes grouped by text, and the offset of each
+        text's first shingle in `hashes` (every text has at least one shingle).
+    """
+    encoded = [helper.normalize_whitespace(str(t)).lower().encode("utf-8").ljust(k) for t in texts]
+    lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+    buf = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+
+    # polynomial hash of each k-byte window, vectorized over the whole buffer
+    n_windows = len(buf) - k + 1
+    rolling = np.zeros(n_windows, dtype=np.uint64)
+    for j in range(k):
+        rolling = rolling * np.uint64(257) + buf[j:j + n_windows]
+
+    # keep only windows that lie inside one text
+    text_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    window_counts = lengths - k + 1
+    valid = np.repeat(text_starts, window_counts) + \
+        (np.arange(window_counts.sum()) - np.repeat(np.cumsum(window_counts) - window_counts, window_counts))
+    hashes = _mix(rolling[valid]) >> np.uint64(32)
+    starts = np.concatenate(([0], np.cumsum(window_counts)[:-1]))
+    return hashes, starts
+
+
+def minhash_signatures(texts: list, num_perm: int = 64, k: int = 5, seed: int = 0) -> np.ndarray:
+    """
+    (len(texts), num_perm) MinHash signatures; the share of equal positions between two rows
+    estimates the Jaccard similarity of the texts' shingle sets.
+    """
+    hashes, starts = shingle_hashes(texts, k)
+    rng = np.random.default_rng(seed)
+    # multiply-shift hashing: (a * h + b) mod 2^64, keeping the high 32 bits
+    a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+    sig = np.empty((len(texts), num_perm), dtype=np.uint32)
+    with np.errstate(over="ignore"):
+        for p in range(num_perm):
+            permuted = ((a[p] * hashes + b[p]) & _MASK64) >> np.uint64(32)
+            sig[:, p] = np.minimum.reduceat(permuted, starts)
+    return sig
+
+
+def lsh_bands(num_perm: int, threshold: float) -> tuple:
+    """
+    Picks (bands, rows) with bands * rows == num_perm whose LSH threshold (1/bands)^(1/rows)
+    is as high as possible without exceeding `threshold`, so true matches are rarely missed.
+    Candidates are verified afterwards, which removes the extra false positives.
+    """
+    options = [(num_perm // r, r) for r in range(1, num_perm + 1) if num_perm % r == 0]
+    below = [(b, r) for b, r in options if (1 / b) ** (1 / r) <= threshold]
+    return max(below, key=lambda br: (1 / br[0]) ** (1 / br[1])) if below else options[0]
+
+
+def _connected_components(n: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    # min-label propagation; each row ends up labelled with the smallest row in its component
+    labels = np.arange(n)
+    while True:
+        low = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, low)
+        np.minimum.at(updated, right, low)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def cluster_texts(texts: list, threshold: float = 0.8, num_perm: int = 64, k: int = 5,
+                  min_length: int = 40) -> np.ndarray:
+    """
+    Groups texts whose estimated Jaccard similarity (over k-character shingles) is at least
+    `threshold`. Returns, per text, the position of its cluster's first text.
+
+    Texts shorter than `min_length` characters stay in clusters of their own: short generic
+    reviews ("Great pizza!") repeat across businesses, and whether they are relevant
+    depends on the business, so their labels must not be shared.
+    """
+    positions = np.arange(len(texts))
+    eligible = np.flatnonzero([len(str(t)) >= min_length for t in texts])
+    if len(eligible) > 1:
+        positions[eligible] = eligible[_cluster_positions([texts[i] for i in eligible], threshold, num_perm, k)]
+    return positions
+
+
+def _cluster_positions(texts: list, threshold: float, num_perm: int, k: int) -> np.ndarray:
+    n = len(texts)
+    sig = minhash_signatures(texts, num_perm, k)
+    bands, rows = lsh_bands(num_perm, threshold)
+
+    left, right = [], []
+    for band in range(bands):
+        block = np.ascontiguousarray(sig[:, band * rows:(band + 1) * rows])
+        # texts whose band is identical share a bucket; compare each one with the bucket's first text
+        _, first, bucket = np.unique(block.view(np.dtype((np.void, block.itemsize * rows))).ravel(),
+                                     return_index=True, return_inverse=True)
+        leader = first[bucket]
+        candidates = np.flatnonzero(leader != np.arange(n))
+        if len(candidates) == 0:
+            continue
+        similarity = (sig[candidates] == sig[leader[candidates]]).mean(axis=1)
+        keep = candidates[similarity >= threshold]
+        left.append(keep)
+        right.append(leader[keep])
+
+    if not left:
+        return np.arange(n)
+    return _connected_components(n, np.concatenate(left), np.concatenate(right))
+
+
+@dataclass
+class DedupReport:
+    total: int = 0
+    representatives: int = 0
+    clusters: int = 0
+    largest: int = 0
+
+    def __str__(self) -> str:
+        skipped = self.total - self.representatives
+        share = skipped / self.total if self.total else 0.0
+        return (f"[dedup] {self.total} reviews -> {self.representatives} sent to LLM; {skipped} near-duplicates "
+                f"in {self.clusters} clusters reuse their representative's label ({share:.1%} of LLM calls "
+                f"skipped); largest cluster: {self.largest}")
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, shingle_size: int = 5, min_length: int = 40):
+        """
+        threshold: minimum estimated Jaccard similarity of two reviews' character shingles
+        for them to share a label. num_perm trades accuracy of that estimate for speed.
+        Reviews shorter than min_length characters are never merged (see cluster_texts).
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.min_length = min_length
+
+    def cluster(self, texts: pd.Series) -> pd.Series:
+        """Cluster id of every review: the index label of the first review in its cluster."""
+        positions = cluster_texts(texts.tolist(), self.threshold, self.num_perm, self.shingle_size, self.min_length)
+        return pd.Series(texts.index.to_numpy()[positions], index=texts.index)
+
+    def split(self, texts: pd.Series) -> tuple:
+        """
+        Returns:
+            tuple: (list of indexes to send to the LLM (one per cluster),
+                    dict of representative index -> indexes that copy its label,
+                    DedupReport)
+        """
+        clusters = self.cluster(texts)
+        followers = {}
+        for idx, rep in clusters.items():
+            if idx != rep:
+                followers.setdefault(rep, []).append(idx)
+        representatives = [idx for idx, rep in clusters.items() if idx == rep]
+        report = DedupReport(total=len(texts), representatives=len(representatives), clusters=len(followers),
+                             largest=max((len(m) + 1 for m in followers.values()), default=1 if len(texts) else 0))
+        return representatives, followers, report
+
+
+def member_result(result: dict, cluster_id: str) -> dict:
+    """
+    The label of a cluster member, from its representative's `result`: the PROPAGATED_FIELDS
+    flags are copied, Irrelevant Review is left unset and the scores are "-", since the member
+    may belong to another business. Errors are kept, so members are retried with their representative.
+    """
+    member = {field: result.get(field) for field in PROPAGATED_FIELDS}
+    member.update({
+        "Irrelevant Review": None, "Relevance Score": "-", "Quality Score": "-",
+        "Extraction Justification": (
+            f"[near-duplicate of {cluster_id}] {', '.join(PROPAGATED_FIELDS)} copied from the cluster's "
+            f"representative; relevance and scores were not evaluated for this business."
+        ),
+        "cluster_id": cluster_id,
+    })
+    for key in ("error", "invalid_fields"):
+        if key in result:
+            member[key] = result[key]
+    return member
+
+
+def campaigns(df: pd.DataFrame, clusters: pd.Series, min_size: int = 5) -> pd.DataFrame:
+    """
+    Near-duplicate clusters of at least `min_size` reviews, largest first, with the number of
+    distinct businesses they were posted to. Copies spread over many businesses are likely spam.
+    """
+    grouped = df.assign(cluster_id=clusters).groupby("cluster_id")
+    summary = pd.DataFrame({
+        "reviews": grouped.size(),
+        "businesses": grouped["gmap_id"].nunique(),
+        "sample_text": grouped["text"].first(),
+    })
+    return summary[summary["reviews"] >= min_size].sort_values(["businesses", "reviews"], ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate review clusters (likely spam campaigns)")
+    parser.add_argument("--input", default="../cleaned_data/cleaned_reviews.parquet", help="parquet, csv or xlsx")
+    parser.add_argument("--threshold", type=float, default=0.8, help="minimum estimated Jaccard similarity")
+    parser.add_argument("--min-size", type=int, default=5, help="smallest cluster to report")
+    parser.add_argument("--output", default=None, help="optionally write the campaign table (parquet, csv or xlsx)")
+    args = parser.parse_args()
+
+    df = storage.read_table(args.input, columns=["gmap_id", "text"])
+    index = NearDuplicateIndex(args.threshold)
+    found = campaigns(df, index.cluster(df["text"]), args.min_size)
+    print(f"[dedup] {len(found)} clusters of {args.min_size}+ near-identical reviews")
+    print(found.head(20).to_string())
+    if args.output:
+        storage.write_table(found.reset_index(), args.output)
+
+
+if __name__ == "__main__":
+    main()
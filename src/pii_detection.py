@@ -0,0 +1,90 @@
+# vectorized PII / spam detection over whole DataFrame columns
+# uses the patterns compiled in helper.py with pandas `.str` ops instead of a per-row `.apply`
+import warnings
+import numpy as np
+import pandas as pd
+import helper
+
+# feature name -> regex; `n_<feature>` counts are the number of matches, same as len(findall)
+COUNT_PATTERNS = {
+    "url": helper.URL_REGEX,
+    "email": helper.EMAIL_REGEX,
+    "phone": helper.PHONE_REGEX,
+    "telegram": helper.TELEGRAM_REGEX,
+    "whatsapp": helper.WHATSAPP_REGEX,
+    "dm_request": helper.DM_REGEX,
+}
+
+# keyword lists become one case-insensitive whole-word alternation each (same as helper.has_*)
+KEYWORD_PATTERNS = {
+    "promo": helper.PROMO_REGEX,
+    "call_to_action": helper.CTA_REGEX,
+}
+
+
+# the "str" dtype runs regexes in pandas' pyarrow string kernels (RE2) when available, where \w, \d,
+# \s and \b only know ASCII. Rows holding a character on which the two engines disagree (non-ASCII
+# letters, digits or spaces, and the ASCII controls Python counts as whitespace) are matched with
+# Python's re instead, so every row gets the same matches as helper's find_* functions. Emojis,
+# curly quotes and dashes are not word, digit or space characters in either engine, so those rows
+# stay on the fast path.
+_RE2_UNSAFE_ASCII = r"[\x0b\x0c\x1c-\x1f]"
+_RE2_UNSAFE_NON_ASCII = r"[\pL\pN\pZ\x{85}]"
+
+
+def _as_text(texts: pd.Series) -> pd.Series:
+    return texts.fillna("").astype(str).astype("str")
+
+
+def re2_safe(texts: pd.Series) -> np.ndarray:
+    """Rows of an `_as_text` column that RE2 matches exactly like Python's re."""
+    if getattr(texts.dtype, "storage", None) != "pyarrow":
+        return np.ones(len(texts), dtype=bool)  # pandas already uses Python's re
+    unsafe = texts.str.contains(_RE2_UNSAFE_ASCII, regex=True).to_numpy(dtype=bool, copy=True)
+    non_ascii = ~texts.str.isascii().to_numpy(dtype=bool)
+    if non_ascii.any():
+        rest = texts[non_ascii].str.replace(r"[\x00-\x7f]+", "", regex=True)
+        unsafe[non_ascii] |= rest.str.contains(_RE2_UNSAFE_NON_ASCII, regex=True).to_numpy(dtype=bool)
+    return ~unsafe
+
+
+def contains(texts: pd.Series, pattern: str, safe: np.ndarray = None) -> pd.Series:
+    """
+    re.search(pattern, t) is not None for every row of an `_as_text` column.
+    safe: re2_safe(texts), when the caller runs several patterns over the same column.
+    """
+    safe = re2_safe(texts) if safe is None else safe
+    out = np.zeros(len(texts), dtype=bool)
+    with warnings.catch_warnings():
+        # helper's patterns have groups (for findall); only whether they match is needed here
+        warnings.filterwarnings("ignore", "This pattern is interpreted as a regular expression")
+        out[safe] = texts[safe].str.contains(pattern, regex=True).to_numpy(dtype=bool)
+        if not safe.all():
+            out[~safe] = texts[~safe].astype(object).str.contains(pattern, regex=True).to_numpy(dtype=bool)
+    return pd.Series(out, index=texts.index)
+
+
+def detect_features(texts: pd.Series, counts: bool = False) -> pd.DataFrame:
+    """
+    Runs every PII/spam detector over a column of review texts in one vectorized pass per pattern.
+
+    Args:
+        texts (pd.Series): review texts.
+        counts (bool): also return `n_<feature>` match counts for the regex detectors.
+
+    Returns:
+        pd.DataFrame: same index as `texts`, with boolean `has_<feature>` columns
+        (url, email, phone, telegram, whatsapp, dm_request, promo, call_to_action).
+    """
+    texts = _as_text(texts)
+    safe = re2_safe(texts)
+    features = {}
+    for name, pattern in COUNT_PATTERNS.items():
+        features[f"has_{name}"] = contains(texts, pattern, safe)
+        if counts:
+            # pyarrow's count restarts each search where the last match ended and loses the \b
+            # context there ("dm medm me" counts twice), so counts always use Python's re
+            features[f"n_{name}"] = texts.astype(object).str.count(pattern).astype("int32")
+    for name, pattern in KEYWORD_PATTERNS.items():
+        features[f"has_{name}"] = contains(texts, pattern, safe)
+    return pd.DataFrame(features, index=texts.index)
@@ -0,0 +1,239 @@
+# rule-based pre-classification stage
+# runs the cheap detectors from helper.py over every review and gives a deterministic verdict
+# for reviews that clearly violate policy, so only ambiguous reviews are sent to the LLM
+import re
+from dataclasses import dataclass, field
+import pandas as pd
+import helper
+import pii_detection
+from pii_detection import detect_features
+
+# explicit profanity, including the masked forms reviewers use ("f**k", "sh*t", "Sh***y")
+VULGAR_WORDS = [
+    "fuck", "fucking", "fucked", "shit", "shitty", "bullshit", "bitch", "bastard",
+    "asshole", "dickhead", "motherfucker", "cunt", "piss off",
+]
+VULGAR_REGEX = (
+    r"(?i)\b(?:" + "|".join(re.escape(w) for w in VULGAR_WORDS) + r")\b"
+    r"|\bf[\*#@\-]+(?:c?k|ck)(?:ing|ed|er)?\b"
+    r"|\bf[\*#@]+(?:ing|ed|in)\b|\bf[\*#@]+\B"
+    r"|\bsh[\*#@\-]+t(?:ty)?\b"
+    r"|\bsh[\*#@]+(?:t|y|ty)\b|\bsh[\*#@]+\B"
+    r"|\bb[\*#@\-]+tch\b"
+)
+VULGAR_PATTERN = re.compile(VULGAR_REGEX)
+TME_REGEX = r"(?i)t\.me/[^\s]+"
+TME_PATTERN = re.compile(TME_REGEX)
+# words of a business name too generic to tie a link to it
+_NAME_STOPWORDS = {"the", "and", "cafe", "restaurant", "shop", "store", "bar", "grill", "inc", "llc", "co"}
+
+
+def find_vulgarities(text: str) -> list[str]:
+    return VULGAR_PATTERN.findall(text)
+
+
+def _alnum(text: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(text).lower())
+
+
+def links_to_business(url: str, name) -> bool:
+    """
+    True if the domain of `url` looks like the business's own site ("www.joesdiner.com" for
+    "Joe's Diner"): its main label contains the name, or a distinctive word of it, or vice versa.
+    """
+    host = re.sub(r"(?i)^(https?://)?(www\.)?", "", url).split("/")[0].split(":")[0]
+    labels = host.lower().split(".")
+    label = _alnum(labels[-2] if len(labels) >= 2 else labels[0])
+    words = [w for w in (_alnum(w) for w in str(name).split()) if len(w) >= 4 and w not in _NAME_STOPWORDS]
+    full = _alnum(name)
+    return bool(label) and (full in label or label in full or any(w in label for w in words))
+
+
+def off_business_links(text: str, name=None) -> list[str]:
+    """
+    Contact links that point away from the reviewed business: t.me and WhatsApp links, and
+    URLs whose domain does not match the business name. Without a name, URLs are not counted,
+    since they may be the business's own site.
+    """
+    # bare @mentions also match helper's telegram pattern, only t.me links count here
+    found = ["telegram"] * bool(TME_PATTERN.search(text))
+    found += ["whatsapp"] * bool(helper.WHATSAPP_PATTERN.search(text))
+    if name is not None and not pd.isna(name):
+        found += [m.group(0) for m in helper.URL_PATTERN.finditer(text)
+                  if "t.me/" not in m.group(0).lower() and not links_to_business(m.group(0), name)]
+    return found
+
+
+def detect_signals(text: str, name=None) -> dict:
+    """
+    Runs every spam/PII detector in helper.py plus the vulgarity lexicon on one review.
+    name: the reviewed business, so links to its own site are told apart from external ones.
+    """
+    promo, call_to_action = helper.has_promo_language(text), helper.has_call_to_action(text)
+    return {
+        "urls": bool(helper.find_urls(text)),
+        "emails": bool(helper.find_emails(text)),
+        "phones": bool(helper.find_phone_numbers(text)),
+        # bare @mentions also match helper's telegram pattern, only t.me links count here
+        "telegram": bool(TME_PATTERN.search(text)),
+        "whatsapp": bool(helper.WHATSAPP_PATTERN.search(text)),
+        # links only matter to the rules next to promotional language, so only then are they resolved
+        "off_business_links": off_business_links(text, name) if promo or call_to_action else [],
+        "promo": promo,
+        "call_to_action": call_to_action,
+        "vulgar": find_vulgarities(text),
+    }
+
+
+def detect_signals_frame(texts: pd.Series, names: pd.Series = None) -> pd.DataFrame:
+    """
+    Same signals as `detect_signals`, computed for a whole column with vectorized pattern passes.
+    The `vulgar` and `off_business_links` columns hold the matches (empty list when none).
+    Like there, links are only resolved on rows with promotional or call-to-action language.
+    """
+    features = detect_features(texts)
+    as_text = texts.fillna("").astype(str).astype("str")
+    safe = pii_detection.re2_safe(as_text)
+    vulgar = pd.Series([[]] * len(texts), index=texts.index, dtype=object)
+    has_vulgar = pii_detection.contains(as_text, VULGAR_REGEX, safe)
+    # only the (rare) rows that matched need the actual words for the justification
+    vulgar[has_vulgar] = as_text[has_vulgar].map(find_vulgarities)
+    telegram = pii_detection.contains(as_text, TME_REGEX, safe)
+    # links are only resolved against the business name on the few rows that also pitch something
+    links = pd.Series([[]] * len(texts), index=texts.index, dtype=object)
+    candidates = ((features["has_url"] | telegram | features["has_whatsapp"])
+                  & (features["has_promo"] | features["has_call_to_action"]))
+    name_of = names.reindex(texts.index) if names is not None else pd.Series(None, index=texts.index, dtype=object)
+    links[candidates] = pd.Series([off_business_links(t, n) for t, n in zip(as_text[candidates], name_of[candidates])],
+                                  index=texts.index[candidates], dtype=object)
+    return pd.DataFrame({
+        "urls": features["has_url"],
+        "emails": features["has_email"],
+        "phones": features["has_phone"],
+        "telegram": telegram,
+        "whatsapp": features["has_whatsapp"],
+        "off_business_links": links,
+        "promo": features["has_promo"],
+        "call_to_action": features["has_call_to_action"],
+        "vulgar": vulgar,
+    }, index=texts.index)
+
+
+### RULES
+# A rule takes the signals of one review and returns (policy, reason) when it is certain
+# the policy is violated, otherwise None. Rules never clear a review, they only flag it.
+
+def contact_with_promotion(signals: dict):
+    # only links away from the business count: promotions of the business itself (its own site,
+    # phone number or email) are not ads, and are left to the LLM
+    links = signals["off_business_links"]
+    pitch = [k for k in ("promo", "call_to_action") if signals[k]]
+    if links and pitch:
+        return "Advertisement", (
+            f"Links away from the business ({', '.join(links)}) together with "
+            f"{' and '.join(p.replace('_', ' ') for p in pitch)} language."
+        )
+    return None
+
+
+def explicit_vulgarity(signals: dict):
+    if signals["vulgar"]:
+        words = sorted({w.lower() for w in signals["vulgar"]})
+        return "Vulgar Language", f"Contains vulgar language: {', '.join(words)}."
+    return None
+
+
+DEFAULT_RULES = [contact_with_promotion, explicit_vulgarity]
+# policies some rule looks at on every review; the others are left unset in rule verdicts
+EVALUATED_POLICIES = ["Advertisement", "Vulgar Language"]
+
+POLICIES = ["Advertisement", "Irrelevant Review", "False Review", "Vulgar Language"]
+
+
+def verdict_from_rules(hits: list) -> dict:
+    """
+    Builds a result in the same JSON schema the LLM returns from a list of (policy, reason) hits.
+    Policies no rule evaluates (Irrelevant Review, False Review) are None rather than "No".
+    """
+    flagged = {policy for policy, _ in hits}
+    result = {policy: "Yes" if policy in flagged else "No" if policy in EVALUATED_POLICIES else None
+              for policy in POLICIES}
+    # policy violations are never scored, same as step 2 of the LLM prompt
+    result["Relevance Score"] = "-"
+    result["Quality Score"] = "-"
+    unset = [policy for policy in POLICIES if result[policy] is None]
+    result["Extraction Justification"] = (
+        "[rule pre-filter] " + " ".join(reason for _, reason in hits)
+        + (f" Not evaluated: {', '.join(unset)}." if unset else "")
+    )
+    return result
+
+
+@dataclass
+class PrefilterReport:
+    total: int = 0
+    decided: int = 0
+    rule_counts: dict = field(default_factory=dict)
+
+    @property
+    def sent_to_llm(self) -> int:
+        return self.total - self.decided
+
+    def __str__(self) -> str:
+        share = self.decided / self.total if self.total else 0.0
+        rules = ", ".join(f"{k}={v}" for k, v in self.rule_counts.items()) or "none"
+        return (f"[prefilter] {self.decided}/{self.total} reviews decided by rules "
+                f"({share:.1%} of LLM calls skipped); {self.sent_to_llm} sent to LLM; rule hits: {rules}")
+
+
+class Prefilter:
+    def __init__(self, rules: list = None):
+        """
+        rules: list of rule functions (see DEFAULT_RULES). Add your own to extend the stage.
+        """
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+
+    def _apply_rules(self, signals: dict) -> list:
+        hits = []
+        for rule in self.rules:
+            hit = rule(signals)
+            if hit is not None:
+                hits.append((rule.__name__, hit))
+        return hits
+
+    def classify(self, text: str, name=None):
+        """
+        Returns a deterministic verdict dict for one review of business `name`, or None if it needs the LLM.
+        """
+        hits = self._apply_rules(detect_signals(str(text), name))
+        if not hits:
+            return None
+        return verdict_from_rules([hit for _, hit in hits])
+
+    def split(self, texts, names=None) -> tuple:
+        """
+        Runs the rules over a whole column of reviews.
+
+        Args:
+            texts (pd.Series): review texts.
+            names (pd.Series): business names (same index), to tell the business's own links
+                from external ones; without them links never make a review a certain ad.
+
+        Returns:
+            tuple: (dict of index -> verdict for decided reviews,
+                    list of indexes that still need the LLM,
+                    PrefilterReport)
+        """
+        report = PrefilterReport(total=len(texts))
+        decided, ambiguous = {}, []
+        signals_frame = detect_signals_frame(texts, names)
+        for idx, signals in zip(signals_frame.index, signals_frame.to_dict("records")):
+            hits = self._apply_rules(signals)
+            if not hits:
+                ambiguous.append(idx)
+                continue
+            for name, _ in hits:
+                report.rule_counts[name] = report.rule_counts.get(name, 0) + 1
+            decided[idx] = verdict_from_rules([hit for _, hit in hits])
+        report.decided = len(decided)
+        return decided, ambiguous, report
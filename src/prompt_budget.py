@@ -0,0 +1,202 @@
+# token-budget-aware prompt building for LLM_structuring
+# the static prefix (system prompt + one-shot example) is built and counted once and shared by
+# every request; metadata is rendered compactly and over-long reviews are truncated to fit
+# a per-request token budget. Tokens are counted with tiktoken when it is installed
+# (pip install tiktoken), otherwise estimated at ~4 characters per token.
+from dataclasses import dataclass
+from functools import lru_cache
+import numpy as np
+import helper
+from rate_limiter import estimate_tokens
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+# chat formatting adds a few tokens around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+TRUNCATION_MARKER = " [...] "
+# a review is never cut below this, even when the budget is smaller than the prompt around it
+MIN_REVIEW_TOKENS = 64
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def tokenizer_name(model: str = "gpt-4o") -> str:
+    encoding = _encoding(model)
+    return f"tiktoken {encoding.name}" if encoding is not None else "estimated at ~4 chars/token"
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: list, model: str = "gpt-4o") -> int:
+    return sum(count_tokens(m.get("content") or "", model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    """
+    Shortens `text` to about `max_tokens` tokens, keeping its beginning (two thirds of the
+    budget) and its end (the rest), which is where reviews usually state their verdict.
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding(model)
+    if encoding is None:
+        head, tail = max_tokens * 4 * 2 // 3, max_tokens * 4 // 3
+        return text[:head] + TRUNCATION_MARKER + text[-tail:] if tail else text[:head]
+    tokens = encoding.encode(text, disallowed_special=())
+    head, tail = max_tokens * 2 // 3, max_tokens // 3
+    return encoding.decode(tokens[:head]) + TRUNCATION_MARKER + (encoding.decode(tokens[-tail:]) if tail else "")
+
+
+def _is_missing(value) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return len(value) == 0
+    try:
+        return bool(value != value)  # NaN
+    except (TypeError, ValueError):
+        return False
+
+
+def compact_hours(hours) -> str:
+    """
+    [['Monday', '8AM-5PM'], ..., ['Sunday', 'Closed']] -> "Mon-Fri 8AM-5PM; Sat-Sun Closed".
+    Consecutive days with the same hours are merged; unrecognised entries are kept verbatim.
+    """
+    if _is_missing(hours):
+        return "-"
+    by_day, extra = {}, []
+    for entry in hours:
+        if isinstance(entry, (list, tuple, np.ndarray)) and len(entry) == 2 and str(entry[0]) in DAYS:
+            by_day[str(entry[0])] = str(entry[1])
+        else:
+            extra.append(str(entry))
+    if len(by_day) == 7 and len(set(by_day.values())) == 1:
+        return "; ".join([f"Daily {by_day['Monday']}"] + extra)
+
+    groups = []  # [first day, last day, hours]
+    for day in DAYS:
+        if day not in by_day:
+            continue
+        previous = groups[-1] if groups else None
+        if previous and previous[2] == by_day[day] and DAYS.index(previous[1]) == DAYS.index(day) - 1:
+            previous[1] = day
+        else:
+            groups.append([day, day, by_day[day]])
+    parts = [f"{first[:3]}-{last[:3]} {h}" if first != last else f"{first[:3]} {h}" for first, last, h in groups]
+    return "; ".join(parts + extra)
+
+
+def compact_categories(categories) -> str:
+    if _is_missing(categories):
+        return "-"
+    if isinstance(categories, (list, tuple, np.ndarray)):
+        return ", ".join(str(c) for c in categories)
+    return str(categories)
+
+
+def render_metadata(location: dict) -> str:
+    return "\n".join([
+        f"Name: {location.get('name')}",
+        f"Category: {compact_categories(location.get('category'))}",
+        f"Address: {location.get('address')}",
+        f"Opening Hours: {compact_hours(location.get('open_hours'))}",
+        f"Timestamp: {helper.format_vermont_time(location.get('time'))}",
+    ])
+
+
+def _verbose_metadata(location: dict) -> str:
+    # the previous rendering (raw Python reprs), kept to report what compact metadata saves
+    return "\n".join([
+        f"Name: {location.get('name')}",
+        f"Category: {location.get('category')}",
+        f"Address: {location.get('address')}",
+        f"Opening Hours: {location.get('open_hours')}",
+        f"Timestamp: {location.get('time')}",
+    ])
+
+
+@dataclass
+class BudgetReport:
+    tokenizer: str = ""
+    prefix_tokens: int = 0
+    max_tokens: int = None
+    prompts: int = 0
+    reviews: int = 0
+    tokens: int = 0
+    metadata_tokens_saved: int = 0
+    truncated: int = 0
+    truncated_tokens: int = 0
+
+    def __str__(self) -> str:
+        average = self.tokens / self.prompts if self.prompts else 0.0
+        budget = f"budget {self.max_tokens}" if self.max_tokens else "no budget"
+        return (f"[prompt] {self.prompts} prompts, {average:,.0f} tokens on average (static prefix "
+                f"{self.prefix_tokens:,}, {budget}); compact metadata saved {self.metadata_tokens_saved:,} tokens; "
+                f"{self.truncated}/{self.reviews} reviews truncated, removing {self.truncated_tokens:,} tokens "
+                f"({self.tokenizer})")
+
+
+class PromptBuilder:
+    def __init__(self, prefix: list, instructions: str, max_tokens: int = None, model: str = "gpt-4o"):
+        """
+        prefix: static messages sent ahead of every review; they are shared, not copied, so
+        callers must not mutate the returned prompts.
+        instructions: output-format text that follows the review and its metadata.
+        max_tokens: per-request prompt budget; reviews are truncated so the prompt fits it (in
+        batched prompts the reviews share it equally). None disables truncation.
+        """
+        self.prefix = list(prefix)
+        self.instructions = instructions
+        self.max_tokens = max_tokens
+        self.model = model
+        self.prefix_tokens = count_message_tokens(self.prefix, model)
+        self.instruction_tokens = count_tokens(instructions, model)
+        self.report = BudgetReport(tokenizer=tokenizer_name(model), prefix_tokens=self.prefix_tokens,
+                                   max_tokens=max_tokens)
+
+    def review_block(self, review_text: str, location: dict, reviews: int = 1) -> str:
+        """
+        The review and its compact metadata, truncated to the budget if needed.
+        reviews: number of reviews in the prompt this block goes into; they share the budget.
+        """
+        metadata = render_metadata(location)
+        metadata_tokens = count_tokens(metadata, self.model)
+        self.report.metadata_tokens_saved += count_tokens(_verbose_metadata(location), self.model) - metadata_tokens
+        self.report.reviews += 1
+
+        review_text = str(review_text)
+        if self.max_tokens:
+            shared = self.max_tokens - self.prefix_tokens - self.instruction_tokens - MESSAGE_OVERHEAD_TOKENS
+            # 16: labels around the review
+            allowance = max(MIN_REVIEW_TOKENS, shared // max(1, reviews) - metadata_tokens - 16)
+            review_tokens = count_tokens(review_text, self.model)
+            if review_tokens > allowance:
+                review_text = truncate_to_tokens(review_text, allowance, self.model)
+                self.report.truncated += 1
+                self.report.truncated_tokens += review_tokens - count_tokens(review_text, self.model)
+        return f'Review:\n"{review_text}"\nMetadata:\n{metadata}'
+
+    def build(self, review_text: str, location: dict) -> list:
+        content = self.review_block(review_text, location) + "\n\n" + self.instructions
+        return self.wrap(content)
+
+    def wrap(self, content: str) -> list:
+        """Prefix + one user message; counts the prompt in the report."""
+        self.report.prompts += 1
+        self.report.tokens += self.prefix_tokens + count_tokens(content, self.model) + MESSAGE_OVERHEAD_TOKENS
+        return self.prefix + [{"role": "user", "content": content}]
@@ -0,0 +1,281 @@
+# client-side pacing and retry for LLM calls
+# - TokenBucket / RateLimiter: requests-per-minute and tokens-per-minute budgets
+# - RetryPolicy: exponential backoff with full jitter that honours Retry-After
+# - AdaptiveConcurrency: AIMD limit on in-flight requests driven by 429s and rate-limit headers
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from instrumentation import metrics
+
+# status codes worth retrying: timeout, conflict, rate limit and server-side failures
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text
+    return max(1, len(text) // 4)
+
+
+def estimate_prompt_tokens(messages: list, completion_tokens: int = 300) -> int:
+    """
+    Rough token cost of one request, used to reserve TPM budget before the real usage is known.
+    """
+    return sum(estimate_tokens(m.get("content") or "") for m in messages) + completion_tokens
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float = None, capacity: float = None):
+        """
+        per_minute: refill rate; None means unlimited.
+        capacity: burst size, defaults to one minute's worth.
+        """
+        self._lock = threading.Lock()
+        self.per_minute = None
+        self.set_rate(per_minute, capacity)
+
+    def set_rate(self, per_minute: float = None, capacity: float = None):
+        """
+        Changes the refill rate. A bucket that already had a rate keeps its current level (refilled
+        up to now at the old rate, capped at the new capacity); a new or previously unlimited one starts full.
+        """
+        with self._lock:
+            now = time.monotonic()
+            level = None
+            if self.per_minute is not None:
+                level = min(self.capacity, self.tokens + (now - self.updated) * self.per_minute / 60.0)
+            self.per_minute = per_minute
+            self.capacity = capacity or per_minute
+            self.tokens = self.capacity if level is None or self.capacity is None else min(self.capacity, level)
+            self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes `amount` from the bucket (it may go negative) and returns how long the caller
+        must wait before its reservation is covered.
+        """
+        if self.per_minute is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            rate = self.per_minute / 60.0
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / rate)
+
+    def refund(self, amount: float):
+        """Gives back over-reserved budget (e.g. when actual usage was below the estimate)."""
+        if self.per_minute is None:
+            return
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None):
+        """
+        Paces calls under both an RPM and a TPM budget. Either can be None (unlimited). The
+        server's x-ratelimit-limit-* headers lower a budget (or set a missing one) but never raise
+        it above the one given here.
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._budgets = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self._pause_until = 0.0
+
+    def _wait_time(self, tokens: int) -> float:
+        pause = max(0.0, self._pause_until - time.monotonic())
+        return max(pause, self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def acquire(self, tokens: int):
+        wait = self._wait_time(tokens)
+        if wait:
+            metrics.inc("rate_limit_wait_seconds", wait)
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int):
+        wait = self._wait_time(tokens)
+        if wait:
+            metrics.inc("rate_limit_wait_seconds", wait)
+            await asyncio.sleep(wait)
+
+    def record_usage(self, estimated: int, actual: int):
+        """Corrects the TPM bucket once the real token count is known."""
+        if actual is None:
+            return
+        if actual < estimated:
+            self.tokens.refund(estimated - actual)
+        elif actual > estimated:
+            self.tokens.reserve(actual - estimated)
+
+    def pause(self, seconds: float):
+        """Holds every caller back for `seconds` (e.g. after a 429 with Retry-After)."""
+        self._pause_until = max(self._pause_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """
+        Adopts the server's limits from x-ratelimit-limit-requests / -tokens (capped by the
+        budgets given to the constructor) and pauses until the reset time when the remaining
+        budget is exhausted.
+        """
+        if headers is None:
+            return
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            limit = _to_float(headers.get(f"x-ratelimit-limit-{kind}"))
+            if limit and self._budgets[kind] is not None:
+                limit = min(limit, self._budgets[kind])
+            if limit and limit != bucket.per_minute:
+                bucket.set_rate(limit)
+            remaining = _to_float(headers.get(f"x-ratelimit-remaining-{kind}"))
+            if remaining is not None and remaining <= 0:
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self.pause(reset)
+
+
+class RetryPolicy:
+    def __init__(self, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: float = None) -> float:
+        """
+        Full-jitter exponential backoff for the given (0-based) retry attempt. A server-provided
+        Retry-After is a lower bound.
+        """
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    Transient failures (timeouts, dropped connections, 429, 5xx) are retried; anything else
+    (bad request, auth, not found, content errors) is fatal.
+    """
+    import openai  # only reached once a call has failed; keeps this module cheap to import
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS
+    return False
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    import openai
+    return isinstance(exc, openai.APIStatusError) and exc.status_code == 429
+
+
+def retry_after_seconds(exc: Exception):
+    """Reads Retry-After (seconds or HTTP date) or retry-after-ms from an API error's response."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    ms = _to_float(headers.get("retry-after-ms"))
+    if ms is not None:
+        return ms / 1000.0
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    seconds = _to_float(value)
+    if seconds is not None:
+        return seconds
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def parse_duration(value):
+    """
+    Parses OpenAI's reset durations ("1s", "6m0s", "20ms", "1h2m3.5s") or plain seconds.
+    """
+    if value is None:
+        return None
+    seconds = _to_float(value)
+    if seconds is not None:
+        return seconds
+    total, number = 0.0, ""
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    i = 0
+    while i < len(value):
+        c = value[i]
+        if c.isdigit() or c == ".":
+            number += c
+            i += 1
+            continue
+        unit = "ms" if value[i:i + 2] == "ms" else c
+        if unit not in units or not number:
+            return None
+        total += float(number) * units[unit]
+        number = ""
+        i += len(unit)
+    return total
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveConcurrency:
+    def __init__(self, maximum: int, minimum: int = 1):
+        """
+        Limits in-flight requests to `limit`, which starts at `maximum`, halves on every
+        rate-limit error and grows back by one after `limit` consecutive successes.
+        """
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = maximum
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = None
+
+    def _cond(self) -> asyncio.Condition:
+        # created lazily so the object can be built outside the event loop that uses it
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def __aenter__(self):
+        cond = self._cond()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        cond = self._cond()
+        async with cond:
+            self.in_flight -= 1
+            cond.notify_all()
+
+    def on_rate_limited(self):
+        self.limit = max(self.minimum, self.limit // 2)
+        self._successes = 0
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.limit and self.limit < self.maximum:
+            self.limit += 1
+            self._successes = 0
+            if self._condition is not None:
+                asyncio.ensure_future(self._wake())
+
+    def observe_headers(self, headers):
+        # remaining-requests is what is left of the per-minute budget, not a concurrency limit:
+        # it only matters once fewer requests are left than are already in flight
+        remaining = _to_float(headers.get("x-ratelimit-remaining-requests")) if headers is not None else None
+        if remaining is not None and remaining < self.in_flight:
+            self.limit = max(self.minimum, min(self.limit, int(remaining)))
+
+    async def _wake(self):
+        async with self._cond():
+            self._cond().notify_all()
@@ -0,0 +1,143 @@
+# persistent, content-addressed cache for LLM responses
+# key = sha256(model + request parameters + full message list), value = raw response text
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = "../cache/llm_responses.sqlite"
+
+
+def cache_key(model: str, messages: list, **params) -> str:
+    """
+    Hashes everything that determines the response: model, messages and request
+    parameters such as temperature/response_format.
+    """
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = None,
+                 max_bytes: int = None, max_age_seconds: float = None, bypass: bool = False):
+        """
+        SQLite-backed response cache.
+
+        Args:
+            path (str): database file, created if missing.
+            max_entries (int): evict least recently used entries beyond this count.
+            max_bytes (int): evict least recently used entries beyond this total response size.
+            max_age_seconds (float): entries older than this are treated as misses and purged.
+            bypass (bool): skip lookups (always call the API) but still store fresh responses.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   response TEXT NOT NULL,
+                   size INTEGER NOT NULL,
+                   created REAL NOT NULL,
+                   last_used REAL NOT NULL
+               )"""
+        )
+        self._conn.commit()
+        self.evict()
+
+    def get(self, key: str):
+        """Returns the cached response for `key`, or None on a miss (always None when bypassing)."""
+        if self.bypass:
+            self.misses += 1
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.max_age_seconds is not None and now - row[1] > self.max_age_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        self.hits += 1
+        return row[0]
+
+    def set(self, key: str, response: str):
+        if response is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+        if self.max_entries is not None or self.max_bytes is not None:
+            self.evict()
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones until the size limits hold."""
+        with self._lock:
+            if self.max_age_seconds is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age_seconds,)
+                )
+            if self.max_entries is not None:
+                self._conn.execute(
+                    """DELETE FROM responses WHERE key IN (
+                           SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                       )""",
+                    (self.max_entries,),
+                )
+            if self.max_bytes is not None:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    for key, size in self._conn.execute(
+                        "SELECT key, size FROM responses ORDER BY last_used ASC"
+                    ).fetchall():
+                        self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        total -= size
+                        if total <= self.max_bytes:
+                            break
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,217 @@
+# typed schema of the moderation result, with validation and a cheap local repair pass
+# LLM answers are checked field by field against the allowed labels; common deviations
+# ("yes ", "Medium", "relevance_score", code fences, trailing commas) are repaired locally and
+# only fields that stay invalid are asked for again (see reask_prompt / merge_reask)
+import json
+import re
+from dataclasses import dataclass
+from instrumentation import metrics
+
+POLICY_FIELDS = ["Advertisement", "Irrelevant Review", "False Review", "Vulgar Language"]
+SCORE_FIELDS = ["Relevance Score", "Quality Score"]
+JUSTIFICATION = "Extraction Justification"
+FIELDS = POLICY_FIELDS + SCORE_FIELDS + [JUSTIFICATION]
+
+POLICY_LABELS = ("Yes", "No")
+SCORE_LABELS = ("High", "Average", "Low", "-")
+ALLOWED = {**{f: POLICY_LABELS for f in POLICY_FIELDS}, **{f: SCORE_LABELS for f in SCORE_FIELDS}}
+
+_POLICY_SYNONYMS = {
+    "yes": "Yes", "y": "Yes", "true": "Yes", "1": "Yes", "flagged": "Yes", "violated": "Yes",
+    "no": "No", "n": "No", "false": "No", "0": "No", "not flagged": "No", "not violated": "No",
+}
+_SCORE_SYNONYMS = {
+    "high": "High", "h": "High",
+    "average": "Average", "avg": "Average", "med": "Average", "medium": "Average", "moderate": "Average",
+    "mid": "Average",
+    "low": "Low", "l": "Low",
+    "-": "-", "n/a": "-", "na": "-", "none": "-", "null": "-", "not applicable": "-",
+}
+# normalized key (lowercase letters only) -> field
+_KEYS = {re.sub(r"[^a-z]", "", f.lower()): f for f in FIELDS}
+_KEYS.update({
+    "advertising": "Advertisement", "ad": "Advertisement", "ads": "Advertisement",
+    "irrelevant": "Irrelevant Review", "false": "False Review", "fake": "False Review",
+    "fakereview": "False Review", "vulgar": "Vulgar Language", "vulgarity": "Vulgar Language",
+    "profanity": "Vulgar Language", "relevance": "Relevance Score", "quality": "Quality Score",
+    "justification": JUSTIFICATION, "reason": JUSTIFICATION, "explanation": JUSTIFICATION,
+})
+
+
+def loads_lenient(text: str):
+    """
+    json.loads that tolerates code fences, text around the object and trailing commas.
+    Raises ValueError if no JSON object can be recovered.
+    """
+    s = re.sub(r"^```(?:json)?\s*|\s*```$", "", str(text).strip(), flags=re.IGNORECASE)
+    try:
+        return json.loads(s)
+    except ValueError:
+        pass
+    start, end = s.find("{"), s.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("no JSON object in response")
+    s = re.sub(r",\s*([}\]])", r"\1", s[start:end + 1])
+    return json.loads(s)
+
+
+def repair_value(field: str, value):
+    """The allowed label `value` stands for, or None if it cannot be recognised."""
+    if field == JUSTIFICATION:
+        return None if value is None else str(value).strip()
+    if isinstance(value, bool) and field in POLICY_FIELDS:
+        return "Yes" if value else "No"
+    if value is None:
+        return None
+    s = str(value).strip().strip(".\"'").lower()
+    synonyms = _POLICY_SYNONYMS if field in POLICY_FIELDS else _SCORE_SYNONYMS
+    return synonyms.get(s)
+
+
+def _unwrap(obj):
+    # {"result": {...}} or [{...}] around the actual answer
+    if isinstance(obj, list) and len(obj) == 1:
+        obj = obj[0]
+    if isinstance(obj, dict) and len(obj) == 1:
+        inner = next(iter(obj.values()))
+        if isinstance(inner, dict) and any(_KEYS.get(re.sub(r"[^a-z]", "", str(k).lower())) for k in inner):
+            return inner
+    return obj
+
+
+def validate(obj, fields: list = FIELDS) -> tuple:
+    """
+    Checks (and repairs) the `fields` of a parsed answer.
+
+    Returns:
+        tuple: (dict of field -> allowed value or None, list of fields still invalid,
+                number of repairs made)
+    """
+    obj = _unwrap(obj)
+    if not isinstance(obj, dict):
+        return {f: None for f in fields}, list(fields), 0
+    values, repairs = {}, 0
+    for key, value in obj.items():
+        field = key if key in ALLOWED or key == JUSTIFICATION else _KEYS.get(re.sub(r"[^a-z]", "", str(key).lower()))
+        if field not in fields or field in values:
+            continue
+        repaired = repair_value(field, value)
+        repairs += (field != key) + (repaired is not None and repaired != value)
+        values[field] = repaired
+    values = {f: values.get(f) for f in fields}
+
+    # the prompt's rule: violating reviews are not scored
+    if all(f in values for f in POLICY_FIELDS + SCORE_FIELDS) and "Yes" in [values[f] for f in POLICY_FIELDS]:
+        for f in SCORE_FIELDS:
+            if values[f] not in (None, "-"):
+                values[f] = "-"
+                repairs += 1
+    # a missing justification is tolerated; only the labels are worth another call
+    invalid = [f for f in fields if not values[f] and f != JUSTIFICATION]
+    if all(values.get(f) == "No" for f in POLICY_FIELDS):
+        # a compliant review must be scored
+        invalid += [f for f in SCORE_FIELDS if values.get(f) == "-" and f in fields]
+    return values, invalid, repairs
+
+
+def parse_result(response: str) -> dict:
+    """
+    Validated result dict for a raw LLM answer. Answers that stay invalid after repair keep
+    their valid fields plus "error", "invalid_fields" and "raw_response", so they are retried
+    (see journal.is_labelled) rather than silently stored with bad labels.
+    """
+    if not response:
+        return {"error": "No response", "raw_response": None}
+    try:
+        obj = loads_lenient(response)
+    except ValueError as e:
+        metrics.inc("parse_failures_total")
+        return {"error": f"Invalid JSON: {e}", "invalid_fields": list(FIELDS), "raw_response": response}
+    values, invalid, repairs = validate(obj)
+    result = {f: v for f, v in values.items() if f not in invalid}
+    result[JUSTIFICATION] = result.get(JUSTIFICATION) or ""
+    metrics.inc("schema_repairs_total", repairs)
+    if invalid:
+        metrics.inc("schema_invalid_total")
+        result.update({"error": f"Invalid fields: {invalid}", "invalid_fields": invalid, "raw_response": response})
+    return result
+
+
+def reask_prompt(prompt: list, result: dict) -> list:
+    """
+    The original prompt, the model's previous answer and a request for only the fields of
+    `result` (a parse_result output) that were missing or invalid.
+    """
+    invalid = result["invalid_fields"]
+    schema = ",\n".join(
+        f'  "{f}": ' + (" | ".join(f'"{v}"' for v in ALLOWED[f]) if f in ALLOWED else '"<short explanation>"')
+        for f in invalid
+    )
+    return list(prompt) + [
+        {"role": "assistant", "content": result.get("raw_response") or ""},
+        {"role": "user", "content": (
+            f"These fields were missing or not one of the allowed values: {', '.join(invalid)}. "
+            f"A review that violates no policy must be scored. Output only a JSON object with these keys:\n"
+            f"{{\n{schema}\n}}"
+        )},
+    ]
+
+
+def merge_reask(result: dict, response: str) -> dict:
+    """Fills the invalid fields of `result` from the answer to its reask_prompt and validates again."""
+    merged = {f: result[f] for f in FIELDS if f in result}
+    try:
+        values, _, _ = validate(loads_lenient(response), result["invalid_fields"]) if response else ({}, None, 0)
+    except ValueError:
+        values = {}
+    merged.update({f: v for f, v in values.items() if v is not None})
+    values, invalid, repairs = validate(merged)
+    fixed = {f: v for f, v in values.items() if f not in invalid}
+    fixed[JUSTIFICATION] = fixed.get(JUSTIFICATION) or ""
+    metrics.inc("schema_repairs_total", repairs)
+    metrics.inc("reask_fixed_total" if not invalid else "reask_failed_total")
+    if invalid:
+        fixed.update({"error": f"Invalid fields after re-ask: {invalid}", "invalid_fields": invalid,
+                      "raw_response": result.get("raw_response")})
+    return fixed
+
+
+@dataclass(slots=True)
+class ModerationResult:
+    """One row's labels; far smaller in memory than the dict parsed from JSON."""
+    advertisement: str = None
+    irrelevant_review: str = None
+    false_review: str = None
+    vulgar_language: str = None
+    relevance_score: str = None
+    quality_score: str = None
+    justification: str = None
+    error: str = None
+    cluster_id: str = None
+
+    @staticmethod
+    def from_dict(d: dict) -> "ModerationResult":
+        return ModerationResult(*(d.get(f) for f in FIELDS), d.get("error"), d.get("cluster_id"))
+
+    def to_dict(self) -> dict:
+        d = dict(zip(FIELDS, (self.advertisement, self.irrelevant_review, self.false_review,
+                              self.vulgar_language, self.relevance_score, self.quality_score, self.justification)))
+        for key in ("error", "cluster_id"):
+            if getattr(self, key) is not None:
+                d[key] = getattr(self, key)
+        return d
+
+
+def result_columns(records: list) -> dict:
+    """
+    Column-wise view of ModerationResults: {field: values}. "error" and "cluster_id" are only
+    included when some record has them.
+    """
+    attrs = ["advertisement", "irrelevant_review", "false_review", "vulgar_language",
+             "relevance_score", "quality_score", "justification"]
+    columns = {f: [getattr(r, a) for r in records] for f, a in zip(FIELDS, attrs)}
+    for key in ("error", "cluster_id"):
+        values = [getattr(r, key) for r in records]
+        if any(v is not None for v in values):
+            columns[key] = values
+    return columns
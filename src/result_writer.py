@@ -0,0 +1,169 @@
+# streaming writer for the labelled output of LLM_structuring.label_rows
+# results arrive in any order; they are joined onto the input in row order, one chunk at a time,
+# as soon as a contiguous run of rows is labelled, so output appears while the run is going and
+# memory does not grow with the run: labels are held as int8 codes of the allowed values (written
+# as categorical columns) and justifications are spilled to a temporary file until their chunk
+# is written
+# CSV output is appended to in place; Parquet/XLSX chunks go to <output stem>.parts/ (readable with
+# pd.read_parquet while the run is going) and are combined into the output file by close()
+import glob
+from array import array
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import storage
+from instrumentation import metrics
+from result_schema import ALLOWED, JUSTIFICATION
+
+# kept per row in the spill file rather than in memory
+SPILLED_FIELDS = [JUSTIFICATION, "error", "cluster_id"]
+NOT_LABELLED = {"error": "Not labelled"}
+
+
+class ResultWriter:
+    def __init__(self, df: pd.DataFrame, output: str, chunk_rows: int = 5000, flush_seconds: float = 30.0):
+        """
+        df: the input rows (RangeIndex); result i is joined onto row i.
+        chunk_rows: rows per written chunk. A shorter chunk is written once `flush_seconds` have
+            passed since the last write, so slow runs still show their progress.
+        Use as a context manager; the output (and any earlier parts) is replaced when it is opened.
+        """
+        self.df = df
+        self.output = output
+        self.chunk_rows = chunk_rows
+        self.flush_seconds = flush_seconds
+        # per-row state in flat Python buffers (cheap to set one item at a time, viewed as numpy
+        # arrays when a chunk is written): label codes (0xFF = missing), spill file offset and
+        # length (0 = nothing recorded yet) and whether the row is final
+        n = len(df)
+        self.codes = bytearray(b"\xff") * (n * len(ALLOWED))
+        self.offsets = array("q", [0]) * n
+        self.lengths = array("i", [0]) * n
+        self.done = bytearray(n)
+        self.ready = 0    # rows [0, ready) are final
+        self.written = 0  # rows [0, written) are on disk
+        self._lookup = [(f, {label: code for code, label in enumerate(labels)}) for f, labels in ALLOWED.items()]
+        self._last_flush = time.monotonic()
+        self._spill_end = 0
+        self._csv = None
+        self._spill = None
+        self.parts_dir = os.path.splitext(output)[0] + ".parts"
+        self.parts = 0
+
+    def __enter__(self):
+        directory = os.path.dirname(self.output) or "."
+        os.makedirs(directory, exist_ok=True)
+        self._spill = tempfile.TemporaryFile(dir=directory)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        if os.path.splitext(self.output)[1].lower() == ".csv":
+            self._csv = storage.TableWriter(self.output).__enter__()
+        else:
+            if os.path.exists(self.output):
+                os.remove(self.output)
+            os.makedirs(self.parts_dir)
+        return self
+
+    def record(self, i: int, result: dict, final: bool = True):
+        """
+        Stores row i's result (later calls win). Rows are written once they and every row
+        before them are final; a result that is not final is only written if nothing replaces
+        it before close().
+        """
+        if i < self.written:
+            return
+        k = len(self._lookup)
+        self.codes[i * k:(i + 1) * k] = bytes(lookup.get(result.get(field), 0xFF) for field, lookup in self._lookup)
+        spilled = json.dumps([result.get(f) for f in SPILLED_FIELDS], ensure_ascii=False).encode("utf-8")
+        self._spill.write(spilled)
+        self.offsets[i], self.lengths[i] = self._spill_end, len(spilled)
+        self._spill_end += len(spilled)
+        self.done[i] = final
+        while self.ready < len(self.done) and self.done[self.ready]:
+            self.ready += 1
+        if self.ready - self.written >= self.chunk_rows:
+            self.flush(whole_chunks=True)
+        elif self.ready > self.written and time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self, whole_chunks: bool = False):
+        """Writes the final rows not written yet, in chunks of at most `chunk_rows`."""
+        while self.ready - self.written >= (self.chunk_rows if whole_chunks else 1):
+            end = min(self.ready, self.written + self.chunk_rows)
+            self._write(self.written, end)
+            self.written = end
+        self._last_flush = time.monotonic()
+
+    def _spilled(self, start: int, end: int) -> list:
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)[start:end]
+        lengths = np.frombuffer(self.lengths, dtype=np.int32)[start:end]
+        if end == start:
+            return []
+        self._spill.flush()
+        fd = self._spill.fileno()
+        low, high = int(offsets.min()), int((offsets + lengths).max())
+        if high - low <= 2 * int(lengths.sum()) + (1 << 16):
+            # results arrive roughly in row order, so a chunk's entries are usually one stretch of the file
+            block = os.pread(fd, high - low, low)
+            pieces = [block[o - low:o - low + n] for o, n in zip(offsets.tolist(), lengths.tolist())]
+        else:
+            pieces = [os.pread(fd, n, o) for o, n in zip(offsets.tolist(), lengths.tolist())]
+        return json.loads(b"[" + b",".join(pieces) + b"]")
+
+    def _write(self, start: int, end: int):
+        codes = np.frombuffer(self.codes, dtype=np.int8).reshape(-1, len(ALLOWED))[start:end]
+        res = {f"res: {f}": pd.Categorical.from_codes(codes[:, k], categories=ALLOWED[f])
+               for k, f in enumerate(ALLOWED)}
+        spilled = self._spilled(start, end)
+        for k, field in enumerate(SPILLED_FIELDS):
+            res[f"res: {field}"] = pd.array([values[k] for values in spilled], dtype=str)
+        rows = self.df.iloc[start:end]
+        chunk = pd.concat([rows, pd.DataFrame(res, index=rows.index)], axis=1)
+        if self._csv is not None:
+            self._csv.write(chunk)
+        else:
+            # written under a name pd.read_parquet skips, then renamed, so readers never see half a part
+            tmp = os.path.join(self.parts_dir, f"_part-{self.parts:05d}.parquet")
+            storage.write_table(chunk, tmp)
+            os.replace(tmp, os.path.join(self.parts_dir, f"part-{self.parts:05d}.parquet"))
+            self.parts += 1
+        metrics.inc("output_rows_written_total", end - start)
+
+    def close(self):
+        """Writes the remaining rows (unlabelled ones carry an error) and finishes the output file."""
+        if self._spill is None:
+            return
+        for i in range(self.ready, len(self.done)):
+            if self.lengths[i] == 0:
+                self.record(i, NOT_LABELLED, final=False)
+        self.done = bytearray(b"\x01") * len(self.done)
+        self.ready = len(self.done)
+        self.flush()
+        if self.written == 0:
+            self._write(0, 0)  # an empty run still gets a table with the result columns
+        self._spill.close()
+        self._spill = None
+        if self._csv is not None:
+            self._csv.close()
+        else:
+            self._combine_parts()
+
+    def _combine_parts(self):
+        parts = sorted(glob.glob(os.path.join(self.parts_dir, "part-*.parquet")))
+        if os.path.splitext(self.output)[1].lower() in (".parquet", ".pq"):
+            # part by part, so combining needs no more memory than one chunk
+            import pyarrow.parquet as pq
+
+            schema = pq.read_schema(parts[0])
+            with pq.ParquetWriter(self.output, schema) as writer:
+                for part in parts:
+                    writer.write_table(pq.read_table(part).cast(schema))
+        else:
+            storage.write_table(pd.concat([storage.read_table(p) for p in parts], ignore_index=True), self.output)
+        shutil.rmtree(self.parts_dir)
+
+    def __exit__(self, *exc):
+        self.close()
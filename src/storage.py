@@ -0,0 +1,192 @@
+# pluggable table storage shared by every script
+# the format is picked from the file extension; Parquet is the default and keeps column types
+# (timestamps, list columns) instead of stringifying them like CSV/XLSX do
+# usage: python storage.py convert ../cleaned_data/cleaned_reviews.xlsx ../cleaned_data/cleaned_reviews.parquet
+import argparse
+import ast
+import csv
+import os
+import pandas as pd
+import helper
+
+DEFAULT_FORMAT = "parquet"
+FORMATS = ("parquet", "csv", "xlsx")
+
+# columns holding Python lists (`category` is a list of strings, `hours` a list of [day, hours] pairs)
+LIST_COLUMNS = ("category", "hours")
+
+
+def table_path(stem: str, fmt: str = DEFAULT_FORMAT) -> str:
+    """e.g. table_path("../cleaned_data/cleaned_reviews") -> "../cleaned_data/cleaned_reviews.parquet" """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown storage format {fmt!r}; expected one of {FORMATS}")
+    return f"{stem}.{fmt}"
+
+
+def _format_of(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    if ext in ("parquet", "pq"):
+        return "parquet"
+    if ext in ("csv", "xlsx"):
+        return ext
+    raise ValueError(f"Cannot tell storage format from {path!r}; expected one of {FORMATS}")
+
+
+def _arrow_list_dtype(arrow_type):
+    # keep list columns Arrow-backed (zero-copy); indexing a row still gives a plain Python list
+    import pyarrow as pa
+
+    if pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def _parse_list(value):
+    if isinstance(value, str) and value.startswith("["):
+        try:
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return value
+    return value
+
+
+_OPS = {
+    "==": lambda s, v: s == v, "=": lambda s, v: s == v, "!=": lambda s, v: s != v,
+    "<": lambda s, v: s < v, "<=": lambda s, v: s <= v, ">": lambda s, v: s > v, ">=": lambda s, v: s >= v,
+    "in": lambda s, v: s.isin(v), "not in": lambda s, v: ~s.isin(v),
+}
+
+
+def _apply_filters(df: pd.DataFrame, filters) -> pd.DataFrame:
+    # same [(column, op, value), ...] conjunction that pyarrow pushes down for Parquet
+    mask = pd.Series(True, index=df.index)
+    for col, op, value in filters:
+        mask &= _OPS[op](df[col], value)
+    return df[mask]
+
+
+def read_table(path: str, columns: list = None, filters: list = None, parse_lists: bool = True) -> pd.DataFrame:
+    """
+    Reads a table written by `write_table` (or any CSV/XLSX export of it).
+
+    Args:
+        path (str): .parquet, .csv or .xlsx file.
+        columns (list): only load these columns (projection; Parquet skips the others on disk).
+        filters (list): [(column, op, value), ...] row predicates, ANDed together. Pushed down to
+            the Parquet reader so non-matching row groups are never decoded.
+        parse_lists (bool): for CSV/XLSX, turn stringified `LIST_COLUMNS` back into lists.
+            Parquet stores them natively, so nothing needs parsing there.
+
+    Returns:
+        pd.DataFrame
+    """
+    fmt = _format_of(path)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path, columns=columns, filters=filters)
+        return table.to_pandas(types_mapper=_arrow_list_dtype)
+
+    if fmt == "csv":
+        df = pd.read_csv(path)
+    else:
+        df = pd.read_excel(path)
+    if filters:
+        df = _apply_filters(df, filters)
+    if columns is not None:
+        df = df[columns]
+    if parse_lists:
+        for col in LIST_COLUMNS:
+            if col in df.columns:
+                df[col] = [_parse_list(v) for v in df[col]]
+    return df
+
+
+def _for_text_format(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+            df[col] = df[col].dt.strftime(helper.TIME_FORMAT)
+    return df
+
+
+def write_table(df: pd.DataFrame, path: str):
+    """
+    Writes `df` in the format given by the extension of `path`.
+    Parquet keeps timestamps and list columns typed; CSV/XLSX stringify them.
+    Needs pyarrow for Parquet.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    fmt = _format_of(path)
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    elif fmt == "csv":
+        _for_text_format(df).to_csv(path, index=False, encoding="utf-8", quoting=csv.QUOTE_ALL)
+    else:
+        _for_text_format(df).to_excel(path, index=False)
+
+
+class TableWriter:
+    def __init__(self, path: str):
+        """
+        Appends DataFrame chunks to one output table (Parquet or CSV), e.g. for streaming runs.
+        Use as a context manager; the file is replaced when the writer is opened.
+        """
+        self.path = path
+        self.format = _format_of(path)
+        if self.format == "xlsx":
+            raise ValueError("XLSX cannot be written incrementally; use parquet or csv")
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+
+    def __enter__(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        return self
+
+    def write(self, df: pd.DataFrame):
+        if self.format == "csv":
+            _for_text_format(df).to_csv(self.path, mode="a", header=self.rows == 0, index=False,
+                                        encoding="utf-8", quoting=csv.QUOTE_ALL)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                table = table.cast(self._schema)
+            self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Table storage utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="convert a table between parquet/csv/xlsx")
+    convert.add_argument("source")
+    convert.add_argument("destination")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        df = read_table(args.source)
+        write_table(df, args.destination)
+        print(f"[ok] wrote {len(df)} rows to {args.destination}")
+
+
+if __name__ == "__main__":
+    main()
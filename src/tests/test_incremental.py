@@ -0,0 +1,37 @@
+# incremental preprocessing: the manifest makes repeated runs over the same input cheap
+# usage (from src/): python -m pytest tests
+import contextlib
+import io
+import pandas as pd
+from benchmarks.synthetic import generate_metadata, generate_reviews
+from data_preprocessing import incremental_match_metadata_reviews
+from manifest import ReviewManifest
+
+
+def _run(meta, reviews, directory) -> str:
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        incremental_match_metadata_reviews(meta, [reviews], ReviewManifest(directory))
+    return [line for line in out.getvalue().splitlines() if line.startswith("[incremental]")][-1]
+
+
+def test_unchanged_input_is_not_reprocessed(tmp_path):
+    meta = generate_metadata(20)
+    reviews = generate_reviews(2000, meta)
+    # half the reviews have no text, so merge_and_filter drops them
+    reviews.loc[reviews.index[::2], "text"] = None
+    first = _run(meta, reviews, tmp_path)
+    assert first.startswith("[incremental] 2000 new")
+    for _ in range(2):
+        assert _run(meta, reviews, tmp_path).startswith("[incremental] 0 new, 0 changed, 2000 unchanged")
+
+
+def test_reviews_without_metadata_are_retried(tmp_path):
+    meta = generate_metadata(20)
+    reviews = generate_reviews(500, meta)
+    late = meta["gmap_id"].iloc[0]
+    missing = int((reviews["gmap_id"] == late).sum())
+    _run(meta[meta["gmap_id"] != late], reviews, tmp_path)
+    assert _run(meta, reviews, tmp_path).startswith(f"[incremental] {missing} new")
+    delta = pd.concat([pd.read_parquet(p) for p in ReviewManifest(tmp_path).partition_paths()])
+    assert (delta["gmap_id"] == late).any()
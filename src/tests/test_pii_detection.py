@@ -0,0 +1,40 @@
+# vectorized detectors agree with helper's per-text find_* functions
+# usage (from src/): python -m pytest tests
+import pandas as pd
+import helper
+from pii_detection import detect_features
+from prefilter import detect_signals, detect_signals_frame
+
+TEXTS = [
+    "contact @josé for a table",
+    "@café_ok has the best coffee",
+    "Call ١٢٣٤٥٦٧٨٩٠ now",
+    "Call ０１２３４５６７８９ now",
+    "Visit www.café-shop.fr/menu or t.me/déals_now, use code ÉTÉ",
+    "WhatsApp: +٩٧١٥٥٥١٢٣٤ for the coupon",
+    "Écrivez à marie@example.com — 555-123-4567",
+    "plain ascii @someone 555 123 4567 dm me",
+    "tab\tand\x0bvertical tab @user_1",
+    "Ça c'était Sh***y, vraiment",
+    "",
+]
+
+
+def test_detect_features_matches_helper_on_non_ascii():
+    features = detect_features(pd.Series(TEXTS), counts=True)
+    for i, text in enumerate(TEXTS):
+        expected = {"url": len(helper.find_urls(text)), "email": len(helper.find_emails(text)),
+                    "phone": len(helper.find_phone_numbers(text)),
+                    "telegram": len(helper.TELEGRAM_PATTERN.findall(text)),
+                    "whatsapp": len(helper.WHATSAPP_PATTERN.findall(text)),
+                    "dm_request": len(helper.DM_PATTERN.findall(text))}
+        for name, n in expected.items():
+            assert features.at[i, f"n_{name}"] == n, (name, text)
+        assert features.at[i, "has_promo"] == helper.has_promo_language(text), text
+        assert features.at[i, "has_call_to_action"] == helper.has_call_to_action(text), text
+
+
+def test_signals_frame_matches_per_text_signals():
+    frame = detect_signals_frame(pd.Series(TEXTS))
+    for i, text in enumerate(TEXTS):
+        assert frame.loc[i].to_dict() == detect_signals(text), text
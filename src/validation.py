@@ -1,10 +1,14 @@
-import os, json, argparse, re
+import os, json, argparse
 from pathlib import Path
 from typing import List, Dict, Any
 import pandas as pd
-from sklearn.metrics import classification_report, confusion_matrix, f1_score, accuracy_score
 import LLMClient
 import LLM_structuring
+import storage
+import helper
+import result_schema
+from response_cache import ResponseCache, DEFAULT_CACHE_PATH
+from local_classifier import LocalClassifier
 
 # COLUMN NAMES for the ground truth labels for validation
 GT_RELEVANCE_COL = "Relevance Score"
@@ -12,11 +16,11 @@ GT_QUALITY_COL   = "Quality Score"
 
 # ---- helpers ----
 def extract_json(s: str) -> Dict[str, Any]:
+    # lenient parse + schema repair; labels that cannot be recognised are left out
     if s is None:
         return {}
-    s = s.strip()
-    s = re.sub(r"^```(?:json)?\s*|\s*```$", "", s, flags=re.IGNORECASE | re.DOTALL)
-    return json.loads(s)
+    values, _, _ = result_schema.validate(result_schema.loads_lenient(s))
+    return {k: v for k, v in values.items() if v is not None}
 
 
 def make_messages(review_text: str, location: Dict[str, Any]) -> List[Dict[str, str]]:
@@ -57,25 +61,33 @@ def row_to_location(row: pd.Series) -> Dict[str, Any]:
         "category": row.get("category"),
         "address": row.get("address"),
         "hours": row.get("hours"),
-        "time": row.get("time"),
+        "time": helper.format_vermont_time(row.get("time")),
     }
 
 def normalize_label(x: Any) -> str:
     # just in case the LLM model outputs not as accurate labels
     if x is None:
         return ""
-    s = str(x).strip().lower()
-    # collapse variants like "avg"/"medium "
-    if s in {"med", "avg", "medium"}:
-        return "Average"
-    return s
+    # collapse variants like "avg"/"medium "/"N/A" onto the schema's score labels
+    label = result_schema.repair_value(result_schema.SCORE_FIELDS[0], x)
+    return (label or str(x).strip()).lower()
 
 # ---- main ----
 def main():
+    parser = argparse.ArgumentParser(description="Validate LLM labels against human ground truth")
+    parser.add_argument("--input", default="../cleaned_data/cleaned_reviews.parquet",
+                        help="human-labelled reviews (parquet, csv or xlsx)")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint, e.g. a local fake server")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="on-disk LLM response cache")
+    parser.add_argument("--no-cache", action="store_true", help="always call the API (fresh responses are still cached)")
+    parser.add_argument("--local-model", default=None,
+                        help="trained local_classifier.py model; its confident predictions are used instead of the LLM")
+    parser.add_argument("--local-confidence", type=float, default=0.9)
+    args = parser.parse_args()
 
     out_dir = Path("outputs"); out_dir.mkdir(parents=True, exist_ok=True)
 
-    df = pd.read_excel("../cleaned_data/cleaned_reviews.xlsx")
+    df = storage.read_table(args.input)
     needed = {"text", GT_RELEVANCE_COL, GT_QUALITY_COL}
     missing = needed - set(df.columns)
     if missing:
@@ -83,21 +95,32 @@ def main():
 
     val_df = df.iloc[: min(1002, len(df))].copy().reset_index(drop=True)
 
-    client = LLMClient.LLMClient(model="gpt-4o")
+    cache = ResponseCache(args.cache_path, bypass=args.no_cache)
+    client = LLMClient.LLMClient(model="gpt-4o", base_url=args.base_url, cache=cache)
+
+    # rows the local model is sure about are scored from its prediction, the rest by the LLM
+    local = {}
+    if args.local_model:
+        local, _, report = LocalClassifier.load(args.local_model).split(val_df, args.local_confidence)
+        print(report)
 
     preds_rel, preds_qual = [], []
     rows_out = []
 
     for i, row in val_df.iterrows():
-        review_text = str(row["text"])
-        location = row_to_location(row)
-        messages = make_messages(review_text, location)
-        raw = client.call_LLM(messages)
-
-        try:
-            parsed = extract_json(raw)
-        except Exception as e:
-            parsed = {"_parse_error": str(e), "_raw": raw}
+        if i in local:
+            parsed = local[i]
+        else:
+            review_text = str(row["text"])
+            location = row_to_location(row)
+            messages = make_messages(review_text, location)
+            raw = client.call_LLM(messages)
+
+            parsed = result_schema.parse_result(raw)
+            if "invalid_fields" in parsed:
+                # ask once more for the labels that could not be repaired locally
+                parsed = result_schema.merge_reask(
+                    parsed, client.call_LLM(result_schema.reask_prompt(messages, parsed)))
 
         pr = normalize_label(parsed.get("Relevance Score"))
         pq = normalize_label(parsed.get("Quality Score"))
@@ -105,16 +128,19 @@ def main():
         preds_qual.append(pq)
 
         rows_out.append({**row.to_dict(), **parsed})
+    print(f"[cache] {cache.stats()}")
 
     # Save per-row predictions
     pred_csv = out_dir / "validation_predictions.csv"
-    pd.DataFrame(rows_out).to_csv(pred_csv, index=False, encoding="utf-8")
+    storage.write_table(pd.DataFrame(rows_out), str(pred_csv))
     print(f"[ok] wrote {pred_csv}")
 
     # Metrics
     y_rel = [normalize_label(x) for x in val_df[GT_RELEVANCE_COL].tolist()]
     y_qual = [normalize_label(x) for x in val_df[GT_QUALITY_COL].tolist()]
 
+    # sklearn is only needed for the final report, so it is not imported with the module
+    from sklearn.metrics import classification_report, confusion_matrix, f1_score, accuracy_score
     labels = ["low", "average", "high"]  # fixed label order for reports
 
     def report(y_true, y_pred, name):
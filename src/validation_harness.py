@@ -0,0 +1,250 @@
+# side-by-side validation of prompt/model configurations against the human labels
+# predictions are stored per (prompt version, model, row), so reruns only query rows that are missing
+# and metrics can be recomputed offline
+# usage: python validation_harness.py --configs structuring:gpt-4o validation:gpt-4o-mini
+#        python validation_harness.py --configs structuring:gpt-4o --offline   (stored predictions only)
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import LLM_structuring
+import moderation_engine
+import storage
+import validation
+from LLMClient import AsyncLLMClient
+from journal import RowJournal, row_key
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache, DEFAULT_CACHE_PATH
+
+# message builders under test; edit a template and its version hash (and so its stored predictions) changes
+PROMPTS = {
+    "structuring": lambda row: LLM_structuring.generate_review_prompt(
+        str(row["text"]), LLM_structuring.row_to_location(row)),
+    "validation": lambda row: validation.make_messages(str(row["text"]), validation.row_to_location(row)),
+}
+
+# USD per 1M (prompt, completion) tokens; override with --price model=in,out
+PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+TARGETS = [validation.GT_RELEVANCE_COL, validation.GT_QUALITY_COL]
+LABELS = ["low", "average", "high"]
+
+_PROBE_ROW = pd.Series({"text": "", "name": "", "category": [], "address": "", "hours": [], "time": ""})
+
+
+def prompt_version(name: str) -> str:
+    """e.g. "structuring@1a2b3c4d": the builder name plus a hash of the messages it produces."""
+    messages = PROMPTS[name](_PROBE_ROW)
+    digest = hashlib.sha1(json.dumps(messages, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:8]
+    return f"{name}@{digest}"
+
+
+class PredictionStore:
+    def __init__(self, path: str):
+        """
+        JSONL store (see journal.RowJournal) of one prediction per (prompt version, model, row).
+        Each entry holds the parsed labels, latency, token usage and any error.
+        """
+        self.journal = RowJournal(path)
+        self.entries = self.journal.load()
+
+    @staticmethod
+    def key(version: str, model: str, row: str) -> str:
+        return f"{version}|{model}|{row}"
+
+    def get(self, version: str, model: str, row: str):
+        return self.entries.get(self.key(version, model, row))
+
+    def record(self, version: str, model: str, row: str, entry: dict):
+        key = self.key(version, model, row)
+        self.entries[key] = entry
+        self.journal.record(key, entry)
+
+    def close(self):
+        self.journal.close()
+
+
+async def predict_rows(df: pd.DataFrame, indices: list, version: str, prompt_name: str, client,
+                       store: PredictionStore, row_keys: list, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        messages = PROMPTS[prompt_name](df.loc[i])
+        async with semaphore:
+            usage = {}
+            start = time.perf_counter()
+            raw = await client.call_LLM(messages, usage=usage)
+            latency = time.perf_counter() - start
+        try:
+            parsed = validation.extract_json(raw) if raw is not None else {}
+            error = None if raw is not None else "LLM call failed"
+        except Exception as e:
+            parsed, error = {}, f"{type(e).__name__}: {e}"
+        store.record(version, client.model, row_keys[i], {
+            "labels": {t: parsed.get(t) for t in TARGETS}, "latency": latency, "error": error, **usage,
+        })
+
+    await asyncio.gather(*(one(i) for i in indices))
+
+
+def _f1_macro(correct_by_class: np.ndarray, true_counts: np.ndarray, pred_counts: np.ndarray) -> np.ndarray:
+    # zero_division=0, like sklearn.metrics.f1_score(average="macro")
+    denom = true_counts + pred_counts
+    f1 = np.divide(2 * correct_by_class, denom, out=np.zeros_like(denom, dtype=float), where=denom > 0)
+    return f1.mean(axis=-1)
+
+
+def score(y_true: list, y_pred: list, n_boot: int = 1000, seed: int = 0) -> dict:
+    """
+    Accuracy and macro-F1 over LABELS, each with a 95% percentile bootstrap confidence interval.
+    All resamples are scored at once from per-row one-hot matrices.
+    """
+    codes = {label: k for k, label in enumerate(LABELS)}
+    t = np.array([codes.get(v, -1) for v in y_true])
+    p = np.array([codes.get(v, -1) for v in y_pred])
+    n = len(t)
+    if n == 0:
+        return {"n": 0}
+    true_hot = (t[:, None] == np.arange(len(LABELS))).astype(float)
+    pred_hot = (p[:, None] == np.arange(len(LABELS))).astype(float)
+    correct = (t == p).astype(float)
+
+    def stats(weights):
+        # weights: (..., n) row multiplicities of each (re)sample
+        acc = weights @ correct / n
+        f1 = _f1_macro(weights @ (true_hot * pred_hot), weights @ true_hot, weights @ pred_hot)
+        return acc, f1
+
+    acc, f1 = stats(np.ones(n))
+    rng = np.random.default_rng(seed)
+    weights = np.stack([np.bincount(rng.integers(0, n, n), minlength=n) for _ in range(n_boot)]).astype(float)
+    boot_acc, boot_f1 = stats(weights)
+    return {
+        "n": n,
+        "accuracy": float(acc), "accuracy_ci": [float(x) for x in np.percentile(boot_acc, [2.5, 97.5])],
+        "macro_f1": float(f1), "macro_f1_ci": [float(x) for x in np.percentile(boot_f1, [2.5, 97.5])],
+    }
+
+
+def summarize(df: pd.DataFrame, version: str, model: str, store: PredictionStore, row_keys: list,
+              prices: dict, n_boot: int) -> dict:
+    entries = [store.get(version, model, k) for k in row_keys]
+    rows = [i for i, e in enumerate(entries) if e is not None]
+    called = [entries[i] for i in rows if not entries[i].get("cached")]
+    latencies = [e["latency"] for e in called]
+    prompt_tokens = sum(e.get("prompt_tokens") or 0 for e in called)
+    completion_tokens = sum(e.get("completion_tokens") or 0 for e in called)
+    price_in, price_out = prices.get(model, (float("nan"), float("nan")))
+
+    summary = {
+        "prompt_version": version, "model": model, "rows": len(rows),
+        "errors": sum(1 for i in rows if entries[i].get("error")),
+        "latency_p50": float(np.percentile(latencies, 50)) if latencies else None,
+        "latency_p90": float(np.percentile(latencies, 90)) if latencies else None,
+        "latency_p99": float(np.percentile(latencies, 99)) if latencies else None,
+        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+        "cost_usd": (prompt_tokens * price_in + completion_tokens * price_out) / 1e6,
+    }
+    for target in TARGETS:
+        y_true = [validation.normalize_label(df.iloc[i][target]) for i in rows]
+        y_pred = [validation.normalize_label(entries[i]["labels"].get(target)) for i in rows]
+        summary[target] = score(y_true, y_pred, n_boot)
+    return summary
+
+
+def _fmt_metric(m: dict, name: str) -> str:
+    if not m.get("n"):
+        return "-"
+    lo, hi = m[f"{name}_ci"]
+    return f"{m[name]:.3f} [{lo:.3f}, {hi:.3f}]"
+
+
+def print_table(summaries: list):
+    print(f"\n{'config':<34}{'rows':>6}{'err':>5}{'p50 s':>7}{'p90 s':>7}{'p99 s':>7}"
+          f"{'tokens':>10}{'cost $':>9}  " + "  ".join(f"{t + ' acc / macro-F1 (95% CI)':<58}" for t in TARGETS))
+    for s in summaries:
+        lat = [f"{s[k]:.2f}" if s[k] is not None else "-" for k in ("latency_p50", "latency_p90", "latency_p99")]
+        metrics = "  ".join(
+            f"{_fmt_metric(s[t], 'accuracy') + ' / ' + _fmt_metric(s[t], 'macro_f1'):<58}" for t in TARGETS)
+        print(f"{s['prompt_version'] + ' ' + s['model']:<34}{s['rows']:>6}{s['errors']:>5}"
+              f"{lat[0]:>7}{lat[1]:>7}{lat[2]:>7}{s['prompt_tokens'] + s['completion_tokens']:>10}"
+              f"{s['cost_usd']:>9.3f}  {metrics}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt/model configurations against human labels")
+    parser.add_argument("--input", default="../cleaned_data/cleaned_reviews.parquet",
+                        help="human-labelled reviews (parquet, csv or xlsx)")
+    parser.add_argument("--configs", nargs="+", default=["structuring:gpt-4o"],
+                        help=f"prompt:model pairs; prompts: {sorted(PROMPTS)}")
+    parser.add_argument("-n", "--num-rows", type=int, default=1002)
+    parser.add_argument("--store", default="outputs/validation_predictions.jsonl",
+                        help="prediction store shared by every run")
+    parser.add_argument("--offline", action="store_true", help="only recompute metrics from stored predictions")
+    parser.add_argument("--retry-errors", action="store_true", help="query again rows whose stored call failed")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible endpoint, e.g. a local fake server")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--rpm", type=float, default=None)
+    parser.add_argument("--tpm", type=float, default=None)
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--bootstrap", type=int, default=1000, help="bootstrap resamples for the confidence intervals")
+    parser.add_argument("--price", action="append", default=[], metavar="MODEL=IN,OUT",
+                        help="USD per 1M prompt/completion tokens, e.g. gpt-4o=2.5,10")
+    args = parser.parse_args()
+
+    prices = dict(PRICES)
+    for spec in args.price:
+        model, values = spec.split("=")
+        prices[model] = tuple(float(v) for v in values.split(","))
+
+    df = storage.read_table(args.input)
+    missing = {"text", *TARGETS} - set(df.columns)
+    if missing:
+        raise ValueError(f"Input must contain columns: {missing}")
+    df = df.iloc[:args.num_rows].reset_index(drop=True)
+    # labelled sets without business ids are keyed on the review text alone
+    gmap_ids = df["gmap_id"] if "gmap_id" in df.columns else [None] * len(df)
+    row_keys = [row_key(g, t) for g, t in zip(gmap_ids, df["text"])]
+
+    if os.path.dirname(args.store):
+        os.makedirs(os.path.dirname(args.store), exist_ok=True)
+    store = PredictionStore(args.store)
+    configs = [tuple(c.split(":", 1)) for c in args.configs]
+
+    summaries = []
+    for prompt_name, model in configs:
+        version = prompt_version(prompt_name)
+        if not args.offline:
+            todo = [i for i in df.index
+                    if (e := store.get(version, model, row_keys[i])) is None or (args.retry_errors and e.get("error"))]
+            print(f"[harness] {version} {model}: {len(df) - len(todo)} rows stored, {len(todo)} to query")
+            if todo:
+                client = AsyncLLMClient(model=model, base_url=args.base_url, timeout=args.timeout,
+                                        cache=ResponseCache(args.cache_path, bypass=args.no_cache),
+                                        rate_limiter=RateLimiter(args.rpm, args.tpm),
+                                        max_concurrency=args.concurrency)
+                start = time.perf_counter()
+                moderation_engine.run_with_client(client, lambda: predict_rows(
+                    df, todo, version, prompt_name, client, store, row_keys, args.concurrency))
+                print(f"[harness] {len(todo)} rows in {time.perf_counter() - start:.1f}s")
+        summaries.append(summarize(df, version, model, store, row_keys, prices, args.bootstrap))
+    store.close()
+
+    print_table(summaries)
+    report_path = os.path.join(os.path.dirname(args.store) or ".", "validation_report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(summaries, f, indent=2)
+    print(f"\n[ok] wrote {report_path}")
+
+
+if __name__ == "__main__":
+    main()